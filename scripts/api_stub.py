@@ -0,0 +1,585 @@
+#!/usr/bin/env python3
+"""
+api_stub.py — Local stand-in for the Anthropic, Gmail and Calendar APIs.
+
+Lets ingest → scan → draft → send run end-to-end with no API key, no Google
+account and no network, and makes it benchmarkable. Point the app at it:
+
+  ANTHROPIC_BASE_URL=http://127.0.0.1:8787   (the SDK picks it up)
+  GOOGLE_API_BASE_URL=http://127.0.0.1:8787  (src/google_client.py)
+
+Anthropic:
+  POST /v1/messages                      canned reply shaped per ai.py prompt
+                                         (JSON for detectors, REVIEW/DRAFT for
+                                         triage), or the recorded response for
+                                         the same system+prompt with --anthropic-corpus
+                                         (an LLM_RECORD_PATH file); "stream": true → SSE
+  POST /v1/messages/batches              accepts a batch; ends after --batch-delay s
+  GET  /v1/messages/batches/{id}[/results]
+
+Gmail (/gmail/v1/users/me/...): profile, messages list/get/modify/send,
+threads get, drafts create/update/send. The mailbox comes from
+--gmail-fixture (JSON, see scripts/bench_pipeline.py --record-gmail) or is
+generated from --seed: --threads lead threads, some with an agent proposal
+and a client reply. After the app sends into a thread the client answers
+(--reply-rate) so the next poll + scan has confirmations to find.
+
+Calendar (/calendar/v3/...): events insert/list, freeBusy.
+
+GET /_stub/stats — request / injected-error counts per API.
+
+Injection is per API: --latency anthropic=800,gmail=60 (ms, ±20% jitter)
+and --error-rate 0.05 or anthropic=0.2,gmail=0.01 (429/5xx in each API's
+error format). Every random choice — mailbox, replies, jitter, errors — is
+drawn from --seed and the request itself, not call order, so a run with the
+same flags behaves the same way every time.
+
+Run:
+  python scripts/api_stub.py --port 8787 --batch-delay 5 [--error-rate 0.2]
+  python scripts/api_stub.py --threads 200 --seed 7 --latency anthropic=900,gmail=80
+"""
+
+import argparse
+import base64
+import datetime
+import email
+import email.policy
+import email.utils
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+STATE = {"batches": {}, "prefixes": set(), "batch_delay": 5.0, "token_delay": 0.02, "base_url": "",
+         "seed": 0, "latency": {}, "error_rate": {}, "corpus": {}, "reply_rate": 0.5,
+         "agent_email": "agent@lucilease.test", "threads": {}, "messages": {}, "drafts": {},
+         "events": [], "seen": Counter(), "stats": Counter()}
+LOCK  = threading.RLock()
+
+APIS = ("anthropic", "gmail", "calendar")
+EPOCH = datetime.datetime(2026, 3, 2, 9, 0, tzinfo=datetime.timezone.utc)   # a Monday
+
+
+def _iso(ts: float) -> str:
+    return datetime.datetime.utcfromtimestamp(ts).isoformat() + "Z"
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+def _rng(*key) -> random.Random:
+    """Deterministic per (seed, key, n-th occurrence of key) — independent of call order."""
+    name = "|".join(str(k) for k in key)
+    with LOCK:
+        n = STATE["seen"][name]
+        STATE["seen"][name] += 1
+    return random.Random(f"{STATE['seed']}|{name}|{n}")
+
+
+def _parse_spec(spec: str, cast=float) -> dict:
+    """"0.1" → every API; "anthropic=0.2,gmail=0.01" → per API."""
+    if not spec:
+        return {}
+    if "=" not in spec:
+        return {api: cast(spec) for api in APIS}
+    out = {}
+    for part in spec.split(","):
+        api, _, value = part.partition("=")
+        out[api.strip()] = cast(value)
+    return out
+
+
+# ── Anthropic ─────────────────────────────────────────────────────────────────
+
+def _system_text(params: dict) -> str:
+    system = params.get("system") or ""
+    if isinstance(system, list):
+        return "\n".join(b.get("text", "") for b in system)
+    return system
+
+
+def _prompt_text(params: dict) -> str:
+    prompt = params["messages"][-1]["content"]
+    if isinstance(prompt, list):
+        prompt = " ".join(b.get("text", "") for b in prompt)
+    return prompt
+
+
+def _corpus_key(system: str, prompt: str) -> str:
+    return hashlib.sha1(f"{system}\x00{prompt}".encode()).hexdigest()
+
+
+def load_corpus(path: str) -> int:
+    """Index an LLM_RECORD_PATH corpus by system + prompt."""
+    for line in open(path, encoding="utf-8"):
+        if line.strip():
+            rec = json.loads(line)
+            STATE["corpus"][_corpus_key("\n".join(rec.get("system") or []), rec["prompt"])] = rec["response"]
+    return len(STATE["corpus"])
+
+
+# Crude stand-in for the tone judgement, shared by the tone check and triage
+# so both paths flag the same threads
+HOSTILE_WORDS = ("unacceptable", "furious", "ridiculous", "stop emailing", "worst")
+AGREE_WORDS   = ("works", "sounds good", "see you")
+
+
+def _tone_flag(prompt: str):
+    return "angry" if any(w in prompt.lower() for w in HOSTILE_WORDS) else None
+
+
+def _first_hint(prompt: str):
+    """First resolved datetime from ai.py's LOCAL DATE HINTS block."""
+    block = prompt.split("LOCAL DATE HINTS:", 1)[1] if "LOCAL DATE HINTS:" in prompt else ""
+    for line in block.splitlines():
+        if " = " in line:
+            return line.rsplit(" = ", 1)[1].split()[0]
+    return None
+
+
+def _classified(prompt: str) -> dict:
+    hint = _first_hint(prompt)
+    if hint and any(w in prompt.lower() for w in AGREE_WORDS):
+        return {"verdict": "confirmation", "inquiry": None, "appointments": [{
+            "confirmed": True, "meeting_type": "showing", "proposed_datetime": hint,
+            "proposed_date_text": hint, "context_snippet": "Client agreed to a time.",
+            "confidence": "high"}]}
+    return {"verdict": "nothing", "appointments": [], "inquiry": None}
+
+
+def _reply_text(params: dict) -> str:
+    """Shape the reply like the real model would for each ai.py prompt."""
+    system = _system_text(params)
+    prompt = _prompt_text(params)
+    recorded = STATE["corpus"].get(_corpus_key(system, prompt))
+    if recorded is not None:
+        return recorded
+    probe = system + prompt
+    first_line = next((l for l in prompt.splitlines() if l.strip()), "")[:60]
+    if "REVIEW: <angry" in system:
+        flag = _tone_flag(prompt)
+        if flag:
+            return f"REVIEW: {flag} | The client sounds upset."
+        return f"DRAFT\nThanks for reaching out! (stub reply to: {first_line})"
+    if '"flag"' in probe:
+        flag = _tone_flag(prompt)
+        return json.dumps({"flag": flag, "reason": "The client sounds upset." if flag else None})
+    if '"verdict"' in probe:
+        if "=== THREAD " in prompt:
+            # ai.classify_threads: one answer per packed thread, keyed by thread id
+            sections = re.findall(r"^=== THREAD (\S+) ===\n(.*?)(?=^=== THREAD |\Z)", prompt, re.M | re.S)
+            return json.dumps({tid: _classified(text) for tid, text in sections})
+        return json.dumps(_classified(prompt))
+    if '"confirmed"' in probe:
+        return "[]"
+    if '"is_inquiry"' in probe:
+        return '{"is_inquiry": false}'
+    return f"Thanks for reaching out! (stub reply to: {first_line})"
+
+
+def _message(params: dict) -> dict:
+    text   = _reply_text(params)
+    system = _system_text(params)
+    usage  = {"input_tokens": _tokens(json.dumps(params["messages"])), "output_tokens": _tokens(text),
+              "cache_creation_input_tokens": 0, "cache_read_input_tokens": 0}
+    if system:
+        key = hashlib.sha1(system.encode()).hexdigest()
+        with LOCK:
+            seen = key in STATE["prefixes"]
+            STATE["prefixes"].add(key)
+        usage["cache_read_input_tokens" if seen else "cache_creation_input_tokens"] = _tokens(system)
+    return {
+        "id": f"msg_stub_{uuid.uuid4().hex[:16]}", "type": "message", "role": "assistant",
+        "model": params.get("model", "stub"), "content": [{"type": "text", "text": text}],
+        "stop_reason": "end_turn", "stop_sequence": None, "usage": usage,
+    }
+
+
+def _batch_view(batch: dict) -> dict:
+    ended = time.time() >= batch["ends_at"]
+    n = len(batch["requests"])
+    return {
+        "id": batch["id"], "type": "message_batch",
+        "processing_status": "ended" if ended else "in_progress",
+        "request_counts": {"processing": 0 if ended else n, "succeeded": n if ended else 0,
+                           "errored": 0, "canceled": 0, "expired": 0},
+        "created_at": _iso(batch["created_at"]), "expires_at": _iso(batch["created_at"] + 86400),
+        "ended_at": _iso(batch["ends_at"]) if ended else None,
+        "archived_at": None, "cancel_initiated_at": None,
+        "results_url": f"{STATE['base_url']}/v1/messages/batches/{batch['id']}/results" if ended else None,
+    }
+
+
+# ── Gmail mailbox ─────────────────────────────────────────────────────────────
+
+FIRST = ["Maya", "Jordan", "Priya", "Sam", "Elena", "Marcus", "Aiko", "Luis", "Hannah", "Omar"]
+LAST  = ["Chen", "Rivera", "Patel", "Okafor", "Novak", "Kim", "Silva", "Haddad", "Berg", "Moreau"]
+HOODS = ["Mission", "Noe Valley", "SoMa", "Sunset", "Marina", "Bernal Heights"]
+
+LEAD_BODIES = [
+    "Hi, I'm looking for a {beds} bedroom in {hood} for around ${budget}/month, moving in {move}. "
+    "Is the place on your listing still available?",
+    "Hello! My partner and I need a {beds}BR near {hood}. Budget is ${budget}/month and we have a small dog. "
+    "Could we set up a showing?",
+    "Interested in renting in {hood}. {beds} bedrooms, up to ${budget}/month, flexible move-in date.",
+    "This is ridiculous, I've emailed three times about the {hood} unit and nobody answered. Is it available or not?",
+]
+CLIENT_REPLIES = [
+    "Saturday at 2pm works for us, see you then!",
+    "Sounds good, see you Saturday!",
+    "Thanks! Could we do Sunday at 11am instead? Saturday is tricky.",
+    "When are you free to show it this week?",
+]
+
+
+def _add_message(thread_id: str, sender: str, to: str, subject: str, body: str, labels: list,
+                 date: datetime.datetime, arrived: float = None) -> dict:
+    mid = hashlib.sha1(f"{thread_id}|{len(STATE['threads'].get(thread_id, {}).get('messages', []))}|{body}"
+                       .encode()).hexdigest()[:16]
+    msg = {"id": mid, "threadId": thread_id, "labelIds": labels, "from": sender, "to": to,
+           "subject": subject, "date": email.utils.format_datetime(date), "body": body,
+           "arrived": arrived if arrived is not None else time.time(), "seq": len(STATE["messages"]),
+           "message_id": f"<{mid}@stub.lucilease.test>"}
+    STATE["threads"].setdefault(thread_id, {"id": thread_id, "messages": []})["messages"].append(msg)
+    STATE["messages"][mid] = msg
+    return msg
+
+
+def synthesize_mailbox(n_threads: int):
+    """n_threads lead threads from --seed; ~1 in 4 already has a proposal + client reply."""
+    agent = STATE["agent_email"]
+    rng = random.Random(f"{STATE['seed']}|mailbox")
+    for i in range(n_threads):
+        name   = f"{rng.choice(FIRST)} {rng.choice(LAST)}"
+        addr   = f"{name.lower().replace(' ', '.')}.{i}@example.com"
+        client = f"{name} <{addr}>"
+        hood   = rng.choice(HOODS)
+        body   = rng.choice(LEAD_BODIES).format(beds=rng.randint(1, 3), hood=hood,
+                                                budget=rng.randrange(2400, 5200, 100),
+                                                move=rng.choice(["March 15", "April 1", "next month"]))
+        subject = f"Rental inquiry — {hood}"
+        tid  = "t" + hashlib.sha1(f"{STATE['seed']}|{i}".encode()).hexdigest()[:14]
+        when = EPOCH + datetime.timedelta(minutes=37 * i)
+        _add_message(tid, client, agent, subject, body, ["INBOX", "UNREAD"], when, arrived=0)
+        if rng.random() < 0.25:
+            _add_message(tid, f"Agent <{agent}>", addr, f"Re: {subject}",
+                         "Happy to show it! I can do Saturday at 2pm or Sunday at 11am.", ["SENT"],
+                         when + datetime.timedelta(hours=2), arrived=0)
+            _add_message(tid, client, agent, f"Re: {subject}", rng.choice(CLIENT_REPLIES), ["INBOX", "UNREAD"],
+                         when + datetime.timedelta(hours=5), arrived=0)
+
+
+def load_mailbox(path: str):
+    """{"agent_email": ..., "threads": [{"id", "messages": [{"id", "from", "to", "subject",
+    "date", "body", "labels"}]}]} — the format bench_pipeline.py --record-gmail writes."""
+    data = json.load(open(path, encoding="utf-8"))
+    STATE["agent_email"] = data.get("agent_email") or STATE["agent_email"]
+    for t in data["threads"]:
+        for m in t["messages"]:
+            date = email.utils.parsedate_to_datetime(m["date"]) if m.get("date") else EPOCH
+            msg = _add_message(t["id"], m["from"], m.get("to", ""), m.get("subject", ""), m.get("body", ""),
+                               m.get("labels") or ["INBOX"], date, arrived=0)
+            if m.get("id"):
+                STATE["messages"].pop(msg["id"])
+                msg["id"] = m["id"]
+                STATE["messages"][m["id"]] = msg
+
+
+def _resource(msg: dict, fmt: str = "full") -> dict:
+    headers = [{"name": "From", "value": msg["from"]}, {"name": "To", "value": msg["to"]},
+               {"name": "Subject", "value": msg["subject"]}, {"name": "Date", "value": msg["date"]},
+               {"name": "Message-ID", "value": msg["message_id"]}]
+    payload = {"mimeType": "text/plain", "headers": headers, "body": {"size": len(msg["body"])}}
+    if fmt != "metadata":
+        payload["body"]["data"] = base64.urlsafe_b64encode(msg["body"].encode()).decode()
+    return {"id": msg["id"], "threadId": msg["threadId"], "labelIds": msg["labelIds"],
+            "snippet": msg["body"][:100], "internalDate": str(int(msg["arrived"] * 1000)), "payload": payload}
+
+
+def _query_filter(q: str):
+    """The parts of Gmail search the app uses: in:inbox / in:sent, label:X, after:<epoch>."""
+    labels, after = [], None
+    for term in (q or "").split():
+        key, _, value = term.partition(":")
+        if key == "in":
+            labels.append(value.upper())
+        elif key == "label":
+            labels.append(value)
+        elif key == "after" and value.isdigit():
+            after = int(value)
+    return lambda m: all(l in m["labelIds"] for l in labels) and (after is None or m["arrived"] > after)
+
+
+def _client_reply(thread_id: str, sent: dict):
+    """The client answers mail the app sent — deterministically per thread."""
+    rng = _rng("reply", thread_id)
+    if rng.random() >= STATE["reply_rate"]:
+        return
+    sent_at = email.utils.parsedate_to_datetime(sent["date"])
+    _add_message(thread_id, sent["to"], STATE["agent_email"], f"Re: {sent['subject'].removeprefix('Re: ')}",
+                 rng.choice(CLIENT_REPLIES), ["INBOX", "UNREAD"], sent_at + datetime.timedelta(hours=1))
+
+
+def _send_raw(raw: str, thread_id: str = None) -> dict:
+    parsed = email.message_from_bytes(base64.urlsafe_b64decode(raw + "=="), policy=email.policy.default)
+    body = parsed.get_body(preferencelist=("plain",))
+    text = body.get_content() if body else ""
+    thread_id = thread_id or f"t{hashlib.sha1(raw.encode()).hexdigest()[:14]}"
+    thread = STATE["threads"].get(thread_id, {}).get("messages", [])
+    last = thread[-1]["date"] if thread else None
+    date = (email.utils.parsedate_to_datetime(last) + datetime.timedelta(hours=1)) if last else EPOCH
+    msg = _add_message(thread_id, f"Agent <{STATE['agent_email']}>", str(parsed.get("To", "")),
+                       str(parsed.get("Subject", "")), text, ["SENT"], date)
+    _client_reply(thread_id, msg)
+    return msg
+
+
+def _gmail(method: str, parts: list, query: dict, body: dict):
+    """parts: path after /gmail/v1/users/me. Returns (status, json)."""
+    with LOCK:
+        if parts == ["profile"]:
+            return 200, {"emailAddress": STATE["agent_email"], "messagesTotal": len(STATE["messages"])}
+        if parts == ["messages"] and method == "GET":
+            keep = _query_filter(query.get("q", [""])[0])
+            limit = int(query.get("maxResults", ["100"])[0])
+            found = sorted((m for m in STATE["messages"].values() if keep(m)),
+                           key=lambda m: (m["arrived"], m["seq"]), reverse=True)[:limit]
+            return 200, {"messages": [{"id": m["id"], "threadId": m["threadId"]} for m in found],
+                         "resultSizeEstimate": len(found)}
+        if parts == ["messages", "send"]:
+            msg = _send_raw(body["raw"], body.get("threadId"))
+            return 200, {"id": msg["id"], "threadId": msg["threadId"], "labelIds": msg["labelIds"]}
+        if len(parts) >= 2 and parts[0] == "messages":
+            msg = STATE["messages"].get(parts[1])
+            if not msg:
+                return 404, None
+            if len(parts) == 3 and parts[2] == "modify":
+                msg["labelIds"] = [l for l in msg["labelIds"] if l not in body.get("removeLabelIds", [])]
+                msg["labelIds"] += [l for l in body.get("addLabelIds", []) if l not in msg["labelIds"]]
+            return 200, _resource(msg, query.get("format", ["full"])[0])
+        if len(parts) == 2 and parts[0] == "threads":
+            thread = STATE["threads"].get(parts[1])
+            if not thread:
+                return 404, None
+            fmt = query.get("format", ["full"])[0]
+            return 200, {"id": thread["id"], "messages": [_resource(m, fmt) for m in thread["messages"]]}
+        if parts == ["drafts", "send"]:
+            draft = STATE["drafts"].pop(body.get("id"), None)
+            if not draft:
+                return 404, None
+            msg = _send_raw(draft["message"]["raw"], draft["message"].get("threadId"))
+            return 200, {"id": msg["id"], "threadId": msg["threadId"], "labelIds": msg["labelIds"]}
+        if parts[:1] == ["drafts"] and method in ("POST", "PUT"):
+            draft_id = parts[1] if len(parts) > 1 else f"r{hashlib.sha1(json.dumps(body).encode()).hexdigest()[:15]}"
+            STATE["drafts"][draft_id] = {"id": draft_id, "message": body.get("message", {})}
+            return 200, {"id": draft_id, "message": {"id": draft_id, "threadId": body.get("message", {}).get("threadId")}}
+    return 404, None
+
+
+def _calendar(method: str, parts: list, query: dict, body: dict):
+    """parts: path after /calendar/v3."""
+    with LOCK:
+        if parts == ["calendars", "primary", "events"] and method == "POST":
+            event = {**body, "id": f"ev{hashlib.sha1(json.dumps(body, sort_keys=True).encode()).hexdigest()[:12]}"}
+            STATE["events"].append(event)
+            return 200, event
+        if parts == ["calendars", "primary", "events"]:
+            items = sorted(STATE["events"], key=lambda e: e["start"].get("dateTime", ""))
+            return 200, {"items": items[:int(query.get("maxResults", ["250"])[0])]}
+        if parts == ["freeBusy"]:
+            busy = [{"start": e["start"]["dateTime"], "end": e["end"]["dateTime"]} for e in STATE["events"]]
+            return 200, {"calendars": {"primary": {"busy": busy}}}
+    return 404, None
+
+
+# ── HTTP ──────────────────────────────────────────────────────────────────────
+
+_ERRORS = {
+    "anthropic": [(529, "overloaded_error"), (429, "rate_limit_error"), (500, "api_error")],
+    "gmail":     [(429, "RESOURCE_EXHAUSTED"), (500, "INTERNAL"), (503, "UNAVAILABLE")],
+}
+_ERRORS["calendar"] = _ERRORS["gmail"]
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def _send(self, status: int, body, content_type: str = "application/json"):
+        data = body if isinstance(body, bytes) else json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _stream(self, params: dict):
+        msg  = _message(params)
+        text = msg["content"][0]["text"]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        def emit(event: str, data: dict):
+            self.wfile.write(f"event: {event}\ndata: {json.dumps({'type': event, **data})}\n\n".encode())
+            self.wfile.flush()
+
+        emit("message_start", {"message": {**msg, "content": [], "stop_reason": None,
+                                           "usage": {**msg["usage"], "output_tokens": 1}}})
+        emit("content_block_start", {"index": 0, "content_block": {"type": "text", "text": ""}})
+        words = text.split(" ")
+        for i, word in enumerate(words):
+            time.sleep(STATE["token_delay"])
+            emit("content_block_delta", {"index": 0, "delta": {"type": "text_delta",
+                                                               "text": word if i == 0 else " " + word}})
+        emit("content_block_stop", {"index": 0})
+        emit("message_delta", {"delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                               "usage": {"output_tokens": msg["usage"]["output_tokens"]}})
+        emit("message_stop", {})
+
+    def _body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _inject(self, api: str, key: str) -> bool:
+        """Latency, then maybe an error in the API's own format. True if an error was sent."""
+        with LOCK:
+            STATE["stats"][f"{api} requests"] += 1
+        rng = _rng(api, key)
+        latency = STATE["latency"].get(api, 0)
+        if latency:
+            time.sleep(latency * rng.uniform(0.8, 1.2) / 1000)
+        if rng.random() >= STATE["error_rate"].get(api, 0):
+            return False
+        with LOCK:
+            STATE["stats"][f"{api} errors"] += 1
+        status, kind = rng.choice(_ERRORS[api])
+        if api == "anthropic":
+            self._send(status, {"type": "error", "error": {"type": kind, "message": "stub injected error"}})
+        else:
+            self._send(status, {"error": {"code": status, "message": "stub injected error", "status": kind}})
+        return True
+
+    def _route(self, method: str):
+        path, _, qs = self.path.partition("?")
+        parts = path.strip("/").split("/")
+        body  = self._body() if method in ("POST", "PUT") else {}
+        key   = f"{method} {path} {hashlib.sha1(json.dumps(body, sort_keys=True).encode()).hexdigest()}"
+
+        if parts == ["_stub", "stats"]:
+            with LOCK:
+                return self._send(200, dict(STATE["stats"]))
+        if parts[:4] == ["gmail", "v1", "users", "me"] or parts[:2] == ["calendar", "v3"]:
+            api = parts[0]
+            if self._inject(api, key):
+                return
+            handler = _gmail if api == "gmail" else _calendar
+            status, out = handler(method, parts[4:] if api == "gmail" else parts[2:], parse_qs(qs), body)
+            if out is None:
+                return self._send(404, {"error": {"code": 404, "message": path, "status": "NOT_FOUND"}})
+            return self._send(status, out)
+        if parts[:2] == ["v1", "messages"]:
+            return self._anthropic(method, parts, body, key)
+        self._send(404, {"type": "error", "error": {"type": "not_found_error", "message": path}})
+
+    def _anthropic(self, method: str, parts: list, body: dict, key: str):
+        if parts == ["v1", "messages"] and method == "POST":
+            if self._inject("anthropic", key):
+                return
+            if body.get("stream"):
+                return self._stream(body)
+            return self._send(200, _message(body))
+        if parts == ["v1", "messages", "batches"] and method == "POST":
+            batch = {"id": f"msgbatch_stub_{uuid.uuid4().hex[:12]}", "requests": body.get("requests", []),
+                     "created_at": time.time(), "ends_at": time.time() + STATE["batch_delay"]}
+            with LOCK:
+                STATE["batches"][batch["id"]] = batch
+            return self._send(200, _batch_view(batch))
+        if parts[:3] == ["v1", "messages", "batches"] and len(parts) >= 4 and method == "GET":
+            batch = STATE["batches"].get(parts[3])
+            if not batch:
+                return self._send(404, {"type": "error", "error": {"type": "not_found_error", "message": parts[3]}})
+            if len(parts) == 4:
+                return self._send(200, _batch_view(batch))
+            if parts[4] == "results":
+                lines = [json.dumps({"custom_id": r["custom_id"],
+                                     "result": {"type": "succeeded", "message": _message(r["params"])}})
+                         for r in batch["requests"]]
+                return self._send(200, "\n".join(lines).encode(), "application/binary")
+        self._send(404, {"type": "error", "error": {"type": "not_found_error", "message": "/".join(parts)}})
+
+    def do_GET(self):
+        self._route("GET")
+
+    def do_POST(self):
+        self._route("POST")
+
+    def do_PUT(self):
+        self._route("PUT")
+
+    def log_message(self, fmt, *args):
+        if STATE.get("verbose"):
+            print(f"[stub] {self.command} {self.path}")
+
+
+def add_arguments(ap: argparse.ArgumentParser):
+    ap.add_argument("--batch-delay", type=float, default=5.0, help="seconds until a batch ends")
+    ap.add_argument("--token-delay", type=float, default=0.02, help="seconds between streamed words")
+    ap.add_argument("--latency", default="", help="ms per request: 500 (all) or anthropic=800,gmail=60")
+    ap.add_argument("--error-rate", default="", help="0.1 (all) or anthropic=0.2,gmail=0.01 → 429/5xx")
+    ap.add_argument("--seed", type=int, default=0, help="drives the mailbox, replies, jitter and errors")
+    ap.add_argument("--threads", type=int, default=40, help="synthetic lead threads (no --gmail-fixture)")
+    ap.add_argument("--gmail-fixture", help="JSON mailbox to serve instead of a synthetic one")
+    ap.add_argument("--anthropic-corpus", help="LLM_RECORD_PATH JSONL: replay recorded responses")
+    ap.add_argument("--reply-rate", type=float, default=0.5, help="chance the client answers sent mail")
+
+
+def configure(args: argparse.Namespace):
+    """Reset all state from parsed add_arguments() flags."""
+    STATE.update({"batches": {}, "prefixes": set(), "threads": {}, "messages": {}, "drafts": {}, "events": [],
+                  "seen": Counter(), "stats": Counter(), "corpus": {},
+                  "seed": args.seed, "batch_delay": args.batch_delay, "token_delay": args.token_delay,
+                  "latency": _parse_spec(args.latency), "error_rate": _parse_spec(args.error_rate),
+                  "reply_rate": args.reply_rate})
+    if args.gmail_fixture:
+        load_mailbox(args.gmail_fixture)
+    else:
+        synthesize_mailbox(args.threads)
+    if args.anthropic_corpus:
+        print(f"[stub] Replaying {load_corpus(args.anthropic_corpus)} recorded Claude response(s)")
+
+
+def start(host: str = "127.0.0.1", port: int = 8787) -> ThreadingHTTPServer:
+    """Serve in a daemon thread (for in-process benchmarks). Call configure() first."""
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    STATE["base_url"] = f"http://{host}:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, name="api-stub", daemon=True).start()
+    return server
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8787)
+    ap.add_argument("--verbose", action="store_true", help="log every request")
+    add_arguments(ap)
+    args = ap.parse_args()
+    STATE["verbose"] = args.verbose
+    configure(args)
+    STATE["base_url"] = f"http://{args.host}:{args.port}"
+    print(f"[stub] API stub on {STATE['base_url']} — {len(STATE['threads'])} Gmail thread(s), "
+          f"batch delay {args.batch_delay}s")
+    ThreadingHTTPServer((args.host, args.port), Handler).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
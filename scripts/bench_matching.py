@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+bench_matching.py — Property matching and geo lookups: index lookups vs a full scan.
+
+Seeds a temp DB with --listings random properties (rental / sale, 0–5
+bedrooms, bathrooms, prices, spread-out created_at, points around Santa
+Barbara) and --leads random lead profiles, some asking to be near a
+gazetteer place. For each lead it runs matching.top_k and a brute-force
+scan of every active listing ranked with the same matching.rank(), then
+geo.within_radius against a haversine scan of every point. Reports p50 /
+p95 per lookup for each and fails if any result differs, plus the query
+plans so the indexes can be seen in use.
+
+Run:
+  python scripts/bench_matching.py
+  python scripts/bench_matching.py --listings 50000 --leads 500 --k 10 --seed 7
+"""
+
+import argparse
+import datetime
+import pathlib
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+LAT_RANGE = (34.39, 34.46)       # Carpinteria → Goleta, coast → foothills
+LON_RANGE = (-119.88, -119.51)
+
+SCRIPTS = pathlib.Path(__file__).resolve().parent
+sys.path.insert(0, "/app")  # Docker: app code lives at /app
+sys.path.insert(0, str(SCRIPTS.parent / "src"))
+
+
+def seed(conn, n: int, rng: random.Random):
+    start = datetime.datetime(2024, 1, 1)
+    rows = []
+    for i in range(n):
+        ptype = "rental" if rng.random() < 0.7 else "sale"
+        beds  = rng.randint(0, 5)
+        rows.append((
+            f"{rng.randint(1, 9999)} Test St #{i}", ptype, beds,
+            rng.choice([None, 1, 1.5, 2, 2.5, 3]) if beds else 1,
+            rng.randrange(1200, 9000, 25) if ptype == "rental" else None,
+            rng.randrange(300_000, 3_000_000, 1000) if ptype == "sale" else None,
+            "active" if rng.random() < 0.85 else rng.choice(["pending", "off_market"]),
+            (start + datetime.timedelta(minutes=rng.randint(0, 60 * 24 * 600))).isoformat() + "Z",
+            *((None, None) if rng.random() < 0.05 else (rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE))),
+        ))
+    # geo_address = address: already "geocoded", so init_db leaves the random points alone
+    conn.executemany("""
+        INSERT INTO properties (address, type, bedrooms, bathrooms, price_monthly, price_sale, status, created_at,
+                                lat, lon, geo_address)
+        VALUES (?,?,?,?,?,?,?,?,?,?,?1)
+    """, rows)
+    conn.commit()
+
+
+def random_lead(rng: random.Random) -> dict:
+    return {
+        "neighborhood":       rng.choice([None, None, "downtown", "the mesa", "goleta", "near the harbor", "narnia"]),
+        "bedrooms":           rng.choice([None, 0, 1, 2, 2, 3, 3, 4, 5]),
+        "bathrooms":          rng.choice([None, None, 1, 1.5, 2]),
+        "budget_monthly_usd": rng.choice([None, rng.randrange(1500, 8000, 50)]),
+        "property_type":      rng.choice([None, None, "rental", "sale"]),
+    }
+
+
+def full_scan(conn, lead: dict, k: int) -> list[dict]:
+    """What top_k must return, by reading and filtering every active listing in Python."""
+    import geo
+    import matching
+    budget, bedrooms, baths = lead["budget_monthly_usd"], lead["bedrooms"], lead["bathrooms"]
+    ptype = matching.lead_type(lead)
+    box   = geo.area(lead["neighborhood"] or "")
+    candidates = []
+    for r in conn.execute("SELECT * FROM properties WHERE status='active'"):
+        p = dict(r)
+        if ptype and p["type"] != ptype:
+            continue
+        if baths and p["bathrooms"] is not None and p["bathrooms"] < baths:
+            continue
+        step = 0 if bedrooms is None else (p["bedrooms"] or 0) - bedrooms
+        if step not in matching.BEDROOM_STEPS:
+            continue
+        type_budget = budget if p["type"] == "rental" else None
+        price = p["price_monthly"] or p["price_sale"]
+        if type_budget and (price is None or price > type_budget * (1 + matching.MAX_OVER_BUDGET)):
+            continue
+        near = bool(box and p["lat"] is not None and box[0] <= p["lat"] <= box[2] and box[1] <= p["lon"] <= box[3])
+        candidates.append((step, type_budget, p, near))
+    return [c[2] for c in matching.rank(candidates)[:k]]
+
+
+def radius_scan(conn, lat: float, lon: float, km: float) -> list[int]:
+    import geo
+    hits = [(r["id"], geo.distance_km(lat, lon, r["lat"], r["lon"]))
+            for r in conn.execute("SELECT id, lat, lon FROM properties WHERE lat IS NOT NULL")]
+    return [i for i, d in sorted((h for h in hits if h[1] <= km), key=lambda h: (h[1], h[0]))]
+
+
+def pct(values: list[float], q: float) -> float:
+    return sorted(values)[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--listings", type=int, default=10_000)
+    ap.add_argument("--leads", type=int, default=200)
+    ap.add_argument("--k", type=int, default=5)
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    import db
+    db.DB_PATH = pathlib.Path(tempfile.mkdtemp(prefix="bench_matching_")) / "bench.db"
+    db.init_db()
+    import geo
+    import matching
+
+    rng  = random.Random(args.seed)
+    conn = db.get_conn()
+    seed(conn, args.listings, rng)
+    leads = [random_lead(rng) for _ in range(args.leads)]
+    print(f"{args.listings} listings, {args.leads} leads, k={args.k}\n")
+
+    indexed, scanned, mismatches = [], [], 0
+    for lead in leads:
+        t0 = time.perf_counter()
+        got = matching.top_k(conn, lead, args.k)
+        t1 = time.perf_counter()
+        want = full_scan(conn, lead, args.k)
+        t2 = time.perf_counter()
+        indexed.append((t1 - t0) * 1000)
+        scanned.append((t2 - t1) * 1000)
+        if [p["id"] for p in got] != [p["id"] for p in want]:
+            mismatches += 1
+            if mismatches <= 3:
+                print(f"  MISMATCH {lead}: top_k {[p['id'] for p in got]} vs scan {[p['id'] for p in want]}")
+
+    print(f"  {'':<10} {'p50 ms':>8} {'p95 ms':>8}")
+    print(f"  {'top_k':<10} {statistics.median(indexed):>8.2f} {pct(indexed, 0.95):>8.2f}")
+    print(f"  {'full scan':<10} {statistics.median(scanned):>8.2f} {pct(scanned, 0.95):>8.2f}")
+
+    rtree, haversine = [], []
+    for _ in range(args.leads):
+        lat, lon, km = rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE), rng.choice([0.5, 1, 2, 5])
+        t0 = time.perf_counter()
+        got = [i for i, _ in geo.within_radius(conn, lat, lon, km)]
+        t1 = time.perf_counter()
+        want = radius_scan(conn, lat, lon, km)
+        t2 = time.perf_counter()
+        rtree.append((t1 - t0) * 1000)
+        haversine.append((t2 - t1) * 1000)
+        if got != want:
+            mismatches += 1
+            print(f"  MISMATCH radius {km} km at {lat:.4f},{lon:.4f}: {len(got)} vs {len(want)} hits")
+    print(f"  {'radius':<10} {statistics.median(rtree):>8.2f} {pct(rtree, 0.95):>8.2f}")
+    print(f"  {'full scan':<10} {statistics.median(haversine):>8.2f} {pct(haversine, 0.95):>8.2f}")
+
+    print("\nQuery plans:")
+    for sql, params in [
+        (f"SELECT * FROM properties WHERE status='active' AND type=? AND bedrooms=? AND {matching.PRICE} >= ? "
+         f"AND {matching.PRICE} <= ? ORDER BY {matching.PRICE} ASC, created_at DESC, id DESC LIMIT ?",
+         ["rental", 2, 3000, 3450, args.k]),
+        ("SELECT * FROM properties WHERE status='active' AND type=? ORDER BY created_at DESC, id DESC LIMIT ?",
+         ["sale", args.k]),
+        (f"SELECT id, lat, lon FROM properties WHERE id IN ({geo.IN_BOX_SQL})",
+         geo.box_params(geo.box_around(34.42, -119.70, 1))),
+    ]:
+        for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+            print(f"  {row['detail']}")
+    conn.close()
+
+    if mismatches:
+        print(f"\nFAILED: {mismatches}/{2 * args.leads} lookups differ from the full scan")
+        sys.exit(1)
+    print(f"\nAll {2 * args.leads} lookups match the full scan.")
+
+
+if __name__ == "__main__":
+    main()
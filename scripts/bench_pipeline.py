@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+bench_pipeline.py — Offline end-to-end benchmark of the mail pipeline.
+
+Starts scripts/api_stub.py in-process, points the app at it
+(ANTHROPIC_BASE_URL, GOOGLE_API_BASE_URL) and runs against a fresh temp DB,
+timing each stage the way the app runs it:
+
+  ingest   gmail.poll_inbox over the stub mailbox
+  scan     main._scan_confirmations (inbox leads + sent mail), batched like the
+           background poll; --per-thread-scan for one call per thread
+  predraft predraft.predraft_new_leads, with --predraft (background drafts)
+  draft    ai.draft_reply for every new lead (--workers at a time)
+  send     main.send_single_draft for every draft, incl. the calendar check
+  poll     second poll — the clients' answers to what was sent
+  rescan   _scan_confirmations over those answers
+
+Per stage: wall time, Claude calls / tokens (llm_usage) and the stub's
+request counts. Each run ends with an outcome fingerprint (leads, drafts,
+appointments and their datetimes); with the same flags it must be identical
+run to run — --runs N checks that and exits non-zero if it drifts.
+
+--record-gmail dumps recent real inbox threads (needs /data/token.json)
+into the stub's --gmail-fixture format, so a benchmark can replay them.
+
+Run:
+  python scripts/bench_pipeline.py --threads 60 --runs 3
+  python scripts/bench_pipeline.py --latency anthropic=700,gmail=60 --error-rate anthropic=0.1 --seed 3
+  docker exec -it lucilease python /scripts/bench_pipeline.py --record-gmail /data/mailbox.json --limit 50
+  python scripts/bench_pipeline.py --predraft --latency anthropic=700
+  python scripts/bench_pipeline.py --threads 60 --per-thread-scan
+  python scripts/bench_pipeline.py --gmail-fixture mailbox.json --anthropic-corpus llm_corpus.jsonl
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import pathlib
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+SCRIPTS = pathlib.Path(__file__).resolve().parent
+sys.path.insert(0, "/app")  # Docker: app code lives at /app
+sys.path.insert(0, str(SCRIPTS.parent / "src"))
+sys.path.insert(0, str(SCRIPTS))
+
+import api_stub  # noqa: E402
+
+
+def record_gmail(path: str, limit: int):
+    """Write the newest `limit` inbox threads from the real Gmail account as a stub fixture."""
+    import gmail as gm
+    import google_client
+    creds = gm.get_credentials()
+    if not creds:
+        sys.exit("Gmail not connected — authenticate in the app first.")
+    service = google_client.gmail(creds)
+    agent = service.users().getProfile(userId="me").execute().get("emailAddress", "")
+    refs = service.users().threads().list(userId="me", q="in:inbox", maxResults=limit).execute()
+    threads = []
+    for ref in refs.get("threads", []):
+        msgs = gm.get_thread_messages(creds, ref["id"])
+        threads.append({"id": ref["id"], "messages": [
+            {"id": m["msg_id"], "from": m["from"], "to": m["to"], "subject": m["subject"], "date": m["date"],
+             "body": m["body"], "labels": ["SENT"] if agent and agent.lower() in m["from"].lower() else ["INBOX"]}
+            for m in msgs]})
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"agent_email": agent, "threads": threads}, f, indent=1)
+    print(f"Recorded {len(threads)} thread(s) → {path}")
+
+
+def _usage(conn) -> tuple:
+    row = conn.execute("SELECT COUNT(*) n, COALESCE(SUM(input_tokens + output_tokens), 0) t FROM llm_usage").fetchone()
+    return row["n"], row["t"]
+
+
+def _fingerprint(conn) -> dict:
+    q = lambda sql: [tuple(r) for r in conn.execute(sql).fetchall()]  # noqa: E731
+    return {
+        "leads":        q("SELECT status, COUNT(*) FROM leads GROUP BY status ORDER BY status"),
+        "drafts":       q("SELECT status, COUNT(*) FROM drafts GROUP BY status ORDER BY status"),
+        "appointments": q("SELECT meeting_type, proposed_datetime, source FROM appointments "
+                          "ORDER BY thread_id, proposed_datetime, meeting_type"),
+    }
+
+
+def run_once(args) -> tuple[list, dict]:
+    import db
+    db.DB_PATH = pathlib.Path(tempfile.mkdtemp(prefix="bench_")) / "bench.db"
+    db.init_db()
+    import ai
+    import gmail as gm
+    import main
+    import predraft
+
+    api_stub.configure(args)
+    stages = []
+
+    def stage(name: str, fn):
+        conn = db.get_conn()
+        calls0, tokens0 = _usage(conn)
+        stats0 = dict(api_stub.STATE["stats"])
+        start = time.perf_counter()
+        result = fn()
+        ms = (time.perf_counter() - start) * 1000
+        calls1, tokens1 = _usage(conn)
+        conn.close()
+        stats = {k: v - stats0.get(k, 0) for k, v in api_stub.STATE["stats"].items()}
+        stages.append({"stage": name, "ms": ms, "result": result, "claude_calls": calls1 - calls0,
+                       "tokens": tokens1 - tokens0, "gmail": stats.get("gmail requests", 0),
+                       "calendar": stats.get("calendar requests", 0),
+                       "errors": sum(v for k, v in stats.items() if k.endswith("errors"))})
+
+    def poll():
+        n = gm.poll_inbox()
+        main._save_last_poll_time()
+        return n
+
+    def draft_all():
+        conn = db.get_conn()
+        ids = [r["id"] for r in conn.execute("SELECT id FROM leads WHERE status='new' ORDER BY id")]
+        conn.close()
+
+        def one(lead_id):
+            try:
+                return "flagged" if ai.draft_reply(lead_id).get("needs_review") else "drafted"
+            except Exception as e:
+                print(f"  draft {lead_id}: {e}")
+                return "error"
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            outcomes = list(pool.map(one, ids))
+        return {k: outcomes.count(k) for k in sorted(set(outcomes))}
+
+    def send_all():
+        conn = db.get_conn()
+        ids = [r["id"] for r in conn.execute("SELECT id FROM drafts WHERE status != 'sent' ORDER BY id")]
+        conn.close()
+
+        async def go():
+            results = [await main.send_single_draft(i) for i in ids]
+            # outgoing-calendar checks run as background tasks — wait for them too
+            await asyncio.gather(*(asyncio.all_tasks() - {asyncio.current_task()}))
+            return sum(1 for r in results if r.get("ok"))
+        return asyncio.run(go())
+
+    stage("ingest", poll)
+    scan = lambda: main._scan_confirmations(batch=not args.per_thread_scan)  # noqa: E731
+    stage("scan",   scan)
+    if args.predraft:
+        predraft.set_enabled(True)
+        stage("predraft", lambda: predraft.predraft_new_leads(limit=10**6))
+    stage("draft",  draft_all)
+    stage("send",   send_all)
+    stage("poll",   poll)
+    stage("rescan", scan)
+
+    conn = db.get_conn()
+    fp = _fingerprint(conn)
+    conn.close()
+    return stages, fp
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--runs", type=int, default=1, help="repeat and check outcomes are identical")
+    ap.add_argument("--workers", type=int, default=4, help="concurrent drafts")
+    ap.add_argument("--predraft", action="store_true", help="pre-draft new leads before the draft stage")
+    ap.add_argument("--per-thread-scan", action="store_true", help="scan with one Claude call per thread (manual scans)")
+    ap.add_argument("--port", type=int, default=0, help="stub port (0 = any free port)")
+    ap.add_argument("--record-gmail", help="dump real inbox threads to this fixture path and exit")
+    ap.add_argument("--limit", type=int, default=50, help="threads for --record-gmail")
+    api_stub.add_arguments(ap)
+    ap.set_defaults(batch_delay=0.5, token_delay=0.0)
+    args = ap.parse_args()
+
+    if args.record_gmail:
+        return record_gmail(args.record_gmail, args.limit)
+
+    server = api_stub.start(port=args.port)
+    base = api_stub.STATE["base_url"]
+    # Before any app import: llm.py and google_client.py read these at import time
+    os.environ.update({"ANTHROPIC_BASE_URL": base, "ANTHROPIC_API_KEY": "stub", "GOOGLE_API_BASE_URL": base,
+                       "LLM_RECORD_PATH": "", "BATCH_POLL_SECONDS": "1"})
+    print(f"Stub on {base} — seed {args.seed}, latency {args.latency or 'none'}, "
+          f"errors {args.error_rate or 'none'}\n")
+
+    fingerprints = []
+    for run in range(1, args.runs + 1):
+        stages, fp = run_once(args)
+        digest = hashlib.sha1(json.dumps(fp, sort_keys=True).encode()).hexdigest()[:12]
+        fingerprints.append(digest)
+        print(f"Run {run}/{args.runs}")
+        print(f"  {'stage':<8} {'ms':>9} {'claude':>7} {'tokens':>8} {'gmail':>6} {'cal':>4} {'errors':>6}  result")
+        for s in stages:
+            print(f"  {s['stage']:<8} {s['ms']:>9.0f} {s['claude_calls']:>7} {s['tokens']:>8} "
+                  f"{s['gmail']:>6} {s['calendar']:>4} {s['errors']:>6}  {s['result']}")
+        total = sum(s["ms"] for s in stages)
+        print(f"  {'total':<8} {total:>9.0f} {sum(s['claude_calls'] for s in stages):>7} "
+              f"{sum(s['tokens'] for s in stages):>8}")
+        print(f"  outcome  {digest}  leads {fp['leads']}  drafts {fp['drafts']}  "
+              f"appointments {len(fp['appointments'])}\n")
+
+    server.shutdown()
+    if len(set(fingerprints)) > 1:
+        print(f"FAILED: outcomes differ between runs: {fingerprints}")
+        sys.exit(1)
+    if args.runs > 1:
+        print(f"Outcomes identical across {args.runs} runs ({fingerprints[0]}).")
+
+
+if __name__ == "__main__":
+    main()
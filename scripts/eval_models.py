@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+eval_models.py — Replay a recorded Claude corpus through candidate models.
+
+Record real traffic first: set LLM_RECORD_PATH=/data/llm_corpus.jsonl in
+.env and let the app poll/draft for a while. Every API call is appended as
+{"task", "model", "system", "prompt", "max_tokens", "response", ...}.
+
+This script re-sends each recorded prompt (uncached, not counted against
+the budget) to every candidate model and scores the answer against the
+reference — the record's "expected" answer if you hand-corrected one
+(same format as "response"), otherwise the recorded response:
+
+  tone                  same flag
+  thread_classify       same verdict + same confirmed datetimes + same inquiry yes/no
+  confirmation          same confirmed datetimes
+  draft_triage          same REVIEW flag (or both DRAFT)
+  prose tasks           no accuracy; reports length vs. reference
+
+Per task × model: accuracy, mean / p95 latency, cost per 1,000 calls, and
+the model currently routed for that task (llm.model_for).
+
+Run:
+  docker exec -it lucilease python /scripts/eval_models.py --corpus /data/llm_corpus.jsonl
+  python scripts/eval_models.py --corpus c.jsonl --models claude-haiku-4-5,claude-sonnet-4-5 --tasks tone,thread_classify --limit 100
+"""
+
+import argparse
+import collections
+import json
+import pathlib
+import statistics
+import sys
+
+sys.path.insert(0, "/app")  # Docker: app code lives at /app
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "src"))
+
+import llm  # noqa: E402
+from ai import parse_triage  # noqa: E402
+
+DEFAULT_MODELS = [llm.FAST_MODEL, llm.MODEL]
+
+
+def _json(text: str):
+    if "```" in (text or ""):
+        text = text.split("```")[1].replace("json", "").strip()
+    try:
+        return json.loads(text)
+    except (TypeError, ValueError):
+        return None
+
+
+def _confirmed(items) -> tuple:
+    if isinstance(items, dict):
+        items = [items]
+    if not isinstance(items, list):
+        return ()
+    return tuple(sorted(str(i.get("proposed_datetime")) for i in items
+                        if isinstance(i, dict) and i.get("confirmed") and i.get("confidence") != "low"))
+
+
+def _tone_flag(text: str):
+    data = _json(text)
+    return data.get("flag") if isinstance(data, dict) else "unparsed"
+
+
+def _classified(text: str):
+    data = _json(text)
+    if not isinstance(data, dict):
+        return "unparsed"
+    return data.get("verdict"), _confirmed(data.get("appointments")), _is_inquiry(data.get("inquiry"))
+
+
+def _classified_batch(text: str):
+    data = _json(text)
+    if not isinstance(data, dict):
+        return "unparsed"
+    return tuple(sorted((k, _classified(json.dumps(v))) for k, v in data.items()))
+
+
+def _is_inquiry(data) -> bool:
+    return isinstance(data, dict) and bool(data.get("is_inquiry")) and data.get("confidence") != "low"
+
+
+# task → answer text → comparable label (None = unscored prose task)
+LABELLERS = {
+    "tone":                 _tone_flag,
+    "confirmation":         lambda t: _confirmed(_json(t)),
+    "thread_classify":      _classified,
+    "thread_classify_batch": _classified_batch,
+    "draft_triage":         lambda t: parse_triage(t)["flag"],
+}
+
+
+def _p95(values: list) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * 0.95))] if values else 0
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--corpus", required=True, help="JSONL written via LLM_RECORD_PATH")
+    ap.add_argument("--models", default=",".join(DEFAULT_MODELS), help="comma-separated candidates")
+    ap.add_argument("--tasks", help="comma-separated tasks (default: all in the corpus)")
+    ap.add_argument("--limit", type=int, default=50, help="records per task")
+    args = ap.parse_args()
+
+    models = [m.strip() for m in args.models.split(",") if m.strip()]
+    wanted = {t.strip() for t in args.tasks.split(",")} if args.tasks else None
+
+    by_task = collections.defaultdict(list)
+    for line in open(args.corpus, encoding="utf-8"):
+        if not line.strip():
+            continue
+        rec = json.loads(line)
+        if (wanted is None or rec["task"] in wanted) and len(by_task[rec["task"]]) < args.limit:
+            by_task[rec["task"]].append(rec)
+    if not by_task:
+        print("No matching records.")
+        return
+
+    print(f"{'task':<22} {'model':<20} {'n':>4} {'accuracy':>9} {'mean ms':>8} {'p95 ms':>8} "
+          f"{'$/1k calls':>10} {'len ratio':>9}")
+    for task, records in sorted(by_task.items()):
+        label = LABELLERS.get(task)
+        for model in models:
+            latencies, costs, ratios, correct, errors = [], [], [], 0, 0
+            for rec in records:
+                system = llm.prefix(*rec["system"]) if rec.get("system") else None
+                try:
+                    out = llm.probe(model, rec["prompt"], rec["max_tokens"], system)
+                except Exception as e:
+                    errors += 1
+                    print(f"  ✗ {task} / {model}: {e}")
+                    continue
+                latencies.append(out["latency_ms"])
+                costs.append(out["cost_usd"])
+                reference = rec.get("expected", rec["response"])
+                if label:
+                    correct += label(out["text"]) == label(reference)
+                elif reference:
+                    ratios.append(len(out["text"]) / max(1, len(reference)))
+            n = len(latencies)
+            accuracy = f"{correct / n:.1%}" if label and n else "—"
+            ratio    = f"{statistics.mean(ratios):.2f}" if ratios else "—"
+            routed   = " ←" if llm.model_for(task) == model else ""
+            print(f"{task:<22} {model:<20} {n:>4} {accuracy:>9} "
+                  f"{statistics.mean(latencies) if n else 0:>8.0f} {_p95(latencies):>8.0f} "
+                  f"{sum(costs) / n * 1000 if n else 0:>10.2f} {ratio:>9}{routed}"
+                  f"{f'  ({errors} errors)' if errors else ''}")
+    print("\n← = model currently routed for the task (llm.model_for)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+eval_triage.py — Compare single-call triage against the old two-pass draft flow.
+
+Two-pass (before): assess_thread_tone → if not flagged, a draft_reply call.
+One-pass (now):    one draft_triage call that answers REVIEW: <flag> | reason
+                   or DRAFT + the reply (ai.TRIAGE_INSTRUCTIONS).
+
+Both run over the same recorded corpus of cold-lead threads, bypassing the
+response cache so every request really goes out. Reports flag agreement,
+requests and wall-clock latency per lead, and exits non-zero if agreement
+drops below --min-agreement. Nothing is saved to drafts or pushed to Gmail.
+
+Corpus: JSONL, one lead per line with the leads-table columns the prompt
+uses (name, subject, body_excerpt, body_full, budget_monthly_usd, bedrooms,
+move_in_date, pets, neighborhood, timeline) plus an optional expected_flag.
+--record dumps cold leads from the DB into that format.
+
+Run:
+  docker exec -it lucilease python /scripts/eval_triage.py --record /data/triage_corpus.jsonl --limit 50
+  docker exec -it lucilease python /scripts/eval_triage.py --corpus /data/triage_corpus.jsonl
+"""
+
+import argparse
+import json
+import pathlib
+import statistics
+import sys
+import time
+
+sys.path.insert(0, "/app")  # Docker: app code lives at /app
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "src"))
+
+import ai  # noqa: E402
+import listing_context  # noqa: E402
+import llm  # noqa: E402
+from db import get_conn  # noqa: E402
+
+LEAD_COLUMNS = ["id", "name", "subject", "body_excerpt", "body_full", "budget_monthly_usd",
+                "bedrooms", "move_in_date", "pets", "neighborhood", "timeline"]
+
+
+def record(path: str, limit: int):
+    """Write cold leads (sender not a known client) to a JSONL corpus."""
+    conn = get_conn()
+    rows = conn.execute(f"""
+        SELECT {', '.join('l.' + c for c in LEAD_COLUMNS)} FROM leads l
+        WHERE COALESCE(l.body_full, l.body_excerpt, '') != ''
+          AND NOT EXISTS (SELECT 1 FROM clients c WHERE c.contact_id = l.contact_id)
+        ORDER BY l.first_seen_at DESC LIMIT ?
+    """, (limit,)).fetchall()
+    conn.close()
+    with open(path, "w") as f:
+        for r in rows:
+            f.write(json.dumps(dict(r)) + "\n")
+    print(f"Recorded {len(rows)} lead(s) → {path}")
+
+
+def two_pass(lead: dict, profile: dict, listing_ctx: str) -> dict:
+    start, requests = time.perf_counter(), 1
+    thread_text = (lead.get("body_full") or lead.get("body_excerpt") or "").strip()
+    tone = ai.assess_thread_tone(thread_text)
+    if not tone.get("flag"):
+        system, prompt = ai.build_draft_prompt(lead, profile, listing_ctx, triage=False)
+        llm.complete("draft_reply", prompt, max_tokens=ai.DRAFT_MAX_TOKENS, system=system, bypass=True)
+        requests += 1
+    return {"flag": tone.get("flag"), "requests": requests, "ms": (time.perf_counter() - start) * 1000}
+
+
+def one_pass(lead: dict, profile: dict, listing_ctx: str) -> dict:
+    start = time.perf_counter()
+    system, prompt = ai.build_draft_prompt(lead, profile, listing_ctx, triage=True)
+    text = llm.complete("draft_triage", prompt, max_tokens=ai.TRIAGE_MAX_TOKENS, system=system, bypass=True)
+    t = ai.parse_triage(text)
+    return {"flag": t["flag"], "requests": 1, "ms": (time.perf_counter() - start) * 1000,
+            "empty": not t["flag"] and not t["body"]}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--corpus", help="JSONL corpus to evaluate")
+    ap.add_argument("--record", help="write cold leads from the DB to this JSONL path and exit")
+    ap.add_argument("--limit", type=int, default=50)
+    ap.add_argument("--min-agreement", type=float, default=0.9, help="flag/no-flag agreement required")
+    args = ap.parse_args()
+
+    if args.record:
+        return record(args.record, args.limit)
+    if not args.corpus:
+        ap.error("--corpus or --record is required")
+
+    leads = [json.loads(l) for l in open(args.corpus) if l.strip()][:args.limit]
+    profile = ai.get_agent_profile()
+    conn = get_conn()
+    listing_ctx = listing_context.listing(conn)
+    conn.close()
+
+    rows = []
+    for i, lead in enumerate(leads):
+        lead.setdefault("id", i)
+        old = two_pass(lead, profile, listing_ctx)
+        new = one_pass(lead, profile, listing_ctx)
+        same = bool(old["flag"]) == bool(new["flag"])
+        rows.append((lead, old, new, same))
+        mark = "✓" if same else "✗"
+        print(f"{mark} lead {lead['id']:<6} two-pass {str(old['flag']):<10} {old['ms']:7.0f} ms  "
+              f"one-pass {str(new['flag']):<10} {new['ms']:7.0f} ms"
+              f"{'  (empty draft)' if new['empty'] else ''}")
+    if not rows:
+        print("Corpus is empty.")
+        return
+
+    n = len(rows)
+    agree = sum(r[3] for r in rows) / n
+    exact = sum(r[1]["flag"] == r[2]["flag"] for r in rows) / n
+    old_req, new_req = sum(r[1]["requests"] for r in rows), sum(r[2]["requests"] for r in rows)
+    old_ms, new_ms = [r[1]["ms"] for r in rows], [r[2]["ms"] for r in rows]
+    print(f"\n{n} lead(s)")
+    print(f"Flag agreement:  {agree:.1%} flag/no-flag, {exact:.1%} exact flag")
+    print(f"Requests:        two-pass {old_req}, one-pass {new_req} ({new_req / old_req:.0%})")
+    print(f"Latency median:  two-pass {statistics.median(old_ms):.0f} ms, "
+          f"one-pass {statistics.median(new_ms):.0f} ms ({statistics.median(new_ms) / statistics.median(old_ms):.0%})")
+
+    labelled = [r for r in rows if "expected_flag" in r[0]]
+    if labelled:
+        for name, idx in (("two-pass", 1), ("one-pass", 2)):
+            ok = sum(bool(r[idx]["flag"]) == bool(r[0]["expected_flag"]) for r in labelled)
+            print(f"vs expected_flag ({name}): {ok}/{len(labelled)}")
+
+    if agree < args.min_agreement:
+        print(f"FAILED: agreement {agree:.1%} < {args.min_agreement:.0%}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
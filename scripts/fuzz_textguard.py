@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+fuzz_textguard.py — Worst-case timing checks for the inbound text pipeline.
+
+Feeds pathological email bodies (multi-MB, unterminated tags, whitespace
+floods, digit/comma runs, repeated date prefixes, random noise) through
+textguard, timeparse and every regex stage that runs at ingest, and fails if any
+single message takes longer than the limit.
+
+Run:
+  docker exec -it lucilease python /scripts/fuzz_textguard.py
+  python scripts/fuzz_textguard.py --limit-ms 500 --seed 7 --random 200
+"""
+
+import argparse
+import datetime
+import pathlib
+import random
+import sys
+import time
+
+sys.path.insert(0, "/app")  # Docker: app code lives at /app
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent / "src"))
+
+import textguard  # noqa: E402
+import timeparse  # noqa: E402
+import enrich  # noqa: E402
+from leads import parse_email_to_lead  # noqa: E402
+from main import _body_has_datetime  # noqa: E402
+
+MB = 1024 * 1024
+
+
+def pathological_cases() -> dict:
+    return {
+        "huge_plain":        "I'm looking for a 2 bedroom near downtown. " * (4 * MB // 44),
+        "unterminated_tags": "<" * (2 * MB),
+        "tag_soup":          "<div " * (MB // 5),
+        "whitespace_flood":  "$" + " " * (2 * MB) + "x",
+        "newline_flood":     "\n" * (2 * MB),
+        "comma_digits":      "1," * MB,
+        "digit_run":         "9" * (2 * MB),
+        "weekday_prefix":    "monday, " * (MB // 8),
+        "month_prefix":      "march " * (MB // 6),
+        "slash_dates":       "1/" * MB,
+        "br_spaces":         "<br" + " " * MB,
+        "zero_width":        "\u200b" * MB + "rent",
+        "budget_spaces":     ("3,800" + " " * 200) * 5000,
+        "move_in_spam":      "move in " * (MB // 8),
+        "near_caps":         "near " + "Abc " * (MB // 4),
+        "footer_prefix":     "sent from my " * (MB // 13),
+        "dash_lines":        "--\n_" * (MB // 4),
+    }
+
+
+def random_case(rng: random.Random, size: int) -> str:
+    alphabet = "<>/ \t\n\r,.$:0123456789amp" + "abcdefghijklmnopqrstuvwxyz" + "\u200b\xa0"
+    tokens = ["<br", "<p ", "$", "/month", " per ", "monday", "march ", " at ", "pm",
+              "bedroom", "move in ", "near ", "&nbsp;", "1,000", "\n\n\n"]
+    out, n = [], 0
+    while n < size:
+        piece = rng.choice(tokens) if rng.random() < 0.3 else rng.choice(alphabet) * rng.randint(1, 4000)
+        out.append(piece)
+        n += len(piece)
+    return "".join(out)
+
+
+def analyse(raw: str) -> None:
+    """Everything ingest runs over one body, in the same order."""
+    html = textguard.strip_tags(raw)
+    body = textguard.prepare(raw)
+    timeparse.parse(body)
+    _body_has_datetime(body)
+    timeparse.is_plain_yes(textguard.strip_quoted(raw))
+    textguard.strip_signature(raw)
+    parse_email_to_lead({"From": "x@example.com", "Subject": textguard.prepare_subject(raw)}, body)
+    enrich.extract("", body, "2026-01-01")
+    textguard.prepare(html)
+
+
+def timed_ms(raw: str) -> float:
+    start = time.thread_time()
+    analyse(raw)
+    return (time.thread_time() - start) * 1000
+
+
+def sanity() -> list[str]:
+    ref = datetime.datetime(2026, 3, 5, 9, 0)   # a Thursday
+    checks = [
+        (textguard.find_budget("budget is $3,800/month"), 3800),
+        (textguard.find_budget("about 4000 per month"), 4000),
+        (textguard.find_budget("$2,500/mo max"), 2500),
+        (_body_has_datetime("Does Saturday at 2pm work?"), True),
+        (_body_has_datetime("tomorrow at 10:30am then"), True),
+        (_body_has_datetime("see you at 3/10"), False),
+        (_body_has_datetime("thanks for reaching out"), False),
+        (textguard.strip_tags("<p>Hi</p><br/>there &amp; bye"), "Hi\n\nthere & bye"),
+        (bool(textguard.TIME_RE.search("See you Monday!")), True),
+        (textguard.strip_quoted("Works!\n\nOn Mon, Mar 2, 2026 at 9:14 AM Jo <j@x.com> wrote:\n> Sat?"), "Works!"),
+        (textguard.strip_signature("See you Sat.\n-- \nJo Smith\n(805) 555-0199"), "See you Sat."),
+        (textguard.strip_signature("Sounds good\n\nSent from my iPhone"), "Sounds good"),
+        (textguard.strip_quoted("Via Zillow:\nFrom: Jane Doe\nMessage: Is 742 Anacapa available?"),
+         "Via Zillow:\nFrom: Jane Doe\nMessage: Is 742 Anacapa available?"),
+        (textguard.strip_quoted("Yes!\n\nFrom: Jo <j@x.com>\nSent: Monday\nSat?"), "Yes!"),
+        ([c["datetime"] for c in timeparse.parse("March 10 at 2pm or 3/11 at 10am", ref)],
+         ["2026-03-10T14:00:00", "2026-03-11T10:00:00"]),
+        ([c["datetime"] for c in timeparse.parse("this Saturday at 2:30", ref)], ["2026-03-07T14:30:00"]),
+        ([c["datetime"] for c in timeparse.parse("Saturday at 2 works", ref)], ["2026-03-07T14:00:00"]),
+        ([c["datetime"] for c in timeparse.parse("2pm on Tuesday, tomorrow at noon", ref)],
+         ["2026-03-10T14:00:00", "2026-03-06T12:00:00"]),
+        (timeparse.parse("the market 5 blocks away, we may 2 come", ref), []),
+        (timeparse.is_plain_yes("Saturday at 2 works!"), True),
+        (timeparse.is_plain_yes("Saturday doesn't work, how about Sunday?"), False),
+        (timeparse.is_plain_yes("sure, saturday works for my husband but I will be away"), False),
+    ]
+    return [f"expected {want!r}, got {got!r}" for got, want in checks if got != want]
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--limit-ms", type=float, default=500, help="worst-case CPU ms per message")
+    ap.add_argument("--random", type=int, default=50, help="number of random inputs")
+    ap.add_argument("--size", type=int, default=256 * 1024, help="random input size (chars)")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    failures = sanity()
+    for f in failures:
+        print(f"✗ sanity: {f}")
+
+    worst = ("", 0.0)
+    for name, raw in pathological_cases().items():
+        ms = timed_ms(raw)
+        ok = ms <= args.limit_ms
+        print(f"{'✓' if ok else '✗'} {name:<20} {len(raw) / MB:5.1f} MB  {ms:8.1f} ms")
+        if not ok:
+            failures.append(name)
+        worst = max(worst, (name, ms), key=lambda w: w[1])
+
+    rng = random.Random(args.seed)
+    for i in range(args.random):
+        raw = random_case(rng, args.size)
+        ms = timed_ms(raw)
+        if ms > args.limit_ms:
+            print(f"✗ random #{i} (seed {args.seed}) {ms:.1f} ms")
+            failures.append(f"random#{i}")
+        worst = max(worst, (f"random#{i}", ms), key=lambda w: w[1])
+
+    print(f"\nWorst case: {worst[0]} — {worst[1]:.1f} ms (limit {args.limit_ms:.0f} ms)")
+    if failures:
+        print(f"FAILED: {len(failures)} case(s)")
+        sys.exit(1)
+    print("All cases within budget.")
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@
 reset_all.py — Nuclear reset. Wipes ALL data, keeps schema.
 
 Clears: leads, appointments, drafts, clients, properties,
-        open_house_slots, config
+        open_house_slots, contacts, llm_cache, config
 
 Run:
   docker exec -it lucilease python /scripts/reset_all.py
@@ -13,12 +13,23 @@ import sqlite3, os
 DB_PATH = os.environ.get("DB_PATH", "/data/lucilease.db")
 
 TABLES = [
+    "predrafts",
+    "draft_reuse",
+    "scan_queue",
+    "context_cache",
     "appointments",
     "drafts",
     "leads",
     "open_house_slots",
     "clients",
+    "property_geo",
     "properties",
+    "contacts",
+    "llm_cache",
+    "llm_cache_stats",
+    "llm_usage",
+    "llm_usage_daily",
+    "thread_summaries",
     "config",
 ]
 
@@ -3,6 +3,7 @@ ai.py — Claude Sonnet draft reply engine for Lucilease.
 
 Given a lead and the agent's profile + property list, generates a
 personalized, professional reply and saves it as a Gmail draft.
+All Claude calls go through llm.complete (response cache, see llm.py).
 """
 
 import datetime
@@ -11,19 +12,20 @@ import os
 import re
 from typing import Optional
 
-import anthropic
-
 from db import get_conn
 import gmail as gm
-from googleapiclient.discovery import build
+import google_client
+import listing_context
+import llm
+import matching
+import predraft
+import prompting
+import reuse
+import textguard
+import timeparse
 import base64
 import email.mime.text
-
-
-# ── Client ────────────────────────────────────────────────────────────────────
-
-def _claude() -> anthropic.Anthropic:
-    return anthropic.Anthropic(api_key=os.environ["ANTHROPIC_API_KEY"])
+import email.utils
 
 
 # ── Agent profile ─────────────────────────────────────────────────────────────
@@ -49,33 +51,31 @@ def save_agent_profile(profile: dict):
 
 # ── Draft generation ──────────────────────────────────────────────────────────
 
-def assess_thread_tone(thread_text: str) -> dict:
-    """
-    Quick Claude check: is this thread angry, confusing, or off-topic?
-    Returns {"flag": None|"angry"|"confusing"|"off_topic", "reason": str}
-    """
-    prompt = f"""Briefly assess this email or thread. Respond with ONLY a JSON object:
-{{
+TONE_INSTRUCTIONS = """Briefly assess the email or thread you are given. Respond with ONLY a JSON object:
+{
   "flag": null or "angry" or "confusing" or "off_topic",
   "reason": "one sentence explanation, or null"
-}}
+}
 
 Set flag to:
 - "angry": customer is clearly upset, frustrated, or using hostile language
-- "confusing": thread is so unclear/jumbled that a meaningful reply is impossible  
+- "confusing": thread is so unclear/jumbled that a meaningful reply is impossible
 - "off_topic": clearly unrelated to real estate / scheduling (e.g. wrong recipient)
-- null: normal, safe to draft a reply
+- null: normal, safe to draft a reply"""
 
-Email/thread:
-{thread_text[:1500]}"""
+
+def assess_thread_tone(thread_text: str) -> dict:
+    """
+    Quick Claude check: is this thread angry, confusing, or off-topic?
+    Returns {"flag": None|"angry"|"confusing"|"off_topic", "reason": str}
+    Drafting folds this into the draft call (TRIAGE_INSTRUCTIONS); the
+    standalone check is kept as the baseline for scripts/eval_triage.py.
+    """
+    prompt = f"""Email/thread:
+{prompting.fit(thread_text, prompting.TONE_TOKENS)}"""
 
     try:
-        response = _claude().messages.create(
-            model="claude-sonnet-4-5",
-            max_tokens=100,
-            messages=[{"role": "user", "content": prompt}],
-        )
-        text = response.content[0].text.strip()
+        text = llm.complete("tone", prompt, max_tokens=100, system=llm.prefix(TONE_INSTRUCTIONS))
         if "```" in text:
             text = text.split("```")[1].replace("json", "").strip()
         return json.loads(text)
@@ -84,12 +84,126 @@ Email/thread:
         return {"flag": None, "reason": None}
 
 
-def draft_reply(lead_id: int) -> dict:
+def _draft_rules(profile: dict) -> str:
+    """Agent identity + reply rules — the most static part of the draft prefix."""
+    agent_name    = profile.get("agent_name", "Your Agent")
+    agent_company = profile.get("agent_company", "")
+    agent_tone    = profile.get("agent_tone", "professional and warm")
+    return f"""You are {agent_name}, a real estate agent{f' at {agent_company}' if agent_company else ''}.
+Tone: {agent_tone}.
+
+Potential clients email you. For each inquiry, write a SHORT, professional reply — no fluff, no filler.
+
+Rules:
+- Maximum 3 short paragraphs. Aim for under 120 words total.
+- First paragraph: warm one-line greeting + acknowledge their specific need.
+- Second paragraph: if a matching property exists, mention it briefly. If they asked about a property NOT in your listings, politely let them know it's not one you represent and offer to help with what you do have.
+- Third paragraph: one clear call to action — propose a SPECIFIC time using ONLY times from your open house schedule or general availability listed below. NEVER suggest a time outside those windows. If no availability windows are set, say you'll follow up to confirm timing.
+- Do NOT use "I hope this email finds you well" or any filler openers.
+- Do NOT include a subject line or signature — those are added separately.
+- Plain text only, no markdown."""
+
+
+DRAFT_MAX_TOKENS  = 300
+TRIAGE_MAX_TOKENS = DRAFT_MAX_TOKENS + 40   # room for the REVIEW/DRAFT header line
+
+# Cold senders: the tone check and the draft in one call. Same flag rules as
+# TONE_INSTRUCTIONS; the answer leads with a header line so the body can be
+# streamed straight through once the header has been read.
+TRIAGE_INSTRUCTIONS = """Before replying, assess the client's email/thread.
+
+Flag it instead of replying if:
+- angry: customer is clearly upset, frustrated, or using hostile language
+- confusing: thread is so unclear/jumbled that a meaningful reply is impossible
+- off_topic: clearly unrelated to real estate / scheduling (e.g. wrong recipient)
+
+Answer format — the FIRST line must be exactly one of:
+REVIEW: <angry|confusing|off_topic> | <one sentence explanation>
+DRAFT
+If it is DRAFT, write the reply itself starting on the next line. If it is REVIEW, write nothing else."""
+
+# Headers are matched case-sensitively so a reply opening with "Review..." or
+# "Drafting..." isn't mistaken for one
+_TRIAGE_REVIEW_RE = re.compile(r"^\W{0,3}REVIEW[*_ ]{0,3}:[*_ ]{0,4}(?i:(angry|confusing|off_topic))?\s{0,3}[|:\-—]?\s{0,3}(.*)$")
+_TRIAGE_DRAFT_RE  = re.compile(r"^\W{0,3}DRAFT\b\W{0,3}")
+
+
+def parse_triage(text: str) -> dict:
     """
-    Generate a personalized reply for a lead using Claude Sonnet.
-    Returns {"subject": str, "body": str, "gmail_draft_id": str|None}
-    If the thread is flagged as angry/confusing/off-topic, returns
-    {"flag": "angry"|"confusing"|"off_topic", "reason": str, "needs_review": True}
+    Split a triage answer into {"flag", "reason", "body"}. An answer that
+    ignores the format is treated as a plain draft — the same fail-open
+    behaviour as assess_thread_tone on a parse error.
+    """
+    text = (text or "").strip()
+    header, _, rest = text.partition("\n")
+    m = _TRIAGE_REVIEW_RE.match(header.strip())
+    if m:
+        return {"flag": (m.group(1) or "confusing").lower(), "reason": m.group(2).strip() or None, "body": ""}
+    m = _TRIAGE_DRAFT_RE.match(header.strip())
+    if m:
+        return {"flag": None, "reason": None, "body": (header.strip()[m.end():] + "\n" + rest).strip()}
+    return {"flag": None, "reason": None, "body": text}
+
+
+def _needs_review(lead: dict, flag: str, reason: Optional[str]) -> dict:
+    return {
+        "ok": False,
+        "flag": flag,
+        "reason": reason or "Thread flagged by AI — review before replying.",
+        "needs_review": True,
+        "lead_id": lead["id"],
+        "subject": f"Re: {lead.get('subject') or 'Your Inquiry'}",
+    }
+
+
+def build_draft_prompt(lead: dict, profile: dict, listing_ctx: str, triage: bool,
+                       matches: str = "") -> tuple[list, str]:
+    """
+    (system, prompt) for one lead. triage=True adds the tone check to the same
+    call. matches is this lead's best-fit listings (matching.lead_listings) —
+    per lead, so it goes in the prompt, not the cached system prefix.
+    """
+    # Structured facts extracted at ingest (enrich.py) — budget, beds, move-in, pets, area
+    from enrich import facts_line
+    facts = facts_line(lead)
+    budget_ctx = f"Key facts: {facts}." if facts else ""
+    # The client's own words once; what they quote only goes to the tone check
+    message, quoted = prompting.inquiry_parts(lead.get("body_full") or lead.get("body_excerpt"))
+    message = prompting.fit(message, prompting.INQUIRY_TOKENS)
+
+    prompt = f"""A potential client emailed you. Write your reply.
+
+Client inquiry:
+- Name: {lead.get('name') or 'the sender'}
+- Subject: {lead.get('subject') or 'N/A'}
+- Message: {message or 'N/A'}
+- {budget_ctx}"""
+    if matches:
+        prompt += f"\n\n{prompting.fit(matches, prompting.MATCHES_TOKENS)}"
+    if not triage:
+        return llm.prefix(_draft_rules(profile), listing_ctx), prompt
+
+    prompt += "\n\nEmail/thread to assess: the client inquiry above."
+    if quoted:
+        prompt += f"""
+Earlier messages quoted in it:
+{prompting.fit(quoted, prompting.TRIAGE_TOKENS)}"""
+    return llm.prefix(_draft_rules(profile), listing_ctx, TRIAGE_INSTRUCTIONS), prompt
+
+
+def prepare_draft(lead_id: int) -> dict:
+    """
+    Everything draft_reply does before the Claude call: load the lead and
+    build the prompt. Bulk drafting (jobs.py) calls this directly so the
+    draft calls themselves can go through Message Batches.
+
+    Returns {"lead", "task", "triage", "system", "prompt", "max_tokens",
+    "signature"}. With triage=True the answer may be a review flag instead
+    of a draft — pass it to resolve_draft(), not finalize_draft().
+
+    Prompt order: agent rules → listing context (both in the cached system
+    prefix) → this lead's inquiry, then its best-fit listings when there are
+    too many to list in the prefix.
     """
     conn = get_conn()
     lead = conn.execute("SELECT * FROM leads WHERE id=?", (lead_id,)).fetchone()
@@ -98,131 +212,43 @@ def draft_reply(lead_id: int) -> dict:
         raise ValueError(f"Lead {lead_id} not found")
 
     lead = dict(lead)
-
-    # Fetch active properties for context
-    properties = [
-        dict(r) for r in conn.execute(
-            "SELECT * FROM properties WHERE status='active' ORDER BY created_at DESC LIMIT 10"
-        ).fetchall()
-    ]
-
-    # Fetch open house slots for active properties
-    open_house_slots = {}
-    for p in properties:
-        slots = conn.execute(
-            "SELECT * FROM open_house_slots WHERE property_id=? ORDER BY day_of_week, start_time",
-            (p["id"],)
-        ).fetchall()
-        if slots:
-            open_house_slots[p["id"]] = [dict(s) for s in slots]
-
-    # Fetch agent availability windows + timezone from config
-    cfg = {r["key"]: r["value"] for r in conn.execute("SELECT key, value FROM config").fetchall()}
-    timezone = cfg.get("timezone", "America/Los_Angeles")
-    avail_raw = cfg.get("availability_windows")
+    listing_ctx = listing_context.listing(conn)
+    matches     = matching.lead_listings(conn, lead)
     conn.close()
 
     profile = get_agent_profile()
-    agent_name    = profile.get("agent_name", "Your Agent")
-    agent_company = profile.get("agent_company", "")
-    agent_tone    = profile.get("agent_tone", "professional and warm")
-
-    # Build properties context (with open house windows per property)
-    DAY_SHORT = {"monday":"Mon","tuesday":"Tue","wednesday":"Wed","thursday":"Thu",
-                 "friday":"Fri","saturday":"Sat","sunday":"Sun"}
-    props_text = ""
-    if properties:
-        props_text = "\n\nAvailable properties you represent:\n"
-        for p in properties:
-            price = (f"${p['price_monthly']:,}/mo" if p.get("price_monthly")
-                     else f"${p['price_sale']:,}" if p.get("price_sale") else "price TBD")
-            beds  = f"{p['bedrooms']}bd/{p['bathrooms']}ba" if p.get("bedrooms") else ""
-            props_text += f"- {p['address']} | {p['type']} | {beds} | {price}\n"
-            if p.get("notes"):
-                props_text += f"  Notes: {p['notes']}\n"
-            slots = open_house_slots.get(p["id"], [])
-            if slots:
-                slot_strs = [
-                    f"{DAY_SHORT.get(s['day_of_week'], s['day_of_week'])} {s['start_time']}–{s['end_time']}"
-                    + (f" ({s['label']})" if s.get('label') else "")
-                    for s in slots
-                ]
-                props_text += f"  Open house times: {', '.join(slot_strs)}\n"
-
-    # Build agent availability context
-    avail_text = ""
-    if avail_raw:
-        try:
-            windows = json.loads(avail_raw)
-            enabled = [w for w in windows if w.get("enabled")]
-            if enabled:
-                avail_lines = [
-                    f"{DAY_SHORT.get(w['day'], w['day'])} {w['start']}–{w['end']}"
-                    for w in enabled
-                ]
-                avail_text = f"\n\nYour general availability for appointments ({timezone}): {', '.join(avail_lines)}."
-        except Exception:
-            pass
-
-    # Budget context
-    budget_ctx = ""
-    if lead.get("budget_monthly_usd"):
-        budget_ctx = f"Their stated budget is ${lead['budget_monthly_usd']:,}/month."
 
     sig_enabled = profile.get("agent_signature_enabled", "false") == "true"
     signature   = profile.get("agent_signature", "").strip() if sig_enabled else ""
 
-    # Tone check: only run for unknown/cold senders — skip for known clients/leads
-    # (saves one Claude call per draft for warm contacts)
+    # Tone check only for unknown/cold senders — known clients/leads skip it.
+    # For cold senders it rides along in the draft call itself (triage).
     conn_check = get_conn()
-    is_known = conn_check.execute(
-        "SELECT 1 FROM clients WHERE lower(email)=lower(?) LIMIT 1",
-        (lead.get("from_email",""),)
+    is_known = lead.get("contact_id") and conn_check.execute(
+        "SELECT 1 FROM clients WHERE contact_id=? LIMIT 1", (lead["contact_id"],)
     ).fetchone()
     conn_check.close()
 
     thread_text = (lead.get("body_full") or lead.get("body_excerpt") or "").strip()
-    if thread_text and not is_known:
-        tone = assess_thread_tone(thread_text)
-        if tone.get("flag"):
-            return {
-                "ok": False,
-                "flag": tone["flag"],
-                "reason": tone.get("reason") or "Thread flagged by AI — review before replying.",
-                "needs_review": True,
-                "lead_id": lead_id,
-                "subject": f"Re: {lead.get('subject') or 'Your Inquiry'}",
-            }
-
-    prompt = f"""You are {agent_name}, a real estate agent{f' at {agent_company}' if agent_company else ''}.
-Tone: {agent_tone}.
-
-A potential client emailed you. Write a SHORT, professional reply — no fluff, no filler.
+    triage = bool(thread_text and not is_known)
+    system, prompt = build_draft_prompt(lead, profile, listing_ctx, triage, matches)
 
-Client inquiry:
-- Name: {lead.get('name') or 'the sender'}
-- Subject: {lead.get('subject') or 'N/A'}
-- Message: {lead.get('body_excerpt') or 'N/A'}
-- {budget_ctx}
-{props_text}{avail_text}
-
-Rules:
-- Maximum 3 short paragraphs. Aim for under 120 words total.
-- First paragraph: warm one-line greeting + acknowledge their specific need.
-- Second paragraph: if a matching property exists, mention it briefly. If they asked about a property NOT in your listings, politely let them know it's not one you represent and offer to help with what you do have.
-- Third paragraph: one clear call to action — propose a SPECIFIC time using ONLY times from your open house schedule or general availability listed above. NEVER suggest a time outside those windows. If no availability windows are set, say you'll follow up to confirm timing.
-- Do NOT use "I hope this email finds you well" or any filler openers.
-- Do NOT include a subject line or signature — those are added separately.
-- Plain text only, no markdown.
-"""
+    return {
+        "lead":       lead,
+        "task":       "draft_triage" if triage else "draft_reply",
+        "triage":     triage,
+        "system":     system,
+        "prompt":     prompt,
+        "max_tokens": TRIAGE_MAX_TOKENS if triage else DRAFT_MAX_TOKENS,
+        "signature":  signature,
+    }
 
-    response = _claude().messages.create(
-        model="claude-sonnet-4-5",
-        max_tokens=300,
-        messages=[{"role": "user", "content": prompt}],
-    )
 
-    body    = response.content[0].text.strip()
+def finalize_draft(prepared: dict, body: str) -> dict:
+    """Append the signature, save the draft, push it to Gmail, mark the lead drafted."""
+    lead      = prepared["lead"]
+    lead_id   = lead["id"]
+    signature = prepared.get("signature")
     if signature:
         body = body + "\n\n" + signature
     subject = f"Re: {lead.get('subject') or 'Your Inquiry'}"
@@ -235,6 +261,8 @@ Rules:
         VALUES (?,?,?,?,?)
     """, (lead_id, lead["from_email"], subject, body, now))
     draft_db_id = cursor.lastrowid
+    # Mark lead as 'drafted' so it moves out of raw inbox view
+    conn.execute("UPDATE leads SET status='drafted' WHERE id=? AND status='new'", (lead_id,))
     conn.commit()
 
     # Push to Gmail drafts if authenticated
@@ -267,117 +295,361 @@ Rules:
     }
 
 
+def reuse_draft(prepared: dict) -> Optional[dict]:
+    """A past sent reply to a near-identical inquiry (reuse.py), saved as this lead's draft — or None."""
+    hit = reuse.find(prepared)
+    if not hit:
+        return None
+    result = finalize_draft(prepared, hit["body"])
+    reuse.record(hit, result["draft_db_id"])
+    return {**result, "reused": {"draft_id": hit["draft_id"], "lead_id": hit["lead_id"], "score": hit["score"]}}
+
+
+def resolve_draft(prepared: dict, text: str) -> dict:
+    """Claude's answer → saved draft, or the needs_review dict for a flagged thread."""
+    if prepared.get("triage"):
+        t = parse_triage(text)
+        if t["flag"]:
+            return _needs_review(prepared["lead"], t["flag"], t["reason"])
+        text = t["body"]
+    return finalize_draft(prepared, text)
+
+
+def draft_reply(lead_id: int, regenerate: bool = False) -> dict:
+    """
+    Generate a personalized reply for a lead using Claude Sonnet — one call,
+    with the tone check folded in for cold senders.
+    regenerate=True skips the response cache for the draft itself.
+    Returns {"subject": str, "body": str, "gmail_draft_id": str|None}
+    If the thread is flagged as angry/confusing/off-topic, returns
+    {"flag": "angry"|"confusing"|"off_topic", "reason": str, "needs_review": True}
+    A current background pre-draft (predraft.py) is used instead of a call,
+    then a past sent reply to a near-identical inquiry (reuse.py, reused=…).
+    While the circuit breaker is open a UI draft is a template (fallback=True).
+    """
+    prepared = prepare_draft(lead_id)
+    if regenerate:
+        reuse.mark_regenerated(lead_id)
+    text = None if regenerate else predraft.take(prepared)
+    if text is not None:
+        return resolve_draft(prepared, text)
+    reused = None if regenerate else reuse_draft(prepared)
+    if reused:
+        return reused
+    try:
+        text = llm.complete(prepared["task"], prepared["prompt"], max_tokens=prepared["max_tokens"],
+                            system=prepared["system"], bypass=regenerate)
+    except llm.CircuitOpen:
+        if llm.lane(prepared["task"]) != "interactive":
+            raise                         # bulk jobs defer instead
+        return _fallback_draft(prepared)
+    return resolve_draft(prepared, text)
+
+
+def draft_reply_stream(lead_id: int, regenerate: bool = False):
+    """
+    Streaming draft_reply. Yields (event, data) pairs:
+      ("flagged", {...})  thread needs review — nothing drafted
+      ("token", {"text"}) each text delta as Claude writes it
+      ("done", {...})     draft saved + pushed to Gmail (same shape as draft_reply)
+
+    For a triage call the header line is held back until it's complete, so
+    the UI only ever sees draft text. A current pre-draft, a reused past
+    reply, or the template used while the circuit breaker is open, arrives
+    as one token.
+    """
+    prepared = prepare_draft(lead_id)
+    if regenerate:
+        reuse.mark_regenerated(lead_id)
+    ready = None if regenerate else predraft.take(prepared)
+    reused = None if regenerate or ready is not None else reuse_draft(prepared)
+    if reused:
+        yield "token", {"text": reused["body"]}
+        yield "done", reused
+        return
+    deltas = [ready] if ready is not None else llm.stream(
+        prepared["task"], prepared["prompt"], max_tokens=prepared["max_tokens"],
+        system=prepared["system"], bypass=regenerate)
+    chunks, pending = [], prepared.get("triage")
+    try:
+        for text in deltas:
+            chunks.append(text)
+            if not pending:
+                yield "token", {"text": text}
+                continue
+            head = "".join(chunks).lstrip()
+            if "\n" not in head:
+                continue
+            pending = False
+            t = parse_triage(head)
+            if t["flag"]:
+                continue                      # drain the rest; resolve_draft flags it below
+            if t["body"]:
+                yield "token", {"text": t["body"]}
+    except llm.CircuitOpen:
+        if chunks:
+            raise
+        result = _fallback_draft(prepared)
+        yield "token", {"text": result["body"]}
+        yield "done", result
+        return
+    result = resolve_draft(prepared, "".join(chunks))
+    yield ("flagged" if result.get("needs_review") else "done"), result
+
+
+# ── Template fallbacks ────────────────────────────────────────────────────────
+#
+# While the llm circuit breaker is open, UI actions get a fixed-wording reply
+# at once instead of waiting on a failing API. Facts come only from the lead
+# / appointment and the agent's availability windows; the result is marked
+# fallback=True so the agent knows to give it a read before sending.
+
+FALLBACK_SLOTS   = 3
+FALLBACK_DAYS    = 14
+_DEFAULT_WINDOWS = [{"day": d, "start": "10:00", "end": "16:00", "enabled": True}
+                    for d in ("monday", "tuesday", "wednesday", "thursday", "friday")]
+
+
+def _template_slots(cfg: dict, count: int = FALLBACK_SLOTS, avoid: Optional[datetime.date] = None) -> list[str]:
+    """
+    The next `count` bookable times from the availability windows, one per
+    day, starting tomorrow: alternately a window's start and its midpoint
+    (on the hour), so the options don't all read "at 9:00 AM".
+    """
+    try:
+        windows = [w for w in json.loads(cfg.get("availability_windows") or "[]") if w.get("enabled")]
+    except Exception:
+        windows = []
+    by_day = {w["day"]: w for w in (windows or _DEFAULT_WINDOWS)}
+    today = timeparse.now(cfg.get("timezone") or "America/Los_Angeles").date()
+
+    slots = []
+    for offset in range(1, FALLBACK_DAYS + 1):
+        day = today + datetime.timedelta(days=offset)
+        w = by_day.get(day.strftime("%A").lower())
+        if not w or day == avoid:
+            continue
+        try:
+            start = [int(x) for x in w["start"].split(":")]
+            end   = [int(x) for x in w["end"].split(":")]
+        except (KeyError, ValueError):
+            continue
+        hour = start[0] if len(slots) % 2 == 0 else (start[0] + end[0]) // 2
+        minute = start[1] if hour == start[0] else 0
+        slots.append(timeparse.format_text(day, (hour, minute)))
+        if len(slots) == count:
+            break
+    return slots
+
+
+def _join_options(options: list[str]) -> str:
+    if len(options) < 2:
+        return "".join(options)
+    return ", ".join(options[:-1]) + f"{',' if len(options) > 2 else ''} or {options[-1]}"
+
+
+def _fallback_draft(prepared: dict) -> dict:
+    """Template reply to a new lead — saved and pushed like a Claude draft. No tone check."""
+    lead  = prepared["lead"]
+    first = ((lead.get("name") or "").split() or ["there"])[0]
+    topic = re.sub(r"^\s*((re|fwd?)\s*:\s*)+", "", lead.get("subject") or "", flags=re.I).strip()
+    cfg   = get_agent_profile()
+    slots = _template_slots(cfg, count=2)
+
+    body = f"Hi {first},\n\nThanks for reaching out" + (f" about {topic}" if topic and len(topic) <= 60 else "") \
+        + ". I'd be glad to help and will follow up with details on what I have available."
+    body += (f"\n\nWould {_join_options(slots)} work for a quick call or a showing? "
+             "Let me know what suits you." if slots else
+             "\n\nLet me know a good time to connect and I'll confirm.")
+    print(f"[ai] Lead {lead['id']}: Claude unavailable — template draft")
+    return {**finalize_draft(prepared, body), "fallback": True}
+
+
+def _fallback_times_body(appt: dict, cfg: dict, alternative: bool) -> str:
+    """Template for draft_availability_options / draft_alternative_times."""
+    name  = appt.get("client_name") or "there"
+    avoid = None
+    if alternative and appt.get("proposed_datetime"):
+        try:
+            avoid = datetime.datetime.fromisoformat(appt["proposed_datetime"][:19]).date()
+        except ValueError:
+            pass
+    slots = _join_options(_template_slots(cfg, avoid=avoid))
+    if alternative:
+        proposed = appt.get("proposed_date_text") or "the time we discussed"
+        opening  = f"Sorry — {proposed} doesn't work on my end after all."
+        ask      = f"Could we do {slots} instead?" if slots else "Could you send me a couple of other times that suit you?"
+        return f"Hi {name},\n\n{opening} {ask}\n\nLet me know what works."
+    address = appt.get("proposed_address")
+    offer = (f"I could do {slots}" + (f" at {address}" if address else "") + ".") if slots else \
+        "I'm flexible — send me a couple of times that suit you."
+    return f"Hi {name},\n\n{offer}\n\nLet me know which works best and I'll confirm."
+
+
 # ── Confirmation detection ────────────────────────────────────────────────────
 
+def _agent_timezone() -> str:
+    conn = get_conn()
+    row  = conn.execute("SELECT value FROM config WHERE key='timezone'").fetchone()
+    conn.close()
+    return (row["value"] if row else None) or "America/Los_Angeles"
+
+
 def _resolve_day_reference(day_text: str, proposed_datetime: str) -> tuple[str, str]:
     """
-    Given Claude's proposed_date_text and proposed_datetime, resolve any
-    day-of-week reference to the actual next upcoming date.
+    Given Claude's proposed_date_text and proposed_datetime, resolve the date
+    reference in the text ("Saturday", "this Saturday", "March 10", "3/10",
+    "tomorrow") to an actual date in the agent's timezone via timeparse.
 
     Returns (corrected_proposed_datetime, corrected_proposed_date_text).
     This is purely deterministic Python — no AI involvement — so it cannot hallucinate.
     """
-    today = datetime.date.today()
-    now   = datetime.datetime.now()
+    found = timeparse.parse(day_text or "", timeparse.now(_agent_timezone()))
+    if not found:
+        return proposed_datetime, day_text  # no date reference found, pass through
+    date, time = found[0]["date"], found[0]["time"]
 
-    DOW = {
-        "monday": 0, "tuesday": 1, "wednesday": 2, "thursday": 3,
-        "friday": 4, "saturday": 5, "sunday": 6,
-    }
+    # Time: prefer text over proposed_datetime (text comes from agent's email,
+    # proposed_datetime time component is often hallucinated by Claude)
+    if time is None:
+        time = (10, 0)  # sensible default: 10am
+        if proposed_datetime:
+            try:
+                parsed = datetime.datetime.fromisoformat(proposed_datetime.replace("Z", "").replace("+00:00", ""))
+                time = (parsed.hour, parsed.minute)
+            except Exception:
+                pass
+
+    resolved_iso  = datetime.datetime(date.year, date.month, date.day, *time).isoformat()
+    resolved_text = timeparse.format_text(date, time)  # "Saturday, March 7 at 10:00 AM"
 
-    # Try to find a day-of-week name in the text
-    text_lower = (day_text or "").lower()
-    matched_dow = next((name for name in DOW if name in text_lower), None)
+    print(f"[ai] resolve_day_reference: '{day_text}' → {resolved_text} (was: {proposed_datetime})")
+    return resolved_iso, resolved_text
 
-    if not matched_dow:
-        return proposed_datetime, day_text  # no day reference found, pass through
 
-    target_dow = DOW[matched_dow]
-    days_ahead = (target_dow - today.weekday()) % 7
-    if days_ahead == 0:
-        days_ahead = 7  # "Saturday" means NEXT Saturday, not today
-    next_day = today + datetime.timedelta(days=days_ahead)
+# Clear-cut replies are settled locally, without Claude
+SHORT_REPLY_CHARS = 300   # longer replies go to Claude even if they say "works"
+MAX_DATE_HINTS    = 8
 
-    # Extract time — prefer text over proposed_datetime (text comes from agent's email,
-    # proposed_datetime time component is often hallucinated by Claude)
-    hour, minute = 10, 0  # sensible default: 10am
-
-    # Try text first — most reliable source
-    time_match = re.search(r'(\d{1,2})(?::(\d{2}))?\s*(am|pm)', text_lower)
-    if time_match:
-        h = int(time_match.group(1))
-        m = int(time_match.group(2) or 0)
-        period = time_match.group(3)
-        if period == "pm" and h != 12:
-            h += 12
-        elif period == "am" and h == 12:
-            h = 0
-        hour, minute = h, m
-    elif proposed_datetime:
-        # Fall back to proposed_datetime only if no time found in text
-        try:
-            parsed = datetime.datetime.fromisoformat(proposed_datetime.replace("Z", "").replace("+00:00", ""))
-            hour, minute = parsed.hour, parsed.minute
-        except Exception:
-            pass
+_MEETING_TYPES = [
+    ("open_house", re.compile(r"\bopen\s{1,3}house", re.IGNORECASE)),
+    ("call",       re.compile(r"\b(?:call|phone|zoom)\b", re.IGNORECASE)),
+    ("coffee",     re.compile(r"\bcoffee\b", re.IGNORECASE)),
+]
 
-    resolved_dt = datetime.datetime(next_day.year, next_day.month, next_day.day, hour, minute, 0)
-    resolved_iso = resolved_dt.isoformat()
 
-    # Format human-readable: "Saturday, March 7 at 10:00 AM"
-    time_str = resolved_dt.strftime("%-I:%M %p")
-    date_str = resolved_dt.strftime("%A, %B %-d")
-    resolved_text = f"{date_str} at {time_str}"
+def _sender(msg: dict) -> str:
+    return email.utils.parseaddr(msg.get("from") or "")[1].lower()
 
-    print(f"[ai] resolve_day_reference: '{day_text}' → {resolved_text} (was: {proposed_datetime})")
-    return resolved_iso, resolved_text
+
+def _meeting_type(text: str) -> str:
+    return next((kind for kind, rx in _MEETING_TYPES if rx.search(text)), "showing")
 
 
-def detect_confirmation(thread_messages: list[dict]) -> list[dict]:
+def _local_confirmation(thread_messages: list[dict], tz: str) -> Optional[dict]:
     """
-    Ask Claude if this thread contains one or more client confirmations to meet.
+    Settle a clear-cut confirmation without Claude. The newest message must be
+    a short reply that agrees without hedging (timeparse.is_plain_yes), and
+    the slot must be one the other party's latest message offered with a
+    high-confidence date and time:
+
+      "Saturday at 2 works"        one high-confidence datetime in the reply,
+                                   and it is one of the offered slots
+      "Saturday works" / "2pm works" / "Sounds good, see you then"
+                                   exactly one offered slot matches the day/time
+
+    A reply that names another kind of meeting than the offer ("I'll call
+    you Saturday" to a showing) isn't clear-cut either.
+    Returns an item shaped like detect_confirmation's, or None to ask Claude.
+    """
+    last  = thread_messages[-1]
+    reply = textguard.strip_quoted(last.get("body"))
+    if not reply or len(reply) > SHORT_REPLY_CHARS or not timeparse.is_plain_yes(reply):
+        return None
+    ref  = timeparse.reference(last.get("date"), tz)
+    said = timeparse.parse(reply, ref)
 
-    Returns a LIST of confirmed appointments (supports multi-appointment threads,
-    e.g. client agrees to 2 open houses on different days).
+    other = next((m for m in reversed(thread_messages[:-1]) if _sender(m) != _sender(last)), None)
+    if not other:
+        return None
+    proposal = textguard.strip_quoted(other.get("body"))
+    offered  = {c["datetime"]: c for c in timeparse.parse(proposal, timeparse.reference(other.get("date"), tz))
+                if c["datetime"] and c["confidence"] == "high"}
+
+    timed = {c["datetime"]: c for c in said if c["datetime"]}
+    if timed:
+        if len(timed) != 1:
+            return None
+        pick = next(iter(timed.values()))
+        if pick["confidence"] != "high" or pick["datetime"] not in offered:
+            return None
+    else:
+        days, hours = {c["date"] for c in said}, set(timeparse.times(reply))
+        matches = [c for c in offered.values()
+                   if (not days or c["date"] in days) and (not hours or c["time"] in hours)]
+        if len(matches) != 1:
+            return None
+        pick = matches[0]
+
+    kind, offered_kind = _meeting_type(reply), _meeting_type(proposal)
+    if kind != "showing" and kind != offered_kind:
+        return None
+    if pick["datetime"] < ref.isoformat():
+        return None  # agreeing to a slot that has already passed — let Claude read it
+    first_line = reply.splitlines()[0][:100]
+    return {
+        "confirmed":          True,
+        "meeting_type":       offered_kind,
+        "proposed_datetime":  pick["datetime"],
+        "proposed_date_text": pick["date_text"],
+        "proposed_address":   None,
+        "client_name":        None,
+        "client_email":       None,
+        "partner_name":       None,
+        "context_snippet":    f'Replied "{first_line}" — {pick["date_text"]}',
+        "confidence":         "high",
+    }
 
-    Intentionally lenient: if the client agrees to ANY day/time that was
-    proposed (even just "Saturday works"), that counts. The agent will verify
-    and fill in the exact time during the Accept modal — that is the final
-    quality gate. We'd rather surface a pending appointment for agent review
-    than silently miss a real confirmation.
 
-    Date resolution is done in Python after Claude responds — never trusted
-    to Claude — to prevent hallucination of wrong dates.
-    """
-    if not thread_messages:
-        return []
+def _date_hints(thread_messages: list[dict], tz: str) -> str:
+    """Dates timeparse found in the newest messages, as a prompt block ("" if none)."""
+    lines = []
+    for m in thread_messages[-3:]:
+        ref = timeparse.reference(m.get("date"), tz)
+        for c in timeparse.parse(textguard.strip_quoted(m.get("body")), ref):
+            resolved = f"{c['date_text']} = {c['datetime']}" if c["datetime"] else f"{c['date_text']} (no time)"
+            unsure   = "" if c["confidence"] == "high" else " (uncertain)"
+            lines.append(f'- "{c["span"]}" in message from {m.get("from") or "unknown"} → {resolved}{unsure}')
+    if not lines:
+        return ""
+    return "LOCAL DATE HINTS:\n" + "\n".join(lines[-MAX_DATE_HINTS:]) + "\n\n"
 
-    today     = datetime.date.today()
-    today_str = today.strftime("%A, %B %-d, %Y")  # e.g. "Friday, March 6, 2026"
 
-    thread_text = "\n\n---\n\n".join([
-        f"From: {m['from']}\nDate: {m['date']}\n\n{m['body']}"
-        for m in thread_messages[-6:]
-    ])
+def _scan_thread_text(thread_messages: list[dict], thread_id: Optional[str], last: int, max_tokens: int) -> str:
+    """Rolling summary + newest messages for a real Gmail thread (summaries.py);
+    synthetic threads without an id get the last-N window within max_tokens (prompting.py)."""
+    if thread_id:
+        import summaries
+        return summaries.thread_prompt(thread_messages, thread_id)
+    return prompting.thread_text(thread_messages, max_tokens, last)
 
-    prompt = f"""Analyze this real estate email thread. Detect ALL appointments the client has agreed to — there may be more than one (e.g. they agreed to two open houses on different days).
 
-TODAY'S DATE: {today_str}
+CONFIRMATION_INSTRUCTIONS = """Analyze the real estate email thread you are given. Detect ALL appointments the client has agreed to — there may be more than one (e.g. they agreed to two open houses on different days).
 
-Email thread:
-{thread_text[:3500]}
+Long threads start with a summary of the earlier messages — appointments agreed there still count.
 
 IMPORTANT RULES:
 - "Saturday works", "that works for me", "sounds good", "see you then", "confirmed", "I'll be there" — ALL count as confirmations.
 - The client does NOT need to repeat the exact time — if an agent proposed a time and the client agreed to the day, use the agent's proposed time.
 - A DAY confirmation without an exact time still counts — extract whatever time the agent proposed.
 - If the client confirmed MULTIPLE appointments (e.g. "Saturday AND Sunday both work"), return ALL of them as separate items in the array.
-- For proposed_datetime: use YYYY-MM-DDTHH:MM:SS format based on TODAY ({today_str}). If the client said "Saturday", compute the next Saturday from today's date.
+- For proposed_datetime: use YYYY-MM-DDTHH:MM:SS format based on TODAY'S DATE (given above the thread). If the client said "Saturday", compute the next Saturday from today's date.
 - For proposed_date_text: use the day name ONLY (e.g. "Saturday at 2:00 PM") — do NOT include a month/date number. Python will resolve the exact date.
+- LOCAL DATE HINTS, when given, were resolved by code from each message's Date header — use their YYYY-MM-DDTHH:MM:SS values rather than computing dates yourself.
 
 Respond with ONLY a JSON array (even if just one appointment), no other text:
 [
-  {{
+  {
     "confirmed": true or false,
     "meeting_type": "showing" | "call" | "open_house" | "coffee" | "other" | null,
     "proposed_datetime": "YYYY-MM-DDTHH:MM:SS" or null,
@@ -388,19 +660,49 @@ Respond with ONLY a JSON array (even if just one appointment), no other text:
     "partner_name": "partner or spouse if mentioned" or null,
     "context_snippet": "one sentence: what was agreed",
     "confidence": "high" | "medium" | "low"
-  }}
+  }
 ]
 
 If nothing is confirmed, return an empty array: []
 confidence="low" only if you genuinely cannot tell if the client agreed to anything."""
 
-    response = _claude().messages.create(
-        model="claude-sonnet-4-5",
-        max_tokens=600,
-        messages=[{"role": "user", "content": prompt}],
-    )
 
-    text = response.content[0].text.strip()
+def detect_confirmation(thread_messages: list[dict], thread_id: Optional[str] = None) -> list[dict]:
+    """
+    Ask Claude if this thread contains one or more client confirmations to meet.
+
+    Returns a LIST of confirmed appointments (supports multi-appointment threads,
+    e.g. client agrees to 2 open houses on different days).
+
+    Intentionally lenient: if the client agrees to ANY day/time that was
+    proposed (even just "Saturday works"), that counts. The agent will verify
+    and fill in the exact time during the Accept modal — that is the final
+    quality gate. We'd rather surface a pending appointment for agent review
+    than silently miss a real confirmation.
+
+    Date resolution is done in Python after Claude responds — never trusted
+    to Claude — to prevent hallucination of wrong dates. Short, unhedged
+    replies with one clear slot never reach Claude (_local_confirmation);
+    otherwise the dates timeparse found go in as LOCAL DATE HINTS.
+    """
+    if not thread_messages:
+        return []
+
+    tz    = _agent_timezone()
+    local = _local_confirmation(thread_messages, tz)
+    if local:
+        print(f"[ai] detect_confirmation: resolved locally — {local['context_snippet'][:80]}")
+        return [local]
+
+    today_str = timeparse.now(tz).strftime("%A, %B %-d, %Y")  # e.g. "Friday, March 6, 2026"
+
+    prompt = f"""TODAY'S DATE: {today_str}
+
+{_date_hints(thread_messages, tz)}Email thread:
+{_scan_thread_text(thread_messages, thread_id, 6, prompting.SCAN_TOKENS)}"""
+
+    text = llm.complete("confirmation", prompt, max_tokens=600,
+                        system=llm.prefix(CONFIRMATION_INSTRUCTIONS))
     if "```" in text:
         text = text.split("```")[1].replace("json", "").strip()
 
@@ -415,12 +717,17 @@ confidence="low" only if you genuinely cannot tell if the client agreed to anyth
         print(f"[ai] detect_confirmation JSON parse error: {e} — raw: {text[:200]}")
         return []
 
+    return _confirmed_appointments(raw, "detect_confirmation")
+
+
+def _confirmed_appointments(raw: list, label: str) -> list[dict]:
+    """Keep confirmed, not-low-confidence items and resolve their dates in Python."""
     results = []
     for data in raw:
-        if not data.get("confirmed"):
+        if not isinstance(data, dict) or not data.get("confirmed"):
             continue
         if data.get("confidence") == "low":
-            print(f"[ai] detect_confirmation: low confidence, skipping — {data.get('context_snippet','')[:80]}")
+            print(f"[ai] {label}: low confidence, skipping — {data.get('context_snippet','')[:80]}")
             continue
 
         # ── Resolve day-of-week to actual date in Python — no hallucination ──────
@@ -431,88 +738,197 @@ confidence="low" only if you genuinely cannot tell if the client agreed to anyth
         data["proposed_datetime"]  = corrected_dt
         data["proposed_date_text"] = corrected_text
 
-        print(f"[ai] detect_confirmation: confirmed ({data.get('confidence')}) — {data.get('context_snippet','')[:80]}")
+        print(f"[ai] {label}: confirmed ({data.get('confidence')}) — {data.get('context_snippet','')[:80]}")
         print(f"[ai]   → {data['proposed_date_text']} | {data['proposed_datetime']}")
         results.append(data)
 
     return results
 
 
-def detect_availability_inquiry(thread_messages: list[dict]) -> Optional[dict]:
+def _inquiry_or_none(data) -> Optional[dict]:
+    if not isinstance(data, dict) or not data.get("is_inquiry") or data.get("confidence") == "low":
+        return None
+    return data
+
+
+# ── Unified thread classification ─────────────────────────────────────────────
+
+CLASSIFY_INSTRUCTIONS = """Classify the real estate email thread you are given. In one pass, detect:
+1. ALL appointments the client has agreed to (confirmations)
+2. whether the CLIENT is asking about available times / to schedule a showing or visit (availability inquiry)
+
+Long threads start with a summary of the earlier messages — appointments agreed there still count.
+
+Confirmation rules:
+- "Saturday works", "that works for me", "sounds good", "see you then", "confirmed", "I'll be there" — ALL count as confirmations.
+- The client does NOT need to repeat the exact time — if an agent proposed a time and the client agreed to the day, use the agent's proposed time.
+- If the client confirmed MULTIPLE appointments, return ALL of them as separate items.
+- For proposed_datetime: use YYYY-MM-DDTHH:MM:SS format based on TODAY'S DATE (given above the thread). If the client said "Saturday", compute the next Saturday from today's date.
+- For proposed_date_text: use the day name ONLY (e.g. "Saturday at 2:00 PM") — do NOT include a month/date number.
+- LOCAL DATE HINTS, when given, were resolved by code from each message's Date header — use their YYYY-MM-DDTHH:MM:SS values rather than computing dates yourself.
+
+Inquiry rules:
+- is_inquiry=true only if the client is actively requesting to schedule or asking about times.
+- General interest without a scheduling request does NOT count.
+
+Respond with ONLY a JSON object, no other text:
+{
+  "verdict": "confirmation" | "inquiry" | "nothing",
+  "appointments": [
+    {
+      "confirmed": true or false,
+      "meeting_type": "showing" | "call" | "open_house" | "coffee" | "other" | null,
+      "proposed_datetime": "YYYY-MM-DDTHH:MM:SS" or null,
+      "proposed_date_text": "day and time only, e.g. 'Saturday at 2:00 PM'",
+      "proposed_address": "property address" or null,
+      "client_name": "client first/full name" or null,
+      "client_email": "client email address" or null,
+      "partner_name": "partner or spouse if mentioned" or null,
+      "context_snippet": "one sentence: what was agreed",
+      "confidence": "high" | "medium" | "low"
+    }
+  ],
+  "inquiry": {
+    "is_inquiry": true,
+    "meeting_type": "showing" | "call" | "open_house" | "other" | null,
+    "proposed_address": "property address if mentioned" or null,
+    "client_name": "client first/full name" or null,
+    "client_email": "client email address" or null,
+    "partner_name": "partner or spouse if mentioned" or null,
+    "context_snippet": "one sentence: what they are asking about",
+    "confidence": "high" | "medium" | "low"
+  } or null
+}
+
+verdict is "confirmation" if appointments is non-empty, else "inquiry" if inquiry is set, else "nothing" (with appointments [] and inquiry null).
+confidence="low" only if you genuinely cannot tell."""
+
+CLASSIFY_BATCH_INSTRUCTIONS = CLASSIFY_INSTRUCTIONS + """
+
+BATCH: you are given SEVERAL threads. Each starts with a line "=== THREAD <thread id> ===" and runs until the next such line.
+Classify every thread on its own — never carry names, dates or addresses from one thread into another.
+Respond with ONLY one JSON object whose keys are the thread ids and whose values are each thread's object in the format above, e.g.
+{"<thread id>": {"verdict": "nothing", "appointments": [], "inquiry": null}, "<thread id>": {...}}"""
+
+# Background scans pack up to this many short threads (prompting.BATCH_THREAD_TOKENS) per call
+SCAN_BATCH_THREADS = int(os.getenv("SCAN_BATCH_THREADS", "8"))
+BATCH_OUTPUT_TOKENS = 500    # per packed thread
+_NOTHING = {"verdict": "nothing", "appointments": [], "inquiry": None}
+
+
+def classify_thread(thread_messages: list[dict], thread_id: Optional[str] = None) -> dict:
     """
-    Ask Claude if this thread contains a client asking about available times/slots.
-    Returns extracted data dict or None if not an availability inquiry.
+    One Claude call per scanned thread: confirmations AND availability inquiry.
+    Replaces running detect_confirmation and a separate inquiry check back to
+    back on the same messages. With a thread_id, older messages arrive as a
+    rolling summary (summaries.py) so the prompt stays the same size.
+    A clear-cut "Saturday at 2 works" reply is answered locally instead.
+
+    Returns {"verdict": "confirmation"|"inquiry"|"nothing",
+             "appointments": [...],   # same items as detect_confirmation
+             "inquiry": {...}|None}   # is_inquiry, meeting_type, proposed_address, client_*, confidence
     """
     if not thread_messages:
-        return None
+        return dict(_NOTHING)
 
-    thread_text = "\n\n---\n\n".join([
-        f"From: {m['from']}\nDate: {m['date']}\n\n{m['body']}"
-        for m in thread_messages[-4:]
-    ])
+    tz    = _agent_timezone()
+    local = _local_confirmation(thread_messages, tz)
+    if local:
+        return _resolved_locally(local)
+    return _classify_one(_classify_section(thread_messages, thread_id, tz), tz)
 
-    prompt = f"""Analyze this email thread. Determine if the CLIENT is asking about available times, scheduling a showing, or requesting to set up a visit/tour for a property.
 
-Email thread:
-{thread_text[:2500]}
+def _resolved_locally(local: dict) -> dict:
+    """classify_thread's result for a confirmation _local_confirmation found."""
+    print(f"[ai] classify_thread: resolved locally — {local['context_snippet'][:80]}")
+    return {"verdict": "confirmation", "appointments": [local], "inquiry": None}
 
-Respond with ONLY a JSON object, no other text:
-{{
-  "is_inquiry": true or false,
-  "meeting_type": "showing" | "call" | "open_house" | "other" | null,
-  "proposed_address": "property address if mentioned" or null,
-  "client_name": "client first/full name" or null,
-  "client_email": "client email address" or null,
-  "partner_name": "partner or spouse if mentioned" or null,
-  "context_snippet": "one sentence: what they are asking about",
-  "confidence": "high" | "medium" | "low"
-}}
-
-Set is_inquiry=true only if the client is actively requesting to schedule or asking about times.
-General interest without a scheduling request does NOT count."""
-
-    response = _claude().messages.create(
-        model="claude-sonnet-4-5",
-        max_tokens=350,
-        messages=[{"role": "user", "content": prompt}],
-    )
-
-    text = response.content[0].text.strip()
+
+def _classify_section(thread_messages: list[dict], thread_id: Optional[str], tz: str) -> str:
+    """One thread's part of a classify prompt: its date hints and text."""
+    return f"""{_date_hints(thread_messages, tz)}Email thread:
+{_scan_thread_text(thread_messages, thread_id, 6, prompting.SCAN_TOKENS)}"""
+
+
+def _today_line(tz: str) -> str:
+    return f"TODAY'S DATE: {timeparse.now(tz).strftime('%A, %B %-d, %Y')}\n\n"
+
+
+def _json_object(text: str, label: str) -> Optional[dict]:
     if "```" in text:
         text = text.split("```")[1].replace("json", "").strip()
-
     try:
-        data = json.loads(text)
+        raw = json.loads(text)
+        if not isinstance(raw, dict):
+            raise ValueError("expected a JSON object")
+        return raw
     except Exception as e:
-        print(f"[ai] detect_availability_inquiry JSON parse error: {e} — raw: {text[:200]}")
+        print(f"[ai] {label} JSON parse error: {e} — raw: {text[:200]}")
         return None
 
-    if not data.get("is_inquiry") or data.get("confidence") == "low":
-        return None
 
-    return data
+def _classification(raw: dict, label: str) -> dict:
+    appointments = raw.get("appointments")
+    appointments = _confirmed_appointments(appointments if isinstance(appointments, list) else [], label)
+    inquiry = _inquiry_or_none(raw.get("inquiry"))
+    verdict = "confirmation" if appointments else "inquiry" if inquiry else "nothing"
+    return {"verdict": verdict, "appointments": appointments, "inquiry": inquiry}
 
 
-def _build_avail_text(avail_raw: Optional[str]) -> str:
-    """Format availability windows from JSON config into a readable string."""
-    if not avail_raw:
-        return "weekdays 9am–6pm"
-    try:
-        windows = json.loads(avail_raw)
-        enabled = [w for w in windows if w.get("enabled")]
-        if not enabled:
-            return "weekdays 9am–6pm"
-        DAY_SHORT = {"monday":"Mon","tuesday":"Tue","wednesday":"Wed",
-                     "thursday":"Thu","friday":"Fri","saturday":"Sat","sunday":"Sun"}
-        return ", ".join(
-            f"{DAY_SHORT.get(w['day'], w['day'])} {w['start']}–{w['end']}"
-            for w in enabled
-        )
-    except Exception:
-        return "weekdays 9am–6pm"
+def _classify_one(section: str, tz: str) -> dict:
+    text = llm.complete("thread_classify", _today_line(tz) + section, max_tokens=800,
+                        system=llm.prefix(CLASSIFY_INSTRUCTIONS))
+    raw = _json_object(text, "classify_thread")
+    return _classification(raw, "classify_thread") if raw is not None else dict(_NOTHING)
+
+
+def classify_threads(threads: dict[str, list[dict]]) -> dict[str, dict]:
+    """
+    classify_thread for many threads at once, keyed by thread id — the
+    background scan's path. Short threads (prompting.BATCH_THREAD_TOKENS)
+    are packed SCAN_BATCH_THREADS to one "thread_classify_batch" call, so
+    the instructions are paid once per pack instead of once per thread.
+    Long threads, and any thread a pack's answer leaves out or garbles, get
+    their own classify_thread call. llm.DEFERRED propagates as it does there.
+    """
+    tz = _agent_timezone()
+    results, short = {}, {}
+    for thread_id, messages in threads.items():
+        if not messages:
+            results[thread_id] = dict(_NOTHING)
+            continue
+        local = _local_confirmation(messages, tz)
+        if local:
+            results[thread_id] = _resolved_locally(local)
+            continue
+        section = _classify_section(messages, thread_id, tz)
+        if prompting.estimate_tokens(section) > prompting.BATCH_THREAD_TOKENS:
+            results[thread_id] = _classify_one(section, tz)
+        else:
+            short[thread_id] = section
+
+    packs = list(short.items())
+    for i in range(0, len(packs), SCAN_BATCH_THREADS):
+        pack = dict(packs[i:i + SCAN_BATCH_THREADS])
+        if len(pack) == 1:
+            results.update({t: _classify_one(sec, tz) for t, sec in pack.items()})
+            continue
+        prompt = _today_line(tz) + "\n\n".join(f"=== THREAD {t} ===\n{sec}" for t, sec in pack.items())
+        text = llm.complete("thread_classify_batch", prompt, max_tokens=BATCH_OUTPUT_TOKENS * len(pack),
+                            system=llm.prefix(CLASSIFY_BATCH_INSTRUCTIONS))
+        raw = _json_object(text, "classify_threads") or {}
+        missing = [t for t in pack if not isinstance(raw.get(t), dict)]
+        for t in pack:
+            if t not in missing:
+                results[t] = _classification(raw[t], "classify_threads")
+        if missing:
+            print(f"[ai] classify_threads: {len(missing)}/{len(pack)} thread(s) missing from the batch answer "
+                  f"— classifying them one by one")
+            results.update({t: _classify_one(pack[t], tz) for t in missing})
+    return results
 
 
-def draft_availability_options(appointment_id: int) -> dict:
+def draft_availability_options(appointment_id: int, regenerate: bool = False) -> dict:
     """
     Claude drafts a reply offering 2-3 specific available time slots to a client
     who asked about scheduling. Frames it as proactive offer, not an apology.
@@ -520,7 +936,6 @@ def draft_availability_options(appointment_id: int) -> dict:
     """
     conn = get_conn()
     appt = conn.execute("SELECT * FROM appointments WHERE id=?", (appointment_id,)).fetchone()
-    cfg  = {r["key"]: r["value"] for r in conn.execute("SELECT key, value FROM config").fetchall()}
     conn.close()
 
     if not appt:
@@ -529,8 +944,7 @@ def draft_availability_options(appointment_id: int) -> dict:
 
     profile    = get_agent_profile()
     agent_name = profile.get("agent_name", "Your Agent")
-    timezone   = cfg.get("timezone", "America/Los_Angeles")
-    avail_text = _build_avail_text(cfg.get("availability_windows"))
+    timezone, avail_text = listing_context.availability()
 
     sig_enabled = profile.get("agent_signature_enabled", "false") == "true"
     signature   = profile.get("agent_signature", "").strip() if sig_enabled else ""
@@ -538,10 +952,12 @@ def draft_availability_options(appointment_id: int) -> dict:
     client_name = appt.get("client_name") or "there"
     address     = appt.get("proposed_address") or "the property"
 
-    prompt = f"""You are {agent_name}, a real estate agent. A client has asked about your availability for a showing or visit.
+    # Agent + availability first (shared prefix), then this request
+    system = llm.prefix(f"""You are {agent_name}, a real estate agent.
+Your availability ({timezone}): {avail_text}""")
+    prompt = f"""A client has asked about your availability for a showing or visit.
 
 Property: {address}
-Your availability ({timezone}): {avail_text}
 Today: {today_str}
 
 Write a SHORT, warm reply offering 2-3 SPECIFIC available time slots in the next 1–2 weeks.
@@ -555,13 +971,12 @@ Rules:
 - Under 80 words total
 - No subject line, no signature, plain text only"""
 
-    response = _claude().messages.create(
-        model="claude-sonnet-4-5",
-        max_tokens=200,
-        messages=[{"role": "user", "content": prompt}],
-    )
-
-    body = response.content[0].text.strip()
+    fallback = False
+    try:
+        body = llm.complete("availability_options", prompt, max_tokens=200, system=system, bypass=regenerate)
+    except llm.CircuitOpen:
+        print(f"[ai] Appointment {appointment_id}: Claude unavailable — template availability reply")
+        body, fallback = _fallback_times_body(appt, profile, alternative=False), True
     if signature:
         body = body + "\n\n" + signature
 
@@ -590,10 +1005,11 @@ Rules:
             print(f"[ai] Gmail draft push failed for availability options: {e}")
     conn.close()
 
-    return {"ok": True, "draft_id": draft_id, "gmail_draft_id": gmail_draft_id, "subject": subject, "body": body}
+    return {"ok": True, "draft_id": draft_id, "gmail_draft_id": gmail_draft_id, "subject": subject, "body": body,
+            **({"fallback": True} if fallback else {})}
 
 
-def draft_alternative_times(appointment_id: int) -> dict:
+def draft_alternative_times(appointment_id: int, regenerate: bool = False) -> dict:
     """
     Claude drafts a reply suggesting 2-3 alternative meeting times
     based on the agent's availability windows and the blocked proposed time.
@@ -601,7 +1017,6 @@ def draft_alternative_times(appointment_id: int) -> dict:
     """
     conn = get_conn()
     appt = conn.execute("SELECT * FROM appointments WHERE id=?", (appointment_id,)).fetchone()
-    cfg  = {r["key"]: r["value"] for r in conn.execute("SELECT key, value FROM config").fetchall()}
     conn.close()
 
     if not appt:
@@ -610,8 +1025,7 @@ def draft_alternative_times(appointment_id: int) -> dict:
 
     profile    = get_agent_profile()
     agent_name = profile.get("agent_name", "Your Agent")
-    timezone   = cfg.get("timezone", "America/Los_Angeles")
-    avail_text = _build_avail_text(cfg.get("availability_windows"))
+    timezone, avail_text = listing_context.availability()
 
     sig_enabled = profile.get("agent_signature_enabled", "false") == "true"
     signature   = profile.get("agent_signature", "").strip() if sig_enabled else ""
@@ -619,10 +1033,12 @@ def draft_alternative_times(appointment_id: int) -> dict:
 
     proposed = appt.get("proposed_date_text") or appt.get("proposed_datetime") or "the proposed time"
 
-    prompt = f"""You are {agent_name}, a real estate agent. The proposed meeting time doesn't work and you need to suggest alternatives.
+    # Agent + availability first (shared prefix), then this request
+    system = llm.prefix(f"""You are {agent_name}, a real estate agent.
+Your availability ({timezone}): {avail_text}""")
+    prompt = f"""The proposed meeting time doesn't work and you need to suggest alternatives.
 
 Proposed time that doesn't work: {proposed}
-Your availability ({timezone}): {avail_text}
 Today: {today_str}
 
 Write a SHORT, warm reply suggesting 2-3 SPECIFIC alternative days and times in the next 1–2 weeks that fall within your availability. Be friendly, not stiff.
@@ -634,13 +1050,12 @@ Rules:
 - End with a simple "let me know what works" close
 - No subject line, no signature, plain text only"""
 
-    response = _claude().messages.create(
-        model="claude-sonnet-4-5",
-        max_tokens=250,
-        messages=[{"role": "user", "content": prompt}],
-    )
-
-    body = response.content[0].text.strip()
+    fallback = False
+    try:
+        body = llm.complete("alternative_times", prompt, max_tokens=250, system=system, bypass=regenerate)
+    except llm.CircuitOpen:
+        print(f"[ai] Appointment {appointment_id}: Claude unavailable — template alternative times")
+        body, fallback = _fallback_times_body(appt, profile, alternative=True), True
     if signature:
         body = body + "\n\n" + signature
 
@@ -678,6 +1093,7 @@ Rules:
         "gmail_draft_id": gmail_draft_id,
         "subject": subject,
         "body": body,
+        **({"fallback": True} if fallback else {}),
     }
 
 
@@ -719,22 +1135,12 @@ STRICT RULES — violating these means the email is wrong:
 """
 
     try:
-        response = _claude().messages.create(
-            model="claude-sonnet-4-5",
-            max_tokens=100,
-            messages=[{"role": "user", "content": prompt}],
-        )
-        prose = response.content[0].text.strip()
+        prose = llm.complete("confirmation_prose", prompt, max_tokens=100)
         lines = [l.strip() for l in prose.split("\n") if l.strip()]
 
         # Safety check: if Claude snuck a time/day reference into the prose, strip it
-        TIME_PATTERN = re.compile(
-            r'\b(\d{1,2}(:\d{2})?\s*(am|pm|AM|PM)|'
-            r'(monday|tuesday|wednesday|thursday|friday|saturday|sunday|'
-            r'january|february|march|april|may|june|july|august|september|october|november|december)'
-            r')\b', re.IGNORECASE
-        )
-        lines = [l for l in lines if not TIME_PATTERN.search(l)]
+        from textguard import TIME_RE
+        lines = [l for l in lines if not TIME_RE.search(l[:2000])]
 
         opening = lines[0] if lines else f"Looking forward to seeing you{partner_str}!"
         closing = lines[1] if len(lines) > 1 else "Let me know if you have any questions or need to make any changes."
@@ -771,7 +1177,7 @@ def mtype_label(mtype: str) -> str:
 
 def _get_thread_id(creds, msg_id: str) -> Optional[str]:
     try:
-        service = build("gmail", "v1", credentials=creds, cache_discovery=False)
+        service = google_client.gmail(creds)
         msg = service.users().messages().get(
             userId="me", id=msg_id, format="metadata", metadataHeaders=["threadId"]
         ).execute()
@@ -782,7 +1188,7 @@ def _get_thread_id(creds, msg_id: str) -> Optional[str]:
 
 def _create_gmail_draft(creds, to: str, subject: str, body: str,
                         thread_id: Optional[str] = None) -> str:
-    service = build("gmail", "v1", credentials=creds, cache_discovery=False)
+    service = google_client.gmail(creds)
 
     from gmail import strip_html
     msg = email.mime.text.MIMEText(strip_html(body))
@@ -6,11 +6,12 @@ Requires the calendar.events scope (added in v0.4.2).
 """
 
 import datetime
-from googleapiclient.discovery import build
+
+import google_client
 
 
 def get_service(creds):
-    return build("calendar", "v3", credentials=creds, cache_discovery=False)
+    return google_client.calendar(creds)
 
 
 def create_event(creds, summary: str, location: str, start_dt: str,
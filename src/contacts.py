@@ -0,0 +1,175 @@
+"""
+contacts.py — Contact identity for Lucilease.
+
+One `contacts` row per person, keyed by normalized email address. Leads,
+clients, drafts and appointments point at it through `contact_id`, so
+"is this a known sender?" and "everything from this person" are indexed
+lookups instead of lower(...) scans over several tables.
+
+contact_id is also filled by SQLite triggers (see db.init_db) for writers that
+bypass this module; the helpers here add what SQL can't — phone normalization
+and display names.
+"""
+
+import datetime
+import re
+import string
+from typing import Optional
+
+from db import CONTACT_LINKS, EMAIL_BLANKS, EMAIL_DELIMITERS
+
+
+# ── Normalization ─────────────────────────────────────────────────────────────
+
+_ASCII_LOWER = str.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+_DELIMITERS  = str.maketrans({c: " " for c in EMAIL_DELIMITERS})
+
+
+def normalize_email(raw: Optional[str]) -> Optional[str]:
+    """
+    'Jane Doe <Jane@X.com>' → 'jane@x.com'. Returns None if the value is blank.
+
+    The address is the run of non-delimiter characters around the first "@";
+    a value with no "@" is kept whole. db.email_sql applies the same rule in
+    the contact-link triggers — change both together.
+    """
+    raw = (raw or "").strip(EMAIL_BLANKS)
+    if not raw:
+        return None
+    if "@" not in raw:
+        return raw.translate(_ASCII_LOWER)
+    pre, post = raw.translate(_DELIMITERS).split("@", 1)
+    local  = pre.rsplit(" ", 1)[-1]
+    domain = post.split(" ", 1)[0].rstrip(".")
+    return f"{local}@{domain}".translate(_ASCII_LOWER)
+
+
+def normalize_phone(raw: Optional[str], default_country: str = "1") -> Optional[str]:
+    """
+    Normalize a phone number to E.164 ('+18055550199').
+    Bare 10-digit numbers are assumed to be North American (NANP).
+    Returns None for anything that can't be a real number.
+    """
+    raw = (raw or "").strip()
+    if not raw:
+        return None
+    digits = re.sub(r"\D", "", raw)
+    if raw.startswith("+"):
+        return f"+{digits}" if 8 <= len(digits) <= 15 else None
+    if raw.startswith("00") and 10 <= len(digits) - 2 <= 15:
+        return f"+{digits[2:]}"
+    if len(digits) == 10:
+        return f"+{default_country}{digits}"
+    if len(digits) == 11 and digits.startswith(default_country):
+        return f"+{digits}"
+    return None
+
+
+# ── Upsert / lookup ───────────────────────────────────────────────────────────
+
+def upsert_contact(conn, email: str, name: Optional[str] = None,
+                   phone: Optional[str] = None) -> Optional[int]:
+    """
+    Create or refresh the contact for `email` and return its id.
+    Existing names are kept; a newly seen phone replaces the stored one.
+    Caller commits.
+    """
+    addr = normalize_email(email)
+    if not addr:
+        return None
+    now = datetime.datetime.utcnow().isoformat(timespec="seconds") + "Z"
+    conn.execute("""
+        INSERT INTO contacts (email, name, phone_e164, first_seen_at, last_seen_at)
+        VALUES (?,?,?,?,?)
+        ON CONFLICT(email) DO UPDATE SET
+            name         = COALESCE(contacts.name, excluded.name),
+            phone_e164   = COALESCE(excluded.phone_e164, contacts.phone_e164),
+            last_seen_at = excluded.last_seen_at
+    """, (addr, (name or "").strip() or None, normalize_phone(phone), now, now))
+    row = conn.execute("SELECT id FROM contacts WHERE email=?", (addr,)).fetchone()
+    return row["id"] if row else None
+
+
+def find_contact_id(conn, email: str) -> Optional[int]:
+    addr = normalize_email(email)
+    if not addr:
+        return None
+    row = conn.execute("SELECT id FROM contacts WHERE email=?", (addr,)).fetchone()
+    return row["id"] if row else None
+
+
+def known_sender_reason(conn, email: str) -> Optional[str]:
+    """
+    Why this sender is already known, or None.
+    Same priority as should_admit_email: lead → client → previously contacted.
+    """
+    contact_id = find_contact_id(conn, email)
+    if contact_id is None:
+        return None
+    if conn.execute("SELECT 1 FROM leads WHERE contact_id=? LIMIT 1", (contact_id,)).fetchone():
+        return "known_lead"
+    if conn.execute("SELECT 1 FROM clients WHERE contact_id=? LIMIT 1", (contact_id,)).fetchone():
+        return "known_client"
+    if conn.execute(
+        "SELECT 1 FROM drafts WHERE contact_id=? AND status='sent' LIMIT 1", (contact_id,)
+    ).fetchone():
+        return "previously_contacted"
+    return None
+
+
+def contact_phone(conn, contact_id: Optional[int]) -> Optional[str]:
+    if not contact_id:
+        return None
+    row = conn.execute("SELECT phone_e164 FROM contacts WHERE id=?", (contact_id,)).fetchone()
+    return row["phone_e164"] if row else None
+
+
+# ── Backfill ──────────────────────────────────────────────────────────────────
+
+def merge_unnormalized(conn) -> int:
+    """
+    Fold contacts stored under a value normalize_email would key differently
+    ("Jane <jane@x.com>", "mailto:jane@x.com", a stray quote or comma — written
+    by the triggers before db.email_sql matched this module) into the contact
+    for the normalized address, repointing every linked row.
+    """
+    merged = 0
+    for r in conn.execute("SELECT id, email, name, phone_e164 FROM contacts").fetchall():
+        if normalize_email(r["email"]) == r["email"]:
+            continue
+        target = upsert_contact(conn, r["email"], r["name"], r["phone_e164"])
+        if not target or target == r["id"]:
+            continue
+        for table in CONTACT_LINKS:
+            conn.execute(f"UPDATE {table} SET contact_id=? WHERE contact_id=?", (target, r["id"]))
+        conn.execute("DELETE FROM contacts WHERE id=?", (r["id"],))
+        merged += 1
+    conn.commit()
+    if merged:
+        print(f"[contacts] Merged {merged} contact(s) stored under an un-normalized email.")
+    return merged
+
+
+def backfill_contacts(conn) -> int:
+    """
+    Link rows written before the contacts table existed, and pick up names and
+    phones from leads. Idempotent — only touches rows with contact_id IS NULL.
+    """
+    merge_unnormalized(conn)
+    linked = 0
+    for table, email_col in CONTACT_LINKS.items():
+        extra = ", name, phone" if table in ("leads", "clients") else ""
+        rows = conn.execute(f"""
+            SELECT id, {email_col} AS email{extra} FROM {table}
+            WHERE contact_id IS NULL AND {email_col} IS NOT NULL AND trim({email_col}) != ''
+        """).fetchall()
+        for r in rows:
+            r = dict(r)
+            contact_id = upsert_contact(conn, r["email"], r.get("name"), r.get("phone"))
+            if contact_id:
+                conn.execute(f"UPDATE {table} SET contact_id=? WHERE id=?", (contact_id, r["id"]))
+                linked += 1
+    conn.commit()
+    if linked:
+        print(f"[contacts] Backfilled contact_id on {linked} row(s).")
+    return linked
@@ -8,6 +8,47 @@ import pathlib
 
 DB_PATH = pathlib.Path("/data/lucilease.db")
 
+# table → column holding the person's email address (linked via contact_id)
+CONTACT_LINKS = {
+    "leads":        "from_email",
+    "clients":      "email",
+    "drafts":       "to_email",
+    "appointments": "client_email",
+}
+
+
+# Characters that end an email address in a header value — whitespace,
+# brackets, quotes and list punctuation ("mailto:" included). Shared by
+# contacts.normalize_email and email_sql so both cut at the same places.
+EMAIL_BLANKS     = " \t\r\n"
+EMAIL_DELIMITERS = EMAIL_BLANKS + "<>\"',;:()[]"
+
+
+def email_trim_sql(col: str) -> str:
+    """SQL for col.strip(EMAIL_BLANKS)."""
+    return f"trim({col}, {' || '.join(f'char({ord(c)})' for c in EMAIL_BLANKS)})"
+
+
+def email_sql(col: str) -> str:
+    """
+    SQL twin of contacts.normalize_email for the contact-link triggers, step
+    for step: trim blanks; with no "@", the whole value; otherwise the run of
+    non-delimiter characters around the first "@" (trailing dots dropped from
+    the domain) — ASCII-lowercased, so SQL writers and the Python path key the
+    same contact.
+    """
+    # Layered subqueries rather than one nested expression — inlined, the
+    # replace chain overflows SQLite's parser stack
+    y = "x"
+    for c in EMAIL_DELIMITERS[1:]:     # [0] is the space itself
+        y = f"replace({y}, char({ord(c)}), ' ')"
+    local  = "substr(pre, length(rtrim(pre, replace(pre, ' ', ''))) + 1)"
+    domain = "rtrim(substr(post, 1, instr(post, ' ') - 1), '.')"
+    return (f"(SELECT lower(CASE WHEN at = 0 THEN x ELSE {local} || '@' || {domain} END) FROM "
+            f"(SELECT x, instr(y, '@') AS at, substr(y, 1, instr(y, '@') - 1) AS pre, "
+            f"substr(y, instr(y, '@') + 1) || ' ' AS post FROM "
+            f"(SELECT x, {y} AS y FROM (SELECT {email_trim_sql(col)} AS x))))")
+
 
 def get_conn() -> sqlite3.Connection:
     DB_PATH.parent.mkdir(parents=True, exist_ok=True)
@@ -22,6 +63,19 @@ def init_db():
     conn = get_conn()
     cur = conn.cursor()
 
+    # Contacts — one row per person, keyed by normalized email (see contacts.py)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS contacts (
+            id            INTEGER PRIMARY KEY AUTOINCREMENT,
+            email         TEXT    UNIQUE NOT NULL,  -- contacts.normalize_email(address)
+            name          TEXT,
+            phone_e164    TEXT,                     -- e.g. '+18055550199'
+            first_seen_at TEXT    NOT NULL,
+            last_seen_at  TEXT
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_contacts_phone ON contacts(phone_e164)")
+
     # Leads — incoming email inquiries
     cur.execute("""
         CREATE TABLE IF NOT EXISTS leads (
@@ -38,7 +92,8 @@ def init_db():
             status      TEXT    NOT NULL DEFAULT 'new',
             first_seen_at TEXT  NOT NULL,
             handled_at  TEXT,
-            gmail_msg_id TEXT
+            gmail_msg_id TEXT,
+            contact_id  INTEGER REFERENCES contacts(id)
         )
     """)
 
@@ -47,11 +102,53 @@ def init_db():
     for col, sql in {
         "body_full":       "ALTER TABLE leads ADD COLUMN body_full TEXT",
         "gmail_thread_id": "ALTER TABLE leads ADD COLUMN gmail_thread_id TEXT",
+        "duplicate_of":    "ALTER TABLE leads ADD COLUMN duplicate_of INTEGER REFERENCES leads(id)",
+        "duplicate_score": "ALTER TABLE leads ADD COLUMN duplicate_score REAL",
+        "dedup_checked":   "ALTER TABLE leads ADD COLUMN dedup_checked INTEGER NOT NULL DEFAULT 0",
+        # Structured enrichment (see enrich.py)
+        "bedrooms":        "ALTER TABLE leads ADD COLUMN bedrooms INTEGER",
+        "move_in_date":    "ALTER TABLE leads ADD COLUMN move_in_date TEXT",
+        "pets":            "ALTER TABLE leads ADD COLUMN pets TEXT",
+        "neighborhood":    "ALTER TABLE leads ADD COLUMN neighborhood TEXT",
+        "timeline":        "ALTER TABLE leads ADD COLUMN timeline TEXT",
+        "bathrooms":       "ALTER TABLE leads ADD COLUMN bathrooms REAL",
+        "property_type":   "ALTER TABLE leads ADD COLUMN property_type TEXT",   # rental | sale
+        "enrich_version":  "ALTER TABLE leads ADD COLUMN enrich_version INTEGER NOT NULL DEFAULT 0",
     }.items():
         if col not in lead_cols:
             try: cur.execute(sql); print(f"[db] Migrated leads: added '{col}'")
             except Exception as e: print(f"[db] leads migration warning ({col}): {e}")
 
+    # Near-duplicate index — MinHash signatures + LSH band buckets (see dedup.py)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS lead_signatures (
+            lead_id     INTEGER PRIMARY KEY REFERENCES leads(id) ON DELETE CASCADE,
+            signature   BLOB    NOT NULL
+        )
+    """)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS lead_lsh_buckets (
+            band        INTEGER NOT NULL,
+            bucket      TEXT    NOT NULL,
+            lead_id     INTEGER NOT NULL REFERENCES leads(id) ON DELETE CASCADE
+        )
+    """)
+    # lead_id in the key: dedup.find_similar reads each bucket newest-first with a LIMIT
+    cur.execute("DROP INDEX IF EXISTS idx_lsh_bucket")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_lsh_bucket_lead ON lead_lsh_buckets(band, bucket, lead_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_lsh_lead   ON lead_lsh_buckets(lead_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_leads_dedup_pending ON leads(dedup_checked) WHERE dedup_checked = 0")
+
+    # Enrichment filters — inbox queries filter on status first
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_leads_status_seen  ON leads(status, first_seen_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_leads_bedrooms     ON leads(bedrooms, budget_monthly_usd)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_leads_budget       ON leads(budget_monthly_usd)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_leads_move_in      ON leads(move_in_date)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_leads_neighborhood ON leads(neighborhood)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_leads_pets         ON leads(pets)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_leads_timeline     ON leads(timeline)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_leads_enrich_ver   ON leads(enrich_version)")
+
     # Clients — contacts the agent is working with
     cur.execute("""
         CREATE TABLE IF NOT EXISTS clients (
@@ -63,7 +160,8 @@ def init_db():
             notes       TEXT,
             status      TEXT    NOT NULL DEFAULT 'active',
             created_at  TEXT    NOT NULL,
-            updated_at  TEXT
+            updated_at  TEXT,
+            contact_id  INTEGER REFERENCES contacts(id)
         )
     """)
 
@@ -84,6 +182,50 @@ def init_db():
         )
     """)
 
+    # Property matching (see matching.py): equality on status/type/bedrooms,
+    # then a range or ordered scan on price or recency — top-k never reads the
+    # whole table. price = COALESCE(price_monthly, price_sale), verbatim.
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_properties_match_price  ON properties(status, type, bedrooms, COALESCE(price_monthly, price_sale))")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_properties_type_price   ON properties(status, type, COALESCE(price_monthly, price_sale))")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_properties_match_recent ON properties(status, type, bedrooms, created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_properties_recent       ON properties(status, type, created_at)")
+
+    # Offline geocoding (see geo.py) — the point, which gazetteer entry gave
+    # it, and the address it was computed from (re-geocode when they differ)
+    prop_cols = {row["name"] for row in cur.execute("PRAGMA table_info(properties)").fetchall()}
+    for col, sql in {
+        "lat":         "ALTER TABLE properties ADD COLUMN lat REAL",
+        "lon":         "ALTER TABLE properties ADD COLUMN lon REAL",
+        "geo_source":  "ALTER TABLE properties ADD COLUMN geo_source TEXT",
+        "geo_address": "ALTER TABLE properties ADD COLUMN geo_address TEXT",
+    }.items():
+        if col not in prop_cols:
+            try: cur.execute(sql); print(f"[db] Migrated properties: added '{col}'")
+            except Exception as e: print(f"[db] properties migration warning ({col}): {e}")
+
+    # R-Tree over property points, kept in step with properties.lat / lon by
+    # triggers — whoever writes the coordinates, the index follows
+    cur.execute("CREATE VIRTUAL TABLE IF NOT EXISTS property_geo USING rtree(id, min_lat, max_lat, min_lon, max_lon)")
+    geo_insert = """
+        INSERT OR REPLACE INTO property_geo (id, min_lat, max_lat, min_lon, max_lon)
+        SELECT NEW.id, NEW.lat, NEW.lat, NEW.lon, NEW.lon WHERE NEW.lat IS NOT NULL AND NEW.lon IS NOT NULL;
+    """
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_properties_geo_insert
+        AFTER INSERT ON properties
+        BEGIN {geo_insert} END
+    """)
+    cur.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_properties_geo_update
+        AFTER UPDATE OF lat, lon ON properties
+        BEGIN DELETE FROM property_geo WHERE id = OLD.id; {geo_insert} END
+    """)
+    cur.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_properties_geo_delete
+        AFTER DELETE ON properties
+        BEGIN DELETE FROM property_geo WHERE id = OLD.id; END
+    """)
+
     # Agent config — profile and preferences
     cur.execute("""
         CREATE TABLE IF NOT EXISTS config (
@@ -105,7 +247,8 @@ def init_db():
             status         TEXT NOT NULL DEFAULT 'local',
             error_msg      TEXT,
             created_at     TEXT NOT NULL,
-            updated_at     TEXT
+            updated_at     TEXT,
+            contact_id     INTEGER REFERENCES contacts(id)
         )
     """)
 
@@ -145,7 +288,8 @@ def init_db():
             calendar_event_id TEXT,
             source            TEXT NOT NULL DEFAULT 'inbox',
             created_at        TEXT NOT NULL,
-            updated_at        TEXT
+            updated_at        TEXT,
+            contact_id        INTEGER REFERENCES contacts(id)
         )
     """)
 
@@ -162,6 +306,225 @@ def init_db():
         )
     """)
 
+    # Claude response cache — content-addressed, see llm.py
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS llm_cache (
+            key           TEXT    PRIMARY KEY,   -- sha256(model + prompt + params)
+            task          TEXT    NOT NULL,      -- 'tone','confirmation','draft_reply',...
+            model         TEXT    NOT NULL,
+            response      TEXT    NOT NULL,
+            input_tokens  INTEGER NOT NULL DEFAULT 0,
+            output_tokens INTEGER NOT NULL DEFAULT 0,
+            size_bytes    INTEGER NOT NULL DEFAULT 0,
+            created_at    TEXT    NOT NULL,
+            expires_at    TEXT    NOT NULL,
+            last_used_at  TEXT    NOT NULL,
+            hits          INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_lru     ON llm_cache(last_used_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_expires ON llm_cache(expires_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_llm_cache_task    ON llm_cache(task)")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS llm_cache_stats (
+            task         TEXT    PRIMARY KEY,
+            hits         INTEGER NOT NULL DEFAULT 0,
+            misses       INTEGER NOT NULL DEFAULT 0,
+            bypasses     INTEGER NOT NULL DEFAULT 0,
+            tokens_saved INTEGER NOT NULL DEFAULT 0
+        )
+    """)
+
+    # Per-call API token usage, incl. prompt-cache reads/writes (see llm.py)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS llm_usage (
+            id                 INTEGER PRIMARY KEY AUTOINCREMENT,
+            task               TEXT    NOT NULL,
+            model              TEXT    NOT NULL,
+            input_tokens       INTEGER NOT NULL DEFAULT 0,  -- uncached input
+            output_tokens      INTEGER NOT NULL DEFAULT 0,
+            cache_read_tokens  INTEGER NOT NULL DEFAULT 0,
+            cache_write_tokens INTEGER NOT NULL DEFAULT 0,
+            created_at         TEXT    NOT NULL
+        )
+    """)
+    usage_cols = {row["name"] for row in cur.execute("PRAGMA table_info(llm_usage)").fetchall()}
+    for col, sql in {
+        "latency_ms": "ALTER TABLE llm_usage ADD COLUMN latency_ms INTEGER",
+        "outcome":    "ALTER TABLE llm_usage ADD COLUMN outcome TEXT NOT NULL DEFAULT 'ok'",  # ok | downgraded | queued | error:<Type>
+        "cost_usd":   "ALTER TABLE llm_usage ADD COLUMN cost_usd REAL NOT NULL DEFAULT 0",
+    }.items():
+        if col not in usage_cols:
+            cur.execute(sql)
+            print(f"[db] Migrated llm_usage: added '{col}'")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_llm_usage_created ON llm_usage(created_at, task)")
+
+    # Rolling per-thread summaries for scan prompts (see summaries.py)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS thread_summaries (
+            thread_id      TEXT    PRIMARY KEY,
+            summary        TEXT    NOT NULL,
+            through_msg_id TEXT,                 -- last Gmail message folded in
+            msg_count      INTEGER NOT NULL DEFAULT 0,
+            updated_at     TEXT    NOT NULL
+        )
+    """)
+
+    # Leads a scan had to skip (token budget spent / Claude circuit open), retried first next scan
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS scan_queue (
+            lead_id   INTEGER PRIMARY KEY REFERENCES leads(id),
+            reason    TEXT    NOT NULL,
+            attempts  INTEGER NOT NULL DEFAULT 1,
+            queued_at TEXT    NOT NULL
+        )
+    """)
+
+    # How far fixture replay has read each file (see fixtures.py) — unchanged
+    # files are skipped on the next poll, an appended mbox resumes at `offset`
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS fixture_files (
+            path       TEXT    PRIMARY KEY,
+            size       INTEGER NOT NULL,
+            mtime      REAL    NOT NULL,
+            offset     INTEGER NOT NULL,       -- bytes fully ingested
+            updated_at TEXT    NOT NULL
+        )
+    """)
+
+    # Speculative drafts for new leads, used on Draft Reply if still current (see predraft.py)
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS predrafts (
+            lead_id    INTEGER PRIMARY KEY REFERENCES leads(id),
+            input_hash TEXT    NOT NULL,         -- hash of the exact draft request
+            task       TEXT    NOT NULL,         -- draft_reply | draft_triage
+            text       TEXT    NOT NULL,         -- Claude's raw answer
+            created_at TEXT    NOT NULL
+        )
+    """)
+
+    # Draft reuse lookups (see reuse.py) — one row per lookup; draft_id is set
+    # when a past sent reply became the draft, regenerated when Claude was asked anyway
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS draft_reuse (
+            id              INTEGER PRIMARY KEY AUTOINCREMENT,
+            lead_id         INTEGER NOT NULL REFERENCES leads(id),
+            draft_id        INTEGER REFERENCES drafts(id),
+            source_draft_id INTEGER REFERENCES drafts(id),
+            score           REAL,
+            lookup_ms       INTEGER NOT NULL,
+            regenerated     INTEGER NOT NULL DEFAULT 0,
+            created_at      TEXT    NOT NULL
+        )
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_draft_reuse_created ON draft_reuse(created_at)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_draft_reuse_lead    ON draft_reuse(lead_id)")
+
+    # Daily rollup of llm_usage — what budgets and reports read; raw rows are pruned
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS llm_usage_daily (
+            day                TEXT    NOT NULL,    -- YYYY-MM-DD (UTC)
+            task               TEXT    NOT NULL,
+            model              TEXT    NOT NULL,
+            calls              INTEGER NOT NULL DEFAULT 0,
+            errors             INTEGER NOT NULL DEFAULT 0,
+            queued             INTEGER NOT NULL DEFAULT 0,
+            input_tokens       INTEGER NOT NULL DEFAULT 0,
+            output_tokens      INTEGER NOT NULL DEFAULT 0,
+            cache_read_tokens  INTEGER NOT NULL DEFAULT 0,
+            cache_write_tokens INTEGER NOT NULL DEFAULT 0,
+            latency_ms         INTEGER NOT NULL DEFAULT 0,   -- total; / calls for the mean
+            cost_usd           REAL    NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, task, model)
+        )
+    """)
+
+    # Link every table that carries an email address to its contact row
+    for table, email_col in CONTACT_LINKS.items():
+        cols = {row["name"] for row in cur.execute(f"PRAGMA table_info({table})").fetchall()}
+        if "contact_id" not in cols:
+            try:
+                cur.execute(f"ALTER TABLE {table} ADD COLUMN contact_id INTEGER REFERENCES contacts(id)")
+                print(f"[db] Migrated {table}: added 'contact_id'")
+            except Exception as e:
+                print(f"[db] {table} migration warning (contact_id): {e}")
+        cur.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_contact ON {table}(contact_id)")
+        # Triggers keep contact_id populated for every writer — including the
+        # seed scripts, which talk to SQLite directly and never import contacts.py.
+        # Recreated each start so older databases pick up email_sql changes
+        link_sql = f"""
+            INSERT OR IGNORE INTO contacts (email, first_seen_at)
+            VALUES ({email_sql(f"NEW.{email_col}")}, strftime('%Y-%m-%dT%H:%M:%SZ', 'now'));
+            UPDATE {table} SET contact_id =
+                (SELECT id FROM contacts WHERE email = {email_sql(f"NEW.{email_col}")})
+            WHERE id = NEW.id;
+        """
+        cur.execute(f"DROP TRIGGER IF EXISTS trg_{table}_contact_insert")
+        cur.execute(f"DROP TRIGGER IF EXISTS trg_{table}_contact_update")
+        has_email = f"NEW.{email_col} IS NOT NULL AND {email_trim_sql(f'NEW.{email_col}')} != ''"
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_contact_insert
+            AFTER INSERT ON {table}
+            WHEN NEW.contact_id IS NULL AND {has_email}
+            BEGIN {link_sql} END
+        """)
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_{table}_contact_update
+            AFTER UPDATE OF {email_col} ON {table}
+            WHEN {has_email}
+            BEGIN {link_sql} END
+        """)
+
+    # Rendered prompt context (see listing_context.py). Triggers bump the
+    # version on every write it depends on, whoever the writer is
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS context_version (
+            id      INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    """)
+    cur.execute("INSERT OR IGNORE INTO context_version (id, version) VALUES (1, 1)")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS context_cache (
+            name     TEXT    PRIMARY KEY,      -- listing | availability
+            version  INTEGER NOT NULL,         -- context_version it was rendered at
+            text     TEXT    NOT NULL,
+            built_at TEXT    NOT NULL
+        )
+    """)
+    bump = "UPDATE context_version SET version = version + 1 WHERE id = 1;"
+    for table in ("properties", "open_house_slots"):
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            cur.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_{event.lower()}_context
+                AFTER {event} ON {table}
+                BEGIN {bump} END
+            """)
+    context_keys = "('availability_windows', 'timezone')"
+    for event, when in (("INSERT", f"NEW.key IN {context_keys}"),
+                        ("UPDATE", f"NEW.key IN {context_keys} OR OLD.key IN {context_keys}"),
+                        ("DELETE", f"OLD.key IN {context_keys}")):
+        cur.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS trg_config_{event.lower()}_context
+            AFTER {event} ON config
+            WHEN {when}
+            BEGIN {bump} END
+        """)
+
+    # Lookup indexes for thread/message matching and "previously contacted"
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_leads_thread   ON leads(gmail_thread_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_leads_msg      ON leads(gmail_msg_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_drafts_contact_status ON drafts(contact_id, status)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_drafts_lead_status ON drafts(lead_id, status)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_appts_thread   ON appointments(thread_id)")
+
     conn.commit()
+
+    from contacts import backfill_contacts
+    backfill_contacts(conn)
+
+    from geo import geocode_properties
+    geocode_properties(conn)
+
     conn.close()
     print("[db] Schema ready.")
@@ -0,0 +1,196 @@
+"""
+dedup.py — Near-duplicate lead detection with MinHash + LSH banding.
+
+Every lead with enough text gets a MinHash signature (NUM_PERM 64-bit
+minimums over word 3-gram shingles). The signature is cut into BANDS bands;
+each band hashes to a bucket row in SQLite. Two leads become candidates only
+if they share a bucket in at least one band, so a new lead is compared
+against a handful of rows instead of the whole table.
+
+With 16 bands × 4 rows the candidate threshold sits around Jaccard 0.5;
+candidates are then scored exactly on their signatures and flagged at
+DUP_THRESHOLD. A hot bucket (portal boilerplate shared by thousands of
+leads) contributes only its BUCKET_CANDIDATES newest leads, so a lookup
+stays bounded however skewed the buckets get.
+"""
+
+import hashlib
+import random
+import re
+import struct
+from typing import Optional
+
+NUM_PERM      = 64
+BANDS         = 16
+ROWS          = NUM_PERM // BANDS
+SHINGLE_WORDS = 3
+MIN_SHINGLES  = 8      # "Saturday works!" style replies are too short to compare
+DUP_THRESHOLD = 0.8
+BUCKET_CANDIDATES = 200   # newest leads read per matching bucket
+SQL_CHUNK         = 500   # ids per IN (...) — well under SQLite's bound-variable limit
+
+_MERSENNE = (1 << 61) - 1
+_MAX_HASH = (1 << 64) - 1
+_rng      = random.Random(0x1EAD)  # fixed seed — signatures must be stable across restarts
+_PERMS    = [(_rng.randrange(1, _MERSENNE), _rng.randrange(0, _MERSENNE)) for _ in range(NUM_PERM)]
+
+
+# ── Signatures ────────────────────────────────────────────────────────────────
+
+def shingles(text: str) -> set[str]:
+    words = re.sub(r"[^a-z0-9$]+", " ", (text or "").lower()).split()
+    if len(words) < SHINGLE_WORDS:
+        return set()
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+
+def signature(shingle_set: set[str]) -> list[int]:
+    base = [
+        int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "little")
+        for s in shingle_set
+    ]
+    return [
+        min(((a * h + b) % _MERSENNE) for h in base) if base else _MAX_HASH
+        for a, b in _PERMS
+    ]
+
+
+def similarity(sig_a: list[int], sig_b: list[int]) -> float:
+    """Estimated Jaccard similarity of the two shingle sets."""
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / NUM_PERM
+
+
+def band_keys(sig: list[int]) -> list[str]:
+    keys = []
+    for band in range(BANDS):
+        chunk = struct.pack(f"<{ROWS}Q", *sig[band * ROWS:(band + 1) * ROWS])
+        keys.append(hashlib.blake2b(chunk, digest_size=8).hexdigest())
+    return keys
+
+
+def _pack(sig: list[int]) -> bytes:
+    return struct.pack(f"<{NUM_PERM}Q", *sig)
+
+
+def _unpack(blob: bytes) -> list[int]:
+    return list(struct.unpack(f"<{NUM_PERM}Q", blob))
+
+
+def lead_text(subject: Optional[str], body: Optional[str]) -> str:
+    return f"{subject or ''}\n{body or ''}"
+
+
+# ── Index ─────────────────────────────────────────────────────────────────────
+
+def find_similar(conn, sig: list[int], exclude_lead_id: Optional[int] = None,
+                 exclude_thread_id: Optional[str] = None, limit: int = 5) -> list[dict]:
+    """
+    Leads sharing at least one LSH bucket with `sig`, scored by signature
+    similarity. Messages from the same Gmail thread are never duplicates.
+    """
+    candidate_ids = set()
+    for band, key in enumerate(band_keys(sig)):
+        candidate_ids.update(r["lead_id"] for r in conn.execute("""
+            SELECT lead_id FROM lead_lsh_buckets WHERE band=? AND bucket=? ORDER BY lead_id DESC LIMIT ?
+        """, (band, key, BUCKET_CANDIDATES)))
+    candidate_ids.discard(exclude_lead_id)
+    if not candidate_ids:
+        return []
+
+    ids, rows = sorted(candidate_ids), []
+    for i in range(0, len(ids), SQL_CHUNK):
+        chunk = ids[i:i + SQL_CHUNK]
+        rows += conn.execute(f"""
+            SELECT s.lead_id, s.signature, l.gmail_thread_id, l.from_email, l.subject
+            FROM lead_signatures s JOIN leads l ON l.id = s.lead_id
+            WHERE s.lead_id IN ({','.join('?' * len(chunk))})
+        """, chunk).fetchall()
+
+    scored = []
+    for r in rows:
+        if exclude_thread_id and r["gmail_thread_id"] == exclude_thread_id:
+            continue
+        scored.append({
+            "lead_id":    r["lead_id"],
+            "score":      round(similarity(sig, _unpack(r["signature"])), 3),
+            "from_email": r["from_email"],
+            "subject":    r["subject"],
+        })
+    scored.sort(key=lambda c: (-c["score"], c["lead_id"]))
+    return scored[:limit]
+
+
+def index_lead(conn, lead_id: int, text: str,
+               thread_id: Optional[str] = None) -> Optional[dict]:
+    """
+    Sign a lead, compare it against earlier leads via LSH, store its buckets
+    and record the best match on the lead row. Returns the best match or None.
+    Caller commits.
+    """
+    conn.execute("UPDATE leads SET dedup_checked=1 WHERE id=?", (lead_id,))
+    sh = shingles(text)
+    if len(sh) < MIN_SHINGLES:
+        return None
+    sig = signature(sh)
+
+    matches = find_similar(conn, sig, exclude_lead_id=lead_id, exclude_thread_id=thread_id, limit=1)
+    best = matches[0] if matches else None
+
+    conn.execute(
+        "INSERT OR REPLACE INTO lead_signatures (lead_id, signature) VALUES (?,?)",
+        (lead_id, _pack(sig)),
+    )
+    conn.execute("DELETE FROM lead_lsh_buckets WHERE lead_id=?", (lead_id,))
+    conn.executemany(
+        "INSERT INTO lead_lsh_buckets (band, bucket, lead_id) VALUES (?,?,?)",
+        [(band, key, lead_id) for band, key in enumerate(band_keys(sig))],
+    )
+
+    if best:
+        is_dup = best["score"] >= DUP_THRESHOLD
+        conn.execute(
+            "UPDATE leads SET duplicate_of=?, duplicate_score=? WHERE id=?",
+            (best["lead_id"] if is_dup else None, best["score"], lead_id),
+        )
+        if is_dup:
+            print(f"[dedup] Lead {lead_id} ≈ lead {best['lead_id']} (score {best['score']:.2f})")
+            if _merge_enabled(conn):
+                conn.execute("UPDATE leads SET status='duplicate' WHERE id=? AND status='new'", (lead_id,))
+    return best
+
+
+def similar_to_lead(conn, lead_id: int, limit: int = 5) -> list[dict]:
+    row = conn.execute("""
+        SELECT s.signature, l.gmail_thread_id FROM lead_signatures s
+        JOIN leads l ON l.id = s.lead_id WHERE s.lead_id=?
+    """, (lead_id,)).fetchone()
+    if not row:
+        return []
+    return find_similar(conn, _unpack(row["signature"]), exclude_lead_id=lead_id,
+                        exclude_thread_id=row["gmail_thread_id"], limit=limit)
+
+
+def index_missing(conn, batch_size: int = 500) -> int:
+    """Sign leads that predate the index, oldest first. Returns count indexed."""
+    total = 0
+    while True:
+        rows = conn.execute("""
+            SELECT id, subject, body_full, body_excerpt, gmail_thread_id FROM leads
+            WHERE dedup_checked = 0
+            ORDER BY id LIMIT ?
+        """, (batch_size,)).fetchall()
+        if not rows:
+            break
+        for r in rows:
+            index_lead(conn, r["id"], lead_text(r["subject"], r["body_full"] or r["body_excerpt"]),
+                       thread_id=r["gmail_thread_id"])
+        conn.commit()
+        total += len(rows)
+    if total:
+        print(f"[dedup] Indexed {total} existing lead(s).")
+    return total
+
+
+def _merge_enabled(conn) -> bool:
+    row = conn.execute("SELECT value FROM config WHERE key='dedup_action'").fetchone()
+    return bool(row and row["value"] == "merge")
@@ -0,0 +1,244 @@
+"""
+enrich.py — Deterministic lead enrichment into typed, indexed columns.
+
+Pulls bedrooms, bathrooms, rent-or-buy, move-in date, pets, target
+neighborhood and timeline out of
+the inquiry text at ingest, so the UI can filter with indexed SQL and draft
+prompts can carry a compact fact line instead of re-reading the raw body.
+
+Pure regex — no AI. Input is already bounded by textguard.prepare() at
+ingest; repetitions here stay bounded for the same reason. Bump EXTRACTOR_VERSION whenever the rules change;
+reenrich() then re-runs rows stored under an older version in the background.
+"""
+
+import datetime
+import re
+from typing import Optional
+
+EXTRACTOR_VERSION = 3
+
+FIELDS = ("bedrooms", "bathrooms", "property_type", "move_in_date", "pets", "neighborhood", "timeline")
+
+_NUM_WORDS = {"one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6}
+_MONTHS = {m: i for i, m in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1)}
+
+_BEDROOMS_RE = re.compile(
+    r"\b(\d|one|two|three|four|five|six)[\s\-]{0,3}(?:bed(?:room)?s?|br|bd)\b", re.IGNORECASE)
+_STUDIO_RE = re.compile(r"\bstudio\b", re.IGNORECASE)
+_BATHROOMS_RE = re.compile(
+    r"\b(\d(?:\.5)?|one|two|three|four)[\s\-]{0,3}(?:bath(?:room)?s?|ba)\b", re.IGNORECASE)
+
+# Rent or buy — matched against properties.type ('rental' | 'sale')
+_BUY_RE = re.compile(
+    r"\b(?:buy(?:ing)?|purchas(?:e|ing)|for\s{1,3}sale|mortgage|pre[\s\-]?approv(?:ed|al)|down\s{1,3}payment)\b",
+    re.IGNORECASE)
+_RENT_RE = re.compile(
+    r"\b(?:rent(?:al|ing)?|lease|leasing|sublet|per\s{1,3}month|a\s{1,3}month)\b|/\s?mo\b", re.IGNORECASE)
+
+_MOVE_KW_RE = re.compile(
+    r"\b(?:move[\s\-]?in|moving|move|start(?:ing)?|lease\s{1,3}start|available|need\s{1,3}it)\b", re.IGNORECASE)
+_MONTH_DAY_RE = re.compile(
+    r"\b(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]{0,7}\.?\s{1,3}(\d{1,2})(?:st|nd|rd|th)?\b",
+    re.IGNORECASE)
+_NUMERIC_DATE_RE = re.compile(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b")
+
+_PETS_NONE_RE = re.compile(r"\b(?:no\s+pets|don'?t\s+have\s+(?:any\s+)?pets|pet[\s\-]?free)\b", re.IGNORECASE)
+_DOG_RE = re.compile(r"\b(?:dogs?|pupp(?:y|ies)|pup)\b", re.IGNORECASE)
+_CAT_RE = re.compile(r"\b(?:cats?|kittens?|kitty)\b", re.IGNORECASE)
+# "no dogs", "without a cat", "don't have any dogs" — checked against the words
+# just before each mention, so "no dogs but 2 cats" is a cat
+_PET_NEGATION_RE = re.compile(
+    r"\b(?:no|without|zero|don'?t\s+have(?:\s+any)?|not\s+bringing(?:\s+any)?)\s+(?:[a-z]+\s+)?$", re.IGNORECASE)
+PET_KINDS = ("dog", "cat")    # stored in this order, comma-joined: 'dog', 'cat', 'dog,cat' or 'none'
+
+_AREA_WORDS = r"downtown|uptown|midtown|the[ \t]+harbou?r|harbou?r|the[ \t]+beach|beach|waterfront|marina|the[ \t]+mesa"
+_NEIGHBORHOOD_RE = re.compile(
+    r"\b(near|in|around|by|close[ \t]{1,3}to)[ \t]{1,3}"
+    r"((?:" + _AREA_WORDS + r")(?:[ \t]+[A-Z][a-z]+){0,2}|[A-Z][a-z]+(?:[ \t]+[A-Z][a-z]+){0,2})")
+_NOT_PLACES = {
+    "i", "we", "the", "my", "our", "a", "an", "it", "this", "that", "any", "person",
+    "january", "february", "march", "april", "may", "june", "july", "august",
+    "september", "october", "november", "december",
+    "monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday",
+}
+
+_TIMELINE_RULES = [
+    ("asap",       re.compile(r"\b(?:asap|a\.s\.a\.p|immediately|right\s+away|urgent(?:ly)?)\b", re.IGNORECASE)),
+    ("this_week",  re.compile(r"\bthis\s+week(?:end)?\b", re.IGNORECASE)),
+    ("next_week",  re.compile(r"\bnext\s+week(?:end)?\b", re.IGNORECASE)),
+    ("this_month", re.compile(r"\b(?:this\s+month|end\s+of\s+(?:the\s+)?month)\b", re.IGNORECASE)),
+    ("next_month", re.compile(r"\bnext\s+month\b", re.IGNORECASE)),
+    ("flexible",   re.compile(r"\b(?:no\s+rush|flexible|whenever|just\s+browsing)\b", re.IGNORECASE)),
+]
+
+
+# ── Extractors ────────────────────────────────────────────────────────────────
+
+def extract_bedrooms(text: str) -> Optional[int]:
+    m = _BEDROOMS_RE.search(text)
+    if m:
+        raw = m.group(1).lower()
+        return int(raw) if raw.isdigit() else _NUM_WORDS.get(raw)
+    return 0 if _STUDIO_RE.search(text) else None
+
+
+def extract_bathrooms(text: str) -> Optional[float]:
+    m = _BATHROOMS_RE.search(text)
+    if not m:
+        return None
+    raw = m.group(1).lower()
+    return float(raw) if raw[0].isdigit() else float(_NUM_WORDS[raw])
+
+
+def extract_property_type(text: str) -> Optional[str]:
+    """'sale' for buyers, 'rental' for renters, None when unclear or both."""
+    buy, rent = bool(_BUY_RE.search(text)), bool(_RENT_RE.search(text))
+    if buy == rent:
+        return None
+    return "sale" if buy else "rental"
+
+
+def _upcoming(month: int, day: int, ref: datetime.date, year: Optional[int] = None) -> Optional[datetime.date]:
+    try:
+        if year:
+            return datetime.date(year if year > 100 else 2000 + year, month, day)
+        d = datetime.date(ref.year, month, day)
+    except ValueError:
+        return None
+    # A date more than a month in the past means next year's
+    return d if d >= ref - datetime.timedelta(days=31) else d.replace(year=ref.year + 1)
+
+
+def extract_move_in(text: str, ref: datetime.date) -> Optional[str]:
+    """First explicit date within 60 chars after a move-in keyword."""
+    for kw in _MOVE_KW_RE.finditer(text):
+        window = text[kw.end():kw.end() + 60]
+        m = _MONTH_DAY_RE.search(window)
+        if m:
+            d = _upcoming(_MONTHS[m.group(1)[:3].lower()], int(m.group(2)), ref)
+            if d:
+                return d.isoformat()
+        m = _NUMERIC_DATE_RE.search(window)
+        if m:
+            d = _upcoming(int(m.group(1)), int(m.group(2)), ref,
+                          int(m.group(3)) if m.group(3) else None)
+            if d:
+                return d.isoformat()
+    return None
+
+
+def _has_pet(text: str, rx: re.Pattern) -> bool:
+    """A mention of the animal that isn't negated by the few words before it."""
+    return any(not _PET_NEGATION_RE.search(text[max(0, m.start() - 30):m.start()]) for m in rx.finditer(text))
+
+
+def extract_pets(text: str) -> Optional[str]:
+    kinds = [k for k, rx in zip(PET_KINDS, (_DOG_RE, _CAT_RE)) if _has_pet(text, rx)]
+    if kinds:
+        return ",".join(kinds)
+    return "none" if _PETS_NONE_RE.search(text) else None
+
+
+def pets_values(kind: str) -> list[str]:
+    """Every stored pets value that includes kind — exact values, so the filter can use idx_leads_pets."""
+    if kind == "none":
+        return ["none"]
+    return [v for v in (*PET_KINDS, ",".join(PET_KINDS)) if kind in v.split(",")]
+
+
+def extract_neighborhood(text: str) -> Optional[str]:
+    """'near downtown Santa Barbara' beats a bare 'in Santa Barbara' city mention."""
+    fallback = None
+    for m in _NEIGHBORHOOD_RE.finditer(text):
+        place = re.sub(r"^the\s+", "", m.group(2).strip(), flags=re.IGNORECASE).lower()
+        if place.split()[0] in _NOT_PLACES:
+            continue
+        if m.group(1).lower() != "in":
+            return place
+        fallback = fallback or place
+    return fallback
+
+
+def extract_timeline(text: str, move_in: Optional[str], ref: datetime.date) -> Optional[str]:
+    for label, rx in _TIMELINE_RULES:
+        if rx.search(text):
+            return label
+    if move_in:
+        days = (datetime.date.fromisoformat(move_in) - ref).days
+        return "asap" if days <= 7 else "this_month" if days <= 31 else "later"
+    return None
+
+
+def extract(subject: Optional[str], body: Optional[str],
+            received_at: Optional[str] = None) -> dict:
+    """All structured fields for one inquiry. Missing facts are None."""
+    text = f"{subject or ''}\n{body or ''}"
+    try:
+        ref = datetime.date.fromisoformat((received_at or "")[:10])
+    except ValueError:
+        ref = datetime.date.today()
+    move_in = extract_move_in(text, ref)
+    return {
+        "bedrooms":      extract_bedrooms(text),
+        "bathrooms":     extract_bathrooms(text),
+        "property_type": extract_property_type(text),
+        "move_in_date":  move_in,
+        "pets":          extract_pets(text),
+        "neighborhood":  extract_neighborhood(text),
+        "timeline":      extract_timeline(text, move_in, ref),
+    }
+
+
+def facts_line(lead: dict) -> str:
+    """Compact fact summary for prompts, e.g. 'budget $3,800/mo; 2 bd; pets: dog'."""
+    parts = []
+    if lead.get("budget_monthly_usd"):
+        parts.append(f"budget ${lead['budget_monthly_usd']:,}/mo")
+    if lead.get("bedrooms") is not None:
+        parts.append("studio" if lead["bedrooms"] == 0 else f"{lead['bedrooms']} bd")
+    if lead.get("bathrooms"):
+        parts.append(f"{lead['bathrooms']:g} ba")
+    if lead.get("property_type") == "sale":
+        parts.append("looking to buy")
+    if lead.get("move_in_date"):
+        parts.append(f"move-in {lead['move_in_date']}")
+    if lead.get("pets"):
+        parts.append(f"pets: {lead['pets']}")
+    if lead.get("neighborhood"):
+        parts.append(f"area: {lead['neighborhood']}")
+    if lead.get("timeline"):
+        parts.append(f"timeline: {lead['timeline'].replace('_', ' ')}")
+    return "; ".join(parts)
+
+
+# ── Persistence ───────────────────────────────────────────────────────────────
+
+def enrich_lead(conn, lead_id: int, subject: Optional[str], body: Optional[str],
+                received_at: Optional[str] = None) -> dict:
+    """Extract and store fields for one lead. Caller commits."""
+    data = extract(subject, body, received_at)
+    conn.execute(f"""
+        UPDATE leads SET {', '.join(f'{f}=?' for f in FIELDS)}, enrich_version=?
+        WHERE id=?
+    """, (*[data[f] for f in FIELDS], EXTRACTOR_VERSION, lead_id))
+    return data
+
+
+def reenrich(conn, batch_size: int = 500) -> int:
+    """Re-run extraction on every lead stored under an older EXTRACTOR_VERSION."""
+    total = 0
+    while True:
+        rows = conn.execute("""
+            SELECT id, subject, body_full, body_excerpt, first_seen_at FROM leads
+            WHERE enrich_version < ? ORDER BY id LIMIT ?
+        """, (EXTRACTOR_VERSION, batch_size)).fetchall()
+        if not rows:
+            break
+        for r in rows:
+            enrich_lead(conn, r["id"], r["subject"], r["body_full"] or r["body_excerpt"], r["first_seen_at"])
+        conn.commit()
+        total += len(rows)
+    if total:
+        print(f"[enrich] Re-enriched {total} lead(s) at v{EXTRACTOR_VERSION}.")
+    return total
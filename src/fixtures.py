@@ -0,0 +1,279 @@
+"""
+fixtures.py — Fixture / mbox replay ingestion for `mode: fixture`.
+
+Streams messages from the fixtures directory (mounted read-only at /fixtures)
+through the same filter → parse → insert path as Gmail (gmail.ingest_message).
+Network-free: useful as a demo mode and as a realistic load generator.
+
+Supported files:
+- .txt   fixture format — header lines (From/Name/Phone/Subject), blank line, body
+- .eml   a single RFC 822 message
+- .mbox  many messages; memory-mapped and split lazily, so multi-GB archives
+         never need to fit in RAM
+
+Progress is kept per file in the fixture_files table (size, mtime, bytes
+read). A poll skips files that haven't changed and reads an mbox that only
+grew from where the last pass stopped, so a large archive is parsed once.
+
+Config (env):
+  LUCILEASE_MODE       gmail (default) | fixture
+  FIXTURES_DIR         directory to replay (default /fixtures)
+  FIXTURE_RATE         max messages per second, 0 = unlimited (default 0)
+  FIXTURE_CONCURRENCY  parallel ingest workers (default 1)
+"""
+
+import datetime
+import email
+import email.policy
+import hashlib
+import mmap
+import os
+import pathlib
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
+
+from db import get_conn
+
+FIXTURES_DIR = pathlib.Path(os.getenv("FIXTURES_DIR", "/fixtures"))
+EXTENSIONS   = (".txt", ".eml", ".mbox")
+
+
+def fixture_mode() -> bool:
+    return os.getenv("LUCILEASE_MODE", "gmail").strip().lower() == "fixture"
+
+
+# ── Readers ───────────────────────────────────────────────────────────────────
+#
+# Each reader yields (key, headers, body, thread_id). `key` is stable across
+# runs so a replay never inserts the same message twice.
+
+def _body_of(msg) -> str:
+    from gmail import strip_html
+    part = msg.get_body(preferencelist=("plain", "html")) if msg.is_multipart() else msg
+    if part is None:
+        return ""
+    try:
+        content = part.get_content()
+    except Exception:
+        payload = part.get_payload(decode=True) or b""
+        content = payload.decode("utf-8", errors="replace")
+    if part.get_content_type() == "text/html":
+        return strip_html(content)
+    return content if isinstance(content, str) else ""
+
+
+def _thread_key(msg) -> Optional[str]:
+    """Group replies by the first Message-ID in References (or In-Reply-To)."""
+    refs = (msg.get("References") or msg.get("In-Reply-To") or msg.get("Message-ID") or "").split()
+    return f"fixture:{hashlib.sha1(refs[0].encode()).hexdigest()[:16]}" if refs else None
+
+
+def _from_message(msg, fallback_key: str):
+    headers = {k: str(v) for k, v in msg.items()}
+    msg_id  = headers.get("Message-ID") or fallback_key
+    return msg_id, headers, _body_of(msg), _thread_key(msg)
+
+
+def read_txt(path: pathlib.Path):
+    raw = path.read_text(encoding="utf-8", errors="replace")
+    head, _, _ = raw.partition("\n\n")
+    headers = {}
+    for line in head.splitlines():
+        name, sep, value = line.partition(":")
+        if sep and name.strip():
+            headers[name.strip().title()] = value.strip()
+    # Name:/Phone: stay in the body — parse_email_to_lead reads fixture-style fields there
+    body = "\n".join(
+        l for l in raw.splitlines() if not re.match(r"^(From|Subject)\s*:", l, re.IGNORECASE)
+    ).strip()
+    yield path.name, headers, body, None
+
+
+def read_eml(path: pathlib.Path):
+    msg = email.message_from_bytes(path.read_bytes(), policy=email.policy.default)
+    yield _from_message(msg, path.name)
+
+
+_MBOX_SEP    = re.compile(rb"^From ", re.MULTILINE)
+_MBOXRD_FROM = re.compile(rb"^>(>*From )", re.MULTILINE)
+
+
+def read_mbox(path: pathlib.Path, start: int = 0, end: Optional[int] = None):
+    """Messages between byte offsets start (a "From " line) and end (default: EOF)."""
+    end = path.stat().st_size if end is None else end
+    if end <= start:
+        return
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), end, access=mmap.ACCESS_READ) as mm:
+        starts = (m.start() for m in _MBOX_SEP.finditer(mm, start))
+        prev = next(starts, None)
+        while prev is not None:
+            nxt = next(starts, None)
+            chunk = mm[prev:nxt if nxt is not None else len(mm)]
+            # Drop the "From sender date" envelope line, undo mboxrd quoting
+            _, _, raw = chunk.partition(b"\n")
+            raw = _MBOXRD_FROM.sub(rb"\1", raw)
+            msg = email.message_from_bytes(raw, policy=email.policy.default)
+            yield _from_message(msg, f"{path.name}@{prev}")
+            prev = nxt
+
+
+READERS = {".txt": read_txt, ".eml": read_eml, ".mbox": read_mbox}
+
+
+def fixture_files(directory: pathlib.Path = None) -> list[pathlib.Path]:
+    directory = directory or FIXTURES_DIR
+    if not directory.is_dir():
+        print(f"[fixtures] {directory} not found — nothing to replay.")
+        return []
+    return sorted(p for p in directory.rglob("*") if p.suffix.lower() in EXTENSIONS)
+
+
+def read_file(path: pathlib.Path, start: int = 0, end: Optional[int] = None) -> Iterator[tuple]:
+    """One file's messages; an mbox from byte `start` up to `end`."""
+    ext = path.suffix.lower()
+    if ext == ".mbox":
+        yield from read_mbox(path, start, end)
+    else:
+        yield from READERS[ext](path)
+
+
+# ── Progress ──────────────────────────────────────────────────────────────────
+
+def _resume_at(conn, path: pathlib.Path, st) -> Optional[int]:
+    """
+    Byte offset to start reading `path` from, or None when it is unchanged
+    since the last pass. An mbox that only grew resumes where that pass
+    ended; anything else rewritten is read again from the top (the
+    per-message fingerprints keep that from inserting twice).
+    """
+    row = conn.execute("SELECT size, mtime, offset FROM fixture_files WHERE path=?",
+                       (str(path),)).fetchone()
+    if row is None:
+        return 0
+    if row["size"] == st.st_size and row["mtime"] == st.st_mtime:
+        return None
+    if path.suffix.lower() == ".mbox" and 0 < row["offset"] < st.st_size:
+        with open(path, "rb") as f:
+            f.seek(row["offset"])
+            if f.read(5) == b"From ":
+                return row["offset"]
+    return 0
+
+
+def _save_progress(conn, path: pathlib.Path, st):
+    now = datetime.datetime.utcnow().isoformat() + "Z"
+    conn.execute("""
+        INSERT INTO fixture_files (path, size, mtime, offset, updated_at) VALUES (?,?,?,?,?)
+        ON CONFLICT(path) DO UPDATE SET size=excluded.size, mtime=excluded.mtime,
+                                        offset=excluded.offset, updated_at=excluded.updated_at
+    """, (str(path), st.st_size, st.st_mtime, st.st_size, now))
+    conn.commit()
+
+
+# ── Replay ────────────────────────────────────────────────────────────────────
+
+class _RateLimiter:
+    """Evenly spaced token schedule shared by all workers. rate <= 0 disables."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self.next_at  = time.monotonic()
+        self.lock     = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            at  = max(self.next_at, now)
+            self.next_at = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+def replay(directory: pathlib.Path = None, rate: float = None,
+           concurrency: int = None, repeat: int = 1, incremental: bool = False) -> int:
+    """
+    Push every fixture message through gmail.ingest_message.
+    repeat > 1 re-sends the corpus under fresh keys (load generation).
+    incremental (the poll loop) skips files already fully replayed and
+    resumes a grown mbox — see _resume_at. Returns the number of new leads stored.
+    """
+    import gmail as gm
+
+    rate        = float(os.getenv("FIXTURE_RATE", "0")) if rate is None else rate
+    concurrency = max(1, int(os.getenv("FIXTURE_CONCURRENCY", "1")) if concurrency is None else concurrency)
+    limiter     = _RateLimiter(rate)
+    local       = threading.local()
+    counts      = {"new": 0, "seen": 0, "failed": 0}
+    count_lock  = threading.Lock()
+    slots       = concurrency * 2
+    inflight    = threading.BoundedSemaphore(slots)  # keep the mbox stream lazy
+    conns       = []
+
+    def _conn():
+        if not hasattr(local, "conn"):
+            local.conn = get_conn()
+            with count_lock:
+                conns.append(local.conn)
+        return local.conn
+
+    def _ingest(key, headers, body, thread_id, pass_no):
+        try:
+            limiter.wait()
+            suffix = f"#{pass_no}" if pass_no else ""
+            fp = "fx_" + hashlib.sha1(f"{key}{suffix}".encode()).hexdigest()
+            lead_id = gm.ingest_message(
+                _conn(), dict(headers), body,
+                thread_id=f"{thread_id}{suffix}" if thread_id else None, fingerprint=fp,
+            )
+            with count_lock:
+                counts["seen"] += 1
+                counts["new"]  += 1 if lead_id else 0
+        except Exception as e:
+            with count_lock:
+                counts["failed"] += 1
+            print(f"[fixtures] Ingest error ({key}): {e}")
+        finally:
+            inflight.release()
+
+    def _drain():
+        """Wait for every submitted message to finish (all slots free again)."""
+        for _ in range(slots):
+            inflight.acquire()
+        for _ in range(slots):
+            inflight.release()
+
+    conn    = get_conn()
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="fixture") as pool:
+        for pass_no in range(max(1, repeat)):
+            for path in fixture_files(directory):
+                st    = path.stat()
+                start = _resume_at(conn, path, st) if incremental and not pass_no else 0
+                if start is None:
+                    continue
+                failed = counts["failed"]
+                try:
+                    for key, headers, body, thread_id in read_file(path, start, st.st_size):
+                        inflight.acquire()
+                        pool.submit(_ingest, key, headers, body, thread_id, pass_no)
+                except Exception as e:
+                    print(f"[fixtures] Failed to read {path.name}: {e}")
+                    continue
+                _drain()
+                # A file with failed messages is left unrecorded so the next pass retries it
+                if not pass_no and counts["failed"] == failed:
+                    _save_progress(conn, path, st)
+    conn.close()
+    for c in conns:
+        c.close()
+
+    if counts["seen"] or counts["failed"] or not incremental:
+        elapsed = time.monotonic() - started
+        print(f"[fixtures] Replayed {counts['seen']} message(s), {counts['new']} new lead(s) "
+              f"in {elapsed:.1f}s ({concurrency} worker(s), rate={rate or 'unlimited'}/s).")
+    return counts["new"]
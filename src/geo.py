@@ -0,0 +1,168 @@
+"""
+geo.py — Offline geocoding and radius / bounding-box lookups over the property_geo R-Tree.
+
+Addresses and place names are matched against a local gazetteer
+(gazetteer.csv next to this file, or GAZETTEER_PATH). It holds
+neighborhoods, streets, zip codes and towns, each as a point plus the
+radius it covers. A street can be split into house-number ranges. The most
+precise entry the text mentions wins, so "1200 State St, Santa Barbara
+93101" lands on that stretch of State St, not the middle of the city.
+Nothing here touches the network.
+
+A property's point is stored in properties.lat / lon. geo_source records
+the gazetteer entry used and geo_address the address it was computed from.
+Triggers mirror lat / lon into the property_geo R-Tree (see db.init_db),
+so radius and box queries read a few index pages instead of every listing.
+geocode_properties() fills in new or re-addressed listings. db.init_db
+runs it at startup and the property endpoints run it on each save.
+
+  resolve()        place text → {"name", "kind", "lat", "lon", "radius_km"}
+  area()           place text → the lat/lon box "near" it means
+  within_box()     property ids inside a lat/lon box
+  within_radius()  (property id, km) within a radius of a point, nearest first
+"""
+
+import csv
+import math
+import os
+import pathlib
+import re
+import threading
+from typing import Optional
+
+GAZETTEER_PATH = pathlib.Path(os.getenv("GAZETTEER_PATH") or pathlib.Path(__file__).with_name("gazetteer.csv"))
+
+EARTH_RADIUS_KM = 6371.0
+
+# Both gazetteer names and searched text go through _normalize, so
+# "123 State Street." and "State St" meet at "state st"
+_SUFFIXES = {"street": "st", "avenue": "ave", "road": "rd", "boulevard": "blvd",
+             "drive": "dr", "lane": "ln", "place": "pl", "court": "ct"}
+_HOUSE_NUMBER_RE = re.compile(r"^\s*(\d+)\b")
+
+_gazetteer: Optional[tuple] = None
+_gazetteer_lock = threading.Lock()
+
+
+def _normalize(text: str) -> str:
+    words = re.sub(r"[^a-z0-9]+", " ", (text or "").lower()).split()
+    return " ".join(_SUFFIXES.get(w, w) for w in words)
+
+
+def _load() -> tuple:
+    """(entries by normalized name, one regex matching any name), read once."""
+    global _gazetteer
+    with _gazetteer_lock:
+        if _gazetteer is not None:
+            return _gazetteer
+        by_name: dict[str, list[dict]] = {}
+        try:
+            with open(GAZETTEER_PATH, newline="", encoding="utf-8") as f:
+                for row in csv.DictReader(f):
+                    names = [n.strip() for n in row["name"].split("|") if n.strip()]
+                    lo, _, hi = (row.get("numbers") or "").partition("-")
+                    entry = {"name": names[0], "kind": row["kind"], "lat": float(row["lat"]),
+                             "lon": float(row["lon"]), "radius_km": float(row["radius_km"]),
+                             "numbers": (int(lo), int(hi or lo)) if lo else None}
+                    for n in names:
+                        by_name.setdefault(_normalize(n), []).append(entry)
+        except FileNotFoundError:
+            print(f"[geo] No gazetteer at {GAZETTEER_PATH} — addresses stay un-geocoded")
+        # Longest names first, so "upper state st" wins over "state st"
+        names = sorted(by_name, key=len, reverse=True)
+        pattern = re.compile(r"\b(?:" + "|".join(map(re.escape, names)) + r")\b") if names else None
+        _gazetteer = (by_name, pattern)
+        return _gazetteer
+
+
+def resolve(text: str) -> Optional[dict]:
+    """
+    The most precise gazetteer entry the text mentions (smallest radius), or
+    None. House-number ranges apply only when the text starts with a number.
+    """
+    by_name, pattern = _load()
+    if not pattern or not text:
+        return None
+    m = _HOUSE_NUMBER_RE.match(text)
+    number = int(m.group(1)) if m else None
+    best = None
+    for hit in pattern.finditer(_normalize(text)):
+        for e in by_name[hit.group(0)]:
+            if e["numbers"] and (number is None or not e["numbers"][0] <= number <= e["numbers"][1]):
+                continue
+            if best is None or e["radius_km"] < best["radius_km"]:
+                best = e
+    return {k: v for k, v in best.items() if k != "numbers"} if best else None
+
+
+def distance_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    p1, p2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((p2 - p1) / 2) ** 2
+         + math.cos(p1) * math.cos(p2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def box_around(lat: float, lon: float, km: float) -> tuple:
+    """(min_lat, min_lon, max_lat, max_lon) enclosing every point within km (same sphere as distance_km)."""
+    angle = km / EARTH_RADIUS_KM
+    dlat  = math.degrees(angle)
+    # A circle's widest longitude span sits poleward of its centre — asin, not a plain division
+    ratio = math.sin(angle) / max(math.cos(math.radians(lat)), 1e-9)
+    dlon  = math.degrees(math.asin(ratio)) if ratio < 1 else 180.0
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
+
+
+def area(text: str) -> Optional[tuple]:
+    """The box a "near <place>" covers (its gazetteer radius), or None if the place is unknown."""
+    place = resolve(text)
+    return box_around(place["lat"], place["lon"], place["radius_km"]) if place else None
+
+
+# ── Queries ───────────────────────────────────────────────────────────────────
+
+# R-Tree boxes are stored as 32-bit floats, rounded outwards — test overlap,
+# not containment, so a point sitting exactly on an edge is still found
+IN_BOX_SQL = "SELECT id FROM property_geo WHERE max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ?"
+
+
+def box_params(box: tuple) -> list:
+    min_lat, min_lon, max_lat, max_lon = box
+    return [min_lat, max_lat, min_lon, max_lon]
+
+
+def within_box(conn, box: tuple) -> list[int]:
+    return [r["id"] for r in conn.execute(IN_BOX_SQL, box_params(box))]
+
+
+def within_radius(conn, lat: float, lon: float, km: float) -> list[tuple[int, float]]:
+    """(property id, distance km) within km of the point, nearest first — the box prefilters via the R-Tree."""
+    rows = conn.execute(f"SELECT id, lat, lon FROM properties WHERE id IN ({IN_BOX_SQL})",
+                        box_params(box_around(lat, lon, km))).fetchall()
+    hits = [(r["id"], distance_km(lat, lon, r["lat"], r["lon"])) for r in rows]
+    return sorted([h for h in hits if h[1] <= km], key=lambda h: (h[1], h[0]))
+
+
+# ── Geocoding ─────────────────────────────────────────────────────────────────
+
+def geocode_properties(conn, prop_id: int = None) -> int:
+    """
+    Geocode every property whose address changed since it was last geocoded
+    (or just prop_id). Unmatched addresses get NULL coordinates, which takes
+    them out of the R-Tree. Returns the number of rows updated.
+    """
+    sql, params = "SELECT id, address FROM properties WHERE geo_address IS NOT address", []
+    if prop_id is not None:
+        sql += " AND id=?"
+        params.append(prop_id)
+    rows = conn.execute(sql, params).fetchall()
+    located = 0
+    for r in rows:
+        place = resolve(r["address"])
+        located += bool(place)
+        conn.execute("UPDATE properties SET lat=?, lon=?, geo_source=?, geo_address=? WHERE id=?",
+                     (place and place["lat"], place and place["lon"], place and place["name"],
+                      r["address"], r["id"]))
+    conn.commit()
+    if rows and prop_id is None:
+        print(f"[geo] Geocoded {located}/{len(rows)} propert{'y' if len(rows) == 1 else 'ies'}")
+    return len(rows)
@@ -10,7 +10,6 @@ OAuth notes:
 """
 
 import os
-import re
 import base64
 import email.mime.text
 import pathlib
@@ -20,10 +19,14 @@ from typing import Optional
 from google_auth_oauthlib.flow import Flow
 from google.oauth2.credentials import Credentials
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
 
-from leads import parse_email_to_lead, make_fingerprint
+import google_client
+from leads import parse_email_to_lead
 from db import get_conn
+import contacts
+import dedup
+import enrich
+import textguard
 
 # ── Config ────────────────────────────────────────────────────────────────────
 
@@ -42,22 +45,8 @@ def strip_html(html: str) -> str:
     """Convert HTML (from contenteditable) to clean plain text for email sending."""
     if not html:
         return ""
-    # Block-level tags → newlines
-    text = re.sub(r"<br\s*/?>", "\n", html, flags=re.IGNORECASE)
-    text = re.sub(r"</?(p|div|li|tr)[^>]*>", "\n", text, flags=re.IGNORECASE)
-    # Strip all remaining tags
-    text = re.sub(r"<[^>]+>", "", text)
-    # Decode common HTML entities
-    text = (text
-            .replace("&amp;", "&")
-            .replace("&lt;", "<")
-            .replace("&gt;", ">")
-            .replace("&nbsp;", " ")
-            .replace("&#39;", "'")
-            .replace("&quot;", '"'))
-    # Collapse excessive blank lines
-    text = re.sub(r"\n{3,}", "\n\n", text)
-    return text.strip()
+    # Backtracking-safe tag patterns + input cap live in textguard
+    return textguard.strip_tags(html)
 
 
 def _client_config() -> dict:
@@ -96,6 +85,8 @@ def exchange_code(code: str) -> None:
 
 def get_credentials() -> Optional[Credentials]:
     """Load and refresh stored credentials, or return None if not authed."""
+    if google_client.offline():
+        return google_client.stub_credentials(SCOPES)
     if not TOKEN_FILE.exists():
         return None
     try:
@@ -242,17 +233,10 @@ def should_admit_email(subject: str, body: str, headers: dict, conn) -> tuple[bo
 
     from_addr = _extract_email_addr(headers.get("From", ""))
 
-    # Known lead
-    if conn.execute("SELECT 1 FROM leads WHERE lower(from_email)=? LIMIT 1", (from_addr,)).fetchone():
-        return True, "known_lead"
-
-    # Known client
-    if conn.execute("SELECT 1 FROM clients WHERE lower(email)=? LIMIT 1", (from_addr,)).fetchone():
-        return True, "known_client"
-
-    # Lucilease has previously sent an email to this address (drafts table, status=sent)
-    if conn.execute("SELECT 1 FROM drafts WHERE lower(to_email)=? AND status='sent' LIMIT 1", (from_addr,)).fetchone():
-        return True, "previously_contacted"
+    # Known lead / known client / previously contacted — one indexed contact lookup
+    known = contacts.known_sender_reason(conn, from_addr)
+    if known:
+        return True, known
 
     # Thread ID known
     thread_id = headers.get("_thread_id")  # injected by caller if available
@@ -343,7 +327,7 @@ def scan_sent_for_confirmations() -> list[dict]:
     if not creds:
         return []
 
-    service = build("gmail", "v1", credentials=creds, cache_discovery=False)
+    service = google_client.gmail(creds)
     conn    = get_conn()
     results = []
 
@@ -392,6 +376,76 @@ def scan_sent_for_confirmations() -> list[dict]:
     return results
 
 
+def ingest_message(conn, headers: dict, body: str, msg_id: Optional[str] = None,
+                   thread_id: Optional[str] = None, fingerprint: Optional[str] = None) -> Optional[int]:
+    """
+    Filter, parse and store one inbound message as a lead. Shared by the Gmail
+    poller and fixture replay (fixtures.py) so both take the identical path.
+    fingerprint overrides the per-message key for messages without a Gmail id.
+    Returns the new lead id, or None if filtered or already stored.
+    """
+    if fingerprint and conn.execute("SELECT 1 FROM leads WHERE fingerprint=?", (fingerprint,)).fetchone():
+        return None  # replayed message already stored
+
+    # Truncate + normalize once; every regex below runs on the bounded text
+    subject = headers["Subject"] = textguard.prepare_subject(headers.get("Subject", ""))
+    body    = textguard.prepare(body)
+    # Inject thread_id into headers dict for should_admit_email lookup
+    headers["_thread_id"] = thread_id
+
+    with textguard.Budget(msg_id or fingerprint or subject[:60]) as budget:
+        return _store_lead(conn, headers, subject, body, msg_id, thread_id, fingerprint, budget)
+
+
+def _store_lead(conn, headers: dict, subject: str, body: str, msg_id: Optional[str],
+                thread_id: Optional[str], fingerprint: Optional[str], budget) -> Optional[int]:
+    admit, reason = should_admit_email(subject, body, headers, conn)
+    if not admit:
+        print(f"[gmail] Filtered ({reason}): {subject!r}")
+        return None
+    print(f"[gmail] Admitted ({reason}): {subject!r}")
+    lead = parse_email_to_lead(headers, body, msg_id=msg_id)
+    fp = fingerprint or lead.fingerprint
+    if conn.execute("SELECT 1 FROM leads WHERE fingerprint=?", (fp,)).fetchone():
+        return None
+
+    # Identity is the contact row (normalized email + E.164 phone); the
+    # message itself is keyed by fingerprint / gmail_msg_id. A repeat
+    # cold email from the same person is admitted as "known_lead".
+    contact_id = contacts.upsert_contact(conn, lead.from_email, lead.name, lead.phone)
+
+    # Insert — store full body + thread id
+    cur = conn.execute("""
+        INSERT INTO leads
+            (fingerprint, source, from_email, name, phone, subject,
+             body_excerpt, body_full, budget_monthly_usd, status,
+             first_seen_at, gmail_msg_id, gmail_thread_id, contact_id)
+        VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?)
+    """, (
+        fp, lead.source, lead.from_email, lead.name,
+        lead.phone, lead.subject, lead.body_excerpt, lead.body_full,
+        lead.budget_monthly_usd, "new", lead.first_seen_at,
+        lead.gmail_msg_id, thread_id, contact_id,
+    ))
+    lead_id = cur.lastrowid
+    # Optional stages — over budget they're left for the startup backfills
+    # (enrich_version=0 / dedup_checked=0) instead of stalling the poll
+    if not budget.exceeded("enrich"):
+        try:
+            enrich.enrich_lead(conn, lead_id, lead.subject, lead.body_full, lead.first_seen_at)
+        except Exception as e:
+            print(f"[gmail] Enrichment failed for lead {lead_id}: {e}")
+    # Near-duplicate check (LSH bucket lookup, not a table scan)
+    if not budget.exceeded("dedup"):
+        try:
+            dedup.index_lead(conn, lead_id, dedup.lead_text(lead.subject, lead.body_full), thread_id=thread_id)
+        except Exception as e:
+            print(f"[gmail] Dedup index failed for lead {lead_id}: {e}")
+    conn.commit()
+    print(f"[gmail] New lead: {lead.from_email} — {subject!r}")
+    return lead_id
+
+
 def poll_inbox(label_ids: list[str] = None) -> int:
     """
     Fetch inbox messages from the last 7 days, filter for housing relevance,
@@ -402,7 +456,7 @@ def poll_inbox(label_ids: list[str] = None) -> int:
         print("[gmail] Not authenticated — skipping poll.")
         return 0
 
-    service = build("gmail", "v1", credentials=creds, cache_discovery=False)
+    service = google_client.gmail(creds)
     conn    = get_conn()
     new_count = 0
 
@@ -457,10 +511,7 @@ def poll_inbox(label_ids: list[str] = None) -> int:
             headers     = {h["name"]: h["value"] for h in headers_raw}
             body        = _extract_body(msg["payload"])
 
-            subject   = headers.get("Subject", "")
             thread_id = msg.get("threadId")
-            # Inject thread_id into headers dict for should_admit_email lookup
-            headers["_thread_id"] = thread_id
 
             # Skip emails sent FROM the agent's own account (e.g. outgoing replies in inbox)
             from_raw  = headers.get("From", "")
@@ -468,46 +519,8 @@ def poll_inbox(label_ids: list[str] = None) -> int:
             if agent_email and from_addr == agent_email:
                 continue
 
-            admit, reason = should_admit_email(subject, body, headers, conn)
-            if not admit:
-                print(f"[gmail] Filtered ({reason}): {subject!r}")
-                continue
-            print(f"[gmail] Admitted ({reason}): {subject!r}")
-            lead = parse_email_to_lead(headers, body, msg_id=msg_id)
-
-            # Fingerprint dedup ONLY for cold first-contact emails (housing_keyword reason).
-            # Replies and messages from known contacts must always be inserted —
-            # the same person can send many messages in a thread. gmail_msg_id (checked
-            # above) is the true unique key; fingerprint only guards against duplicate
-            # cold leads from the same person.
-            if reason == "housing_keyword":
-                dup = conn.execute(
-                    "SELECT id FROM leads WHERE fingerprint=?", (lead.fingerprint,)
-                ).fetchone()
-                if dup:
-                    print(f"[gmail] Duplicate cold lead skipped: {lead.from_email}")
-                    continue
-
-            # Use a per-message fingerprint for non-cold emails so the UNIQUE constraint
-            # on fingerprint doesn't block the insert
-            fp = lead.fingerprint if reason == "housing_keyword" else f"msg_{msg_id}"
-
-            # Insert — store full body + thread id
-            conn.execute("""
-                INSERT INTO leads
-                    (fingerprint, source, from_email, name, phone, subject,
-                     body_excerpt, body_full, budget_monthly_usd, status,
-                     first_seen_at, gmail_msg_id, gmail_thread_id)
-                VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)
-            """, (
-                fp, lead.source, lead.from_email, lead.name,
-                lead.phone, lead.subject, lead.body_excerpt, lead.body_full,
-                lead.budget_monthly_usd, "new", lead.first_seen_at,
-                lead.gmail_msg_id, thread_id,
-            ))
-            conn.commit()
-            new_count += 1
-            print(f"[gmail] New lead: {lead.from_email} — {subject!r}")
+            if ingest_message(conn, headers, body, msg_id=msg_id, thread_id=thread_id):
+                new_count += 1
 
     except Exception as e:
         print(f"[gmail] Poll error: {e}")
@@ -561,7 +574,7 @@ def get_thread_messages(creds, thread_id: str) -> list[dict]:
     Fetch all messages in a Gmail thread.
     Returns list of dicts: {from, date, subject, body} sorted oldest-first.
     """
-    service = build("gmail", "v1", credentials=creds, cache_discovery=False)
+    service = google_client.gmail(creds)
     thread = service.users().threads().get(
         userId="me", id=thread_id, format="full"
     ).execute()
@@ -591,7 +604,7 @@ def archive_gmail_message(creds, msg_id: str) -> bool:
     if not msg_id:
         print("[gmail] archive_gmail_message: no msg_id, skipping.")
         return False
-    service = build("gmail", "v1", credentials=creds, cache_discovery=False)
+    service = google_client.gmail(creds)
     result = service.users().messages().modify(
         userId="me",
         id=msg_id,
@@ -607,7 +620,7 @@ def get_rfc_message_id(creds, gmail_thread_id: str) -> Optional[str]:
     Used to set In-Reply-To + References so replies thread correctly everywhere.
     """
     try:
-        service = build("gmail", "v1", credentials=creds, cache_discovery=False)
+        service = google_client.gmail(creds)
         thread  = service.users().threads().get(
             userId="me", id=gmail_thread_id, format="metadata",
             metadataHeaders=["Message-ID"]
@@ -632,7 +645,7 @@ def send_gmail_message(creds, to: str, subject: str, body: str,
     Pass in_reply_to (RFC Message-ID) to set proper reply headers.
     If thread_id is given but in_reply_to is not, we auto-fetch the RFC id.
     """
-    service = build("gmail", "v1", credentials=creds, cache_discovery=False)
+    service = google_client.gmail(creds)
 
     # Resolve sender address from Gmail profile so From header is correct
     try:
@@ -666,7 +679,7 @@ def send_gmail_message(creds, to: str, subject: str, body: str,
 
 def update_gmail_draft(creds, draft_id: str, to: str, subject: str, body: str) -> str:
     """Update an existing Gmail draft. Returns draft id."""
-    service = build("gmail", "v1", credentials=creds, cache_discovery=False)
+    service = google_client.gmail(creds)
     msg = email.mime.text.MIMEText(strip_html(body))
     msg["to"] = to
     msg["subject"] = subject
@@ -680,7 +693,7 @@ def update_gmail_draft(creds, draft_id: str, to: str, subject: str, body: str) -
 
 def send_gmail_draft(creds, draft_id: str) -> str:
     """Send an existing Gmail draft by id. Returns sent message id."""
-    service = build("gmail", "v1", credentials=creds, cache_discovery=False)
+    service = google_client.gmail(creds)
     result = service.users().drafts().send(
         userId="me", body={"id": draft_id}
     ).execute()
@@ -695,7 +708,7 @@ def create_gmail_draft_public(creds, to: str, subject: str, body: str,
 
 def _create_gmail_draft_impl(creds, to: str, subject: str, body: str,
                               thread_id=None) -> str:
-    service = build("gmail", "v1", credentials=creds, cache_discovery=False)
+    service = google_client.gmail(creds)
 
     # Fetch RFC Message-ID for proper reply threading
     in_reply_to = None
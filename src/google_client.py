@@ -0,0 +1,52 @@
+"""
+google_client.py — Builds the Gmail and Calendar API clients.
+
+Every Google API call goes through a service built here, so one setting can
+point all of them somewhere else:
+
+  GOOGLE_API_BASE_URL   unset (default) → the real Google APIs.
+                        e.g. http://127.0.0.1:8787 → scripts/api_stub.py,
+                        which serves recorded or synthetic Gmail / Calendar
+                        data. Credentials become a static token, so no
+                        OAuth or /data/token.json is needed.
+
+Discovery documents are the ones bundled with google-api-python-client
+(static_discovery), so building a client never touches the network.
+"""
+
+import os
+from typing import Optional
+
+from google.oauth2.credentials import Credentials
+from googleapiclient.discovery import build
+
+BASE_URL = os.getenv("GOOGLE_API_BASE_URL", "").strip().rstrip("/")
+
+# servicePath from each discovery document — api_endpoint replaces rootUrl
+# AND servicePath, so it is added back to keep the stand-in's paths real
+_SERVICE_PATHS = {"gmail": "", "calendar": "calendar/v3/"}
+
+
+def offline() -> bool:
+    """True when Google APIs are served by a local stand-in."""
+    return bool(BASE_URL)
+
+
+def stub_credentials(scopes: Optional[list[str]] = None) -> Credentials:
+    """A never-expiring bearer token for the stand-in (it ignores auth)."""
+    return Credentials(token="stub", scopes=scopes)
+
+
+def service(name: str, version: str, creds):
+    if BASE_URL:
+        return build(name, version, credentials=creds, cache_discovery=False, static_discovery=True,
+                     client_options={"api_endpoint": f"{BASE_URL}/{_SERVICE_PATHS.get(name, '')}"})
+    return build(name, version, credentials=creds, cache_discovery=False)
+
+
+def gmail(creds):
+    return service("gmail", "v1", creds)
+
+
+def calendar(creds):
+    return service("calendar", "v3", creds)
@@ -0,0 +1,210 @@
+"""
+jobs.py — Background jobs for Lucilease (bulk drafting).
+
+A job is a plain dict held in memory and polled via GET /api/jobs/{id}.
+Results are kept in the order the caller gave, one entry per lead:
+
+    {"lead_id": 12, "status": "pending"|"running"|"drafted"|"flagged"|"deferred"|"error", ...}
+
+'deferred' means the bulk lane's token budget is spent or Claude's circuit
+breaker is open (llm.DEFERRED); its error says which, and the lead stays
+'new' for the next run.
+
+Modes:
+- interactive  drafts run through a worker pool capped at
+               BULK_DRAFT_CONCURRENCY, in llm.py's "bulk" lane so a big
+               job never starves UI drafting or the poll loop's scans
+- overnight    prompts are built locally, then all draft calls (tone
+               check folded in for cold senders) go out as one Anthropic
+               Message Batch, polled
+               every BATCH_POLL_SECONDS until it ends
+
+Jobs don't survive a restart, but every finished draft is already saved in
+the drafts table — re-running the job only drafts what's still 'new'.
+"""
+
+import asyncio
+import datetime
+import os
+import threading
+import uuid
+from typing import Optional
+
+BULK_DRAFT_CONCURRENCY = int(os.getenv("BULK_DRAFT_CONCURRENCY", "4"))
+BATCH_POLL_SECONDS     = float(os.getenv("BATCH_POLL_SECONDS", "60"))
+MAX_JOBS               = 50      # finished jobs kept for polling
+
+_jobs: dict[str, dict] = {}
+_lock = threading.Lock()
+_tasks: set = set()      # strong refs so running jobs aren't garbage-collected
+
+
+def _now() -> str:
+    return datetime.datetime.utcnow().isoformat() + "Z"
+
+
+# ── Registry ──────────────────────────────────────────────────────────────────
+
+def create_job(kind: str, lead_ids: list[int], mode: str) -> dict:
+    job = {
+        "id":          uuid.uuid4().hex[:12],
+        "kind":        kind,
+        "mode":        mode,
+        "status":      "queued",        # queued | running | waiting_batch | done | failed
+        "created_at":  _now(),
+        "finished_at": None,
+        "total":       len(lead_ids),
+        "done":        0,
+        "batch_id":    None,
+        "error":       None,
+        "results":     [{"lead_id": lid, "status": "pending"} for lid in lead_ids],
+    }
+    with _lock:
+        _jobs[job["id"]] = job
+        finished = [j for j in _jobs.values() if j["finished_at"]]
+        for old in sorted(finished, key=lambda j: j["finished_at"])[:max(0, len(_jobs) - MAX_JOBS)]:
+            _jobs.pop(old["id"], None)
+    return job
+
+
+def get_job(job_id: str) -> Optional[dict]:
+    with _lock:
+        job = _jobs.get(job_id)
+        if not job:
+            return None
+        return {**job, "results": [dict(r) for r in job["results"]]}
+
+
+def _set_result(job: dict, index: int, **fields):
+    with _lock:
+        job["results"][index].update(fields)
+        if fields.get("status") in ("drafted", "flagged", "deferred", "error"):
+            job["done"] += 1
+
+
+def _finish(job: dict, status: str = "done", error: str = None):
+    with _lock:
+        job["status"]      = status
+        job["error"]       = error
+        job["finished_at"] = _now()
+    ok = sum(1 for r in job["results"] if r["status"] == "drafted")
+    print(f"[jobs] {job['kind']} {job['id']} {status}: {ok}/{job['total']} drafted ({job['mode']})")
+
+
+def _outcome(result: dict) -> dict:
+    if result.get("needs_review"):
+        return {"status": "flagged", "flag": result.get("flag"), "reason": result.get("reason")}
+    return {"status": "drafted", "draft_id": result.get("draft_db_id"),
+            "gmail_draft_id": result.get("gmail_draft_id"), "subject": result.get("subject")}
+
+
+# ── Bulk drafting ─────────────────────────────────────────────────────────────
+
+def start_bulk_draft(lead_ids: list[int], mode: str = "interactive") -> dict:
+    """Register a draft job and run it on the current event loop."""
+    job = create_job("draft", lead_ids, mode)
+    task = asyncio.create_task(run_bulk_draft(job))
+    _tasks.add(task)
+    task.add_done_callback(_tasks.discard)
+    return get_job(job["id"])
+
+
+async def run_bulk_draft(job: dict):
+    try:
+        with _lock:
+            job["status"] = "running"
+        if job["mode"] == "overnight":
+            await _draft_batch(job)
+        else:
+            await _draft_interactive(job)
+        _finish(job)
+    except Exception as e:
+        print(f"[jobs] {job['id']} failed: {e}")
+        for i, r in enumerate(job["results"]):
+            if r["status"] in ("pending", "running"):
+                _set_result(job, i, status="error", error=str(e))
+        _finish(job, "failed", str(e))
+
+
+async def _draft_interactive(job: dict):
+    import llm
+    from ai import draft_reply
+    sem = asyncio.Semaphore(max(1, BULK_DRAFT_CONCURRENCY))
+
+    async def _one(index: int, lead_id: int):
+        llm.use_lane("bulk")   # this task's context only — UI drafts keep the interactive lane
+        async with sem:
+            _set_result(job, index, status="running")
+            try:
+                result = await asyncio.to_thread(draft_reply, lead_id)
+                _set_result(job, index, **_outcome(result))
+            except llm.DEFERRED as e:
+                _set_result(job, index, status="deferred", error=str(e))
+            except Exception as e:
+                _set_result(job, index, status="error", error=str(e))
+
+    await asyncio.gather(*(_one(i, r["lead_id"]) for i, r in enumerate(job["results"])))
+
+
+async def _draft_batch(job: dict):
+    import llm
+    import predraft
+    from ai import prepare_draft, resolve_draft, reuse_draft
+
+    # 1. Build every prompt locally; pre-drafts, reused replies and cache hits finish here
+    prepared, requests = {}, []
+    for i, r in enumerate(job["results"]):
+        try:
+            p = await asyncio.to_thread(prepare_draft, r["lead_id"])
+        except Exception as e:
+            _set_result(job, i, status="error", error=str(e))
+            continue
+        hit = await asyncio.to_thread(predraft.take, p)
+        if hit is None:
+            reused = await asyncio.to_thread(reuse_draft, p)
+            if reused:
+                _set_result(job, i, **_outcome(reused))
+                continue
+            hit = await asyncio.to_thread(llm.cached, p["task"], p["prompt"], p["max_tokens"], p["system"])
+        if hit is not None:
+            _set_result(job, i, **_outcome(await asyncio.to_thread(resolve_draft, p, hit)))
+            continue
+        custom_id = f"lead-{r['lead_id']}-{i}"
+        prepared[custom_id] = (i, p)
+        requests.append({"custom_id": custom_id, "task": p["task"], "prompt": p["prompt"],
+                         "max_tokens": p["max_tokens"], "system": p["system"]})
+    if not requests:
+        return
+    llm.use_lane("bulk")
+    reason = next(filter(None, (llm.queue_reason(r["task"]) for r in requests)), None)
+    if reason:
+        error = "Claude unavailable — circuit open" if reason == "circuit open" else "LLM token budget exceeded"
+        for custom_id, (i, _) in prepared.items():
+            _set_result(job, i, status="deferred", error=error)
+        print(f"[jobs] Bulk drafts deferred — {reason}")
+        return
+
+    # 2. One batch for the rest, polled until it ends
+    batch_id = await asyncio.to_thread(llm.submit_batch, requests)
+    with _lock:
+        job["batch_id"] = batch_id
+        job["status"]   = "waiting_batch"
+    for custom_id, (i, _) in prepared.items():
+        _set_result(job, i, status="running")
+    while True:
+        await asyncio.sleep(BATCH_POLL_SECONDS)
+        status = await asyncio.to_thread(llm.batch_status, batch_id)
+        if status["status"] == "ended":
+            break
+
+    # 3. Save drafts (or review flags) in the caller's order
+    texts = await asyncio.to_thread(llm.batch_results, "draft_reply", batch_id, requests)
+    for custom_id, (i, p) in sorted(prepared.items(), key=lambda kv: kv[1][0]):
+        text = texts.get(custom_id)
+        if text is None:
+            _set_result(job, i, status="error", error="batch request failed")
+            continue
+        try:
+            _set_result(job, i, **_outcome(await asyncio.to_thread(resolve_draft, p, text)))
+        except Exception as e:
+            _set_result(job, i, status="error", error=str(e))
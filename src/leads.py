@@ -1,5 +1,8 @@
 """
 leads.py — Pydantic lead model, email parser, and dedup logic.
+
+Person identity (who sent this?) lives in contacts.py. `fingerprint` is the
+per-message key: `msg_<gmail id>` for Gmail, a content hash otherwise.
 """
 
 import re
@@ -8,6 +11,8 @@ import datetime
 from typing import Optional
 from pydantic import BaseModel
 
+from textguard import find_budget
+
 
 class Lead(BaseModel):
     source:              str = "gmail"
@@ -24,6 +29,7 @@ class Lead(BaseModel):
 
 
 def make_fingerprint(email: str, phone: str = "") -> str:
+    """Stable hash for messages without a Gmail id (fixtures, seeds)."""
     raw = (email.strip().lower() + "|" + re.sub(r"\D", "", phone or "")).encode("utf-8")
     return hashlib.sha256(raw).hexdigest()
 
@@ -59,15 +65,9 @@ def parse_email_to_lead(headers: dict, body: str, msg_id: str = None) -> Lead:
     phone = phone_m.group(1) if phone_m else None
 
     # Monthly budget
-    budget = None
-    budget_m = re.search(
-        r"\$?\s*([0-9]{1,3}(?:,[0-9]{3})*)(?:\s*/\s*month|\s*per\s*month|/mo\b|/month\b)",
-        body, re.IGNORECASE,
-    )
-    if budget_m:
-        budget = int(budget_m.group(1).replace(",", ""))
+    budget = find_budget(body)
 
-    fp = make_fingerprint(from_email, phone or "")
+    fp = f"msg_{msg_id}" if msg_id else make_fingerprint(from_email, phone or "")
 
     body_clean = body.strip()
     return Lead(
@@ -0,0 +1,194 @@
+"""
+listing_context.py — Rendered listing + availability text for prompts, built once per change.
+
+Every draft prompt carries the same block: active properties with their
+open house windows, then the agent's availability. Rendering it took 11+
+queries and the string formatting per lead. Now it is rendered once and
+stored in context_cache, stamped with context_version — a counter SQLite
+triggers bump on any write to properties, open_house_slots or the
+availability_windows / timezone config keys (see db.init_db), including
+writes from the seed scripts. A reader checks the counter (one query,
+in-process copy first) and only re-renders when it has moved.
+
+  listing()       properties + availability — the draft system prefix
+  availability()  "Mon 09:00–18:00, …" + timezone — time-suggestion prompts
+  catalog()       active listing count + types — matching.py's lookups
+
+Past PROPERTY_LIMIT active listings the prefix no longer lists them; each
+draft prompt instead carries the few that fit its lead (matching.py),
+rendered with render_properties().
+"""
+
+import datetime
+import json
+import threading
+
+from db import get_conn
+
+PROPERTY_LIMIT   = 10
+DEFAULT_TIMEZONE = "America/Los_Angeles"
+DEFAULT_AVAIL    = "weekdays 9am–6pm"
+
+DAY_SHORT = {"monday": "Mon", "tuesday": "Tue", "wednesday": "Wed", "thursday": "Thu",
+             "friday": "Fri", "saturday": "Sat", "sunday": "Sun"}
+
+_memo: dict[str, tuple[int, object]] = {}
+_memo_lock = threading.Lock()
+
+
+# ── Rendering ─────────────────────────────────────────────────────────────────
+
+def _settings(conn) -> dict:
+    rows = conn.execute(
+        "SELECT key, value FROM config WHERE key IN ('availability_windows', 'timezone')"
+    ).fetchall()
+    cfg = {r["key"]: r["value"] for r in rows}
+    return {"timezone": cfg.get("timezone") or DEFAULT_TIMEZONE, "windows": cfg.get("availability_windows")}
+
+
+def _enabled_windows(avail_raw) -> list[dict]:
+    try:
+        return [w for w in json.loads(avail_raw or "[]") if w.get("enabled")]
+    except Exception:
+        return []
+
+
+def _window_text(windows: list[dict]) -> str:
+    return ", ".join(f"{DAY_SHORT.get(w['day'], w['day'])} {w['start']}–{w['end']}" for w in windows)
+
+
+def render_properties(conn, properties: list[dict]) -> str:
+    """One "- address | type | beds | price" entry per property, with notes and open house times."""
+    # One query for every listed property's open house slots
+    open_house_slots = {}
+    if properties:
+        marks = ",".join("?" * len(properties))
+        for s in conn.execute(f"""
+            SELECT * FROM open_house_slots WHERE property_id IN ({marks})
+            ORDER BY day_of_week, start_time
+        """, [p["id"] for p in properties]).fetchall():
+            open_house_slots.setdefault(s["property_id"], []).append(dict(s))
+
+    text = ""
+    for p in properties:
+        price = (f"${p['price_monthly']:,}/mo" if p.get("price_monthly")
+                 else f"${p['price_sale']:,}" if p.get("price_sale") else "price TBD")
+        beds  = f"{p['bedrooms']}bd/{p['bathrooms']}ba" if p.get("bedrooms") else ""
+        text += f"- {p['address']} | {p['type']} | {beds} | {price}\n"
+        if p.get("notes"):
+            text += f"  Notes: {p['notes']}\n"
+        slots = open_house_slots.get(p["id"], [])
+        if slots:
+            slot_strs = [
+                f"{DAY_SHORT.get(s['day_of_week'], s['day_of_week'])} {s['start_time']}–{s['end_time']}"
+                + (f" ({s['label']})" if s.get('label') else "")
+                for s in slots
+            ]
+            text += f"  Open house times: {', '.join(slot_strs)}\n"
+    return text
+
+
+def _render_catalog(conn) -> dict:
+    types = [r["type"] for r in conn.execute(
+        "SELECT DISTINCT type FROM properties WHERE status='active' AND type IS NOT NULL ORDER BY type")]
+    active = conn.execute("SELECT COUNT(*) n FROM properties WHERE status='active'").fetchone()["n"]
+    return {"active": active, "types": types}
+
+
+def _render_listing(conn) -> str:
+    """
+    Properties (with open house windows) + agent availability, as one stable
+    block. Identical for every lead until a listing or setting changes, so it
+    sits in the prompt-cached system prefix.
+    """
+    props_text = ""
+    active = _render_catalog(conn)["active"]
+    if active > PROPERTY_LIMIT:
+        props_text = (f"You represent {active} active listings. The ones that best fit each client are "
+                      "listed with their inquiry — suggest only from those.")
+    elif active:
+        properties = [dict(r) for r in conn.execute(
+            "SELECT * FROM properties WHERE status='active' ORDER BY created_at DESC LIMIT ?", (PROPERTY_LIMIT,)
+        ).fetchall()]
+        props_text = "Available properties you represent:\n" + render_properties(conn, properties)
+
+    settings = _settings(conn)
+    windows  = _enabled_windows(settings["windows"])
+    avail_text = ""
+    if windows:
+        avail_text = f"Your general availability for appointments ({settings['timezone']}): {_window_text(windows)}."
+
+    return "\n\n".join(t.strip() for t in (props_text, avail_text) if t)
+
+
+def _render_availability(conn) -> dict:
+    settings = _settings(conn)
+    windows  = _enabled_windows(settings["windows"])
+    return {"timezone": settings["timezone"], "text": _window_text(windows) if windows else DEFAULT_AVAIL}
+
+
+_RENDERERS = {
+    "listing":      _render_listing,
+    "availability": lambda conn: json.dumps(_render_availability(conn)),
+    "catalog":      lambda conn: json.dumps(_render_catalog(conn)),
+}
+
+
+# ── Cache ─────────────────────────────────────────────────────────────────────
+
+def version(conn) -> int:
+    row = conn.execute("SELECT version FROM context_version WHERE id=1").fetchone()
+    return row["version"] if row else 0
+
+
+def _get(name: str, conn=None) -> str:
+    own = conn is None
+    conn = conn or get_conn()
+    try:
+        current = version(conn)
+        with _memo_lock:
+            hit = _memo.get(name)
+        if hit and hit[0] == current:
+            return hit[1]
+
+        row = conn.execute("SELECT text FROM context_cache WHERE name=? AND version=?",
+                           (name, current)).fetchone()
+        if row:
+            text = row["text"]
+        else:
+            # Rendered against the version read above: if a write lands
+            # meanwhile, the counter moves on and the next read re-renders
+            text = _RENDERERS[name](conn)
+            conn.execute("""
+                INSERT INTO context_cache (name, version, text, built_at) VALUES (?,?,?,?)
+                ON CONFLICT(name) DO UPDATE SET version=excluded.version, text=excluded.text,
+                                                built_at=excluded.built_at
+            """, (name, current, text, datetime.datetime.utcnow().isoformat() + "Z"))
+            conn.commit()
+            print(f"[context] Rebuilt {name} context (v{current})")
+        with _memo_lock:
+            _memo[name] = (current, text)
+        return text
+    finally:
+        if own:
+            conn.close()
+
+
+def listing(conn=None) -> str:
+    """Properties + open house times + availability, for the draft system prefix."""
+    return _get("listing", conn)
+
+
+def availability(conn=None) -> tuple[str, str]:
+    """(timezone, availability text) for prompts that suggest meeting times."""
+    data = json.loads(_get("availability", conn))
+    return data["timezone"], data["text"]
+
+
+def catalog(conn=None) -> dict:
+    """{"active": number of active listings, "types": their distinct types}."""
+    return json.loads(_get("catalog", conn))
+
+
+def property_types(conn=None) -> list[str]:
+    return catalog(conn)["types"]
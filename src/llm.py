@@ -0,0 +1,977 @@
+"""
+llm.py — Claude calls for Lucilease, behind a persistent response cache.
+
+Every ai.py prompt goes through complete(task, prompt, ...). Responses are
+stored in SQLite (llm_cache) keyed by a SHA-256 of model + prompt + params,
+so an unchanged thread re-scanned by /api/scan-appointments, or a tone check
+re-run on a re-clicked draft, costs zero tokens and returns immediately.
+
+- TTL per task (TASK_TTL_HOURS). Prompts that embed today's date miss
+  naturally on the next day.
+- Size-bounded: least-recently-used rows are evicted past MAX_ENTRIES.
+- bypass=True skips the read (regenerate) but still refreshes the entry.
+- Hit / miss / bypass counters per task in llm_cache_stats.
+
+Prompts are split into a stable system prefix (agent profile, rules, listing
+context — see prefix()) and the per-lead content last. The prefix is marked
+for Anthropic prompt caching, so drafting a queue of leads against the same
+listings re-reads it from the API-side cache instead of re-processing it.
+Cache read/write token counts for every API call are recorded in llm_usage.
+
+Set LLM_CACHE=off in .env to disable caching entirely.
+
+All API traffic goes through one shared AsyncAnthropic client (keep-alive
+connection pool) running on a dedicated event-loop thread. Sync callers —
+ai.py under asyncio.to_thread, scripts — block on it via _run(). Each task
+belongs to a capacity lane (TASK_LANE) with its own semaphore, so the poll
+loop's scans, UI drafting and bulk jobs share capacity predictably. 429,
+529, 5xx and connection errors are retried with jittered backoff.
+
+Every API call — including failures and budget refusals — lands in
+llm_usage (tokens, latency, outcome, estimated cost) and is rolled up per
+day/task/model into llm_usage_daily. Daily and monthly token budgets (config
+table, GET/POST /api/config/llm-budget) apply to the background and bulk
+lanes only: once spent, each task either downgrades to BUDGET_MODEL or is
+refused with BudgetExceeded so its caller can retry after the reset.
+Interactive drafting is never limited.
+
+A circuit breaker stops an Anthropic outage from tying up every worker:
+after repeated failed or too-slow calls, complete()/stream() refuse at once
+with CircuitOpen until a cooldown passes and one trial call succeeds. Scans
+queue the leads they couldn't classify; interactive paths fall back to
+templates (ai.py). Cache hits keep working throughout.
+"""
+
+import asyncio
+import contextvars
+import datetime
+import hashlib
+import json
+import os
+import queue
+import random
+import threading
+import time
+from typing import Optional
+
+import anthropic
+import httpx
+
+from db import get_conn
+
+MODEL = "claude-sonnet-4-5"
+
+TASK_TTL_HOURS = {
+    "tone":                 24 * 30,
+    "draft_reply":          24,
+    "draft_triage":         24,
+    "confirmation":         24 * 7,
+    "thread_classify":      24 * 7,
+    "thread_classify_batch": 24 * 7,
+    "thread_summary":       24 * 30,
+    "availability_options": 24,
+    "alternative_times":    24,
+    "confirmation_prose":   24 * 30,
+}
+DEFAULT_TTL_HOURS = 24
+
+# Per-task model routing. Drafting stays on Sonnet; classifiers, JSON
+# extractors and the two-sentence confirmation prose run on Haiku. Override
+# per install with config key llm_model_<task> (POST /api/config/llm-models)
+# or env LLM_MODEL_<TASK>; scripts/eval_models.py measures candidates.
+FAST_MODEL = "claude-haiku-4-5"
+TASK_MODELS = {
+    "draft_reply":          MODEL,
+    "draft_triage":         MODEL,
+    "availability_options": MODEL,
+    "alternative_times":    MODEL,
+    "confirmation_prose":   FAST_MODEL,
+    "tone":                 FAST_MODEL,
+    "confirmation":         FAST_MODEL,
+    "thread_classify":      FAST_MODEL,
+    "thread_classify_batch": FAST_MODEL,
+    "thread_summary":       FAST_MODEL,
+}
+MODEL_CHECK_SECONDS = 15
+
+# LLM_RECORD_PATH=/data/llm_corpus.jsonl appends every API call's request +
+# response — the corpus scripts/eval_models.py replays
+RECORD_PATH = os.getenv("LLM_RECORD_PATH", "").strip()
+
+MAX_ENTRIES    = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "5000"))
+EVICT_EVERY    = 50      # writes between LRU sweeps
+CACHE_ENABLED  = os.getenv("LLM_CACHE", "on").strip().lower() not in ("off", "0", "false")
+
+_writes      = 0
+_writes_lock = threading.Lock()
+
+
+# ── Client ────────────────────────────────────────────────────────────────────
+
+TIMEOUT_SECONDS    = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+MAX_RETRIES        = int(os.getenv("LLM_MAX_RETRIES", "4"))
+RETRY_BASE_SECONDS = 1.0
+RETRY_MAX_SECONDS  = 30.0
+
+# Capacity lanes. UI-facing work never queues behind a scan or a bulk job.
+TASK_LANE = {
+    "draft_reply":          "interactive",
+    "draft_triage":         "interactive",
+    "availability_options": "interactive",
+    "alternative_times":    "interactive",
+    "confirmation_prose":   "interactive",
+    "tone":                 "background",
+    "confirmation":         "background",
+    "thread_classify":      "background",
+    "thread_classify_batch": "background",
+    "thread_summary":       "background",
+}
+LANE_LIMITS = {
+    "interactive": int(os.getenv("LLM_CONCURRENCY_INTERACTIVE", "4")),
+    "background":  int(os.getenv("LLM_CONCURRENCY_BACKGROUND", "2")),
+    "bulk":        int(os.getenv("LLM_CONCURRENCY_BULK", "3")),
+    "batch":       2,      # Message Batch create/retrieve/results
+}
+
+_loop       = None
+_loop_lock  = threading.Lock()
+_aclient    = None
+_semaphores: dict[str, asyncio.Semaphore] = {}
+_lane_override = contextvars.ContextVar("llm_lane", default=None)
+
+
+def use_lane(lane: str):
+    """Route this context's calls through another lane (jobs.py: 'bulk').
+    asyncio.to_thread copies the context, so it follows into worker threads."""
+    _lane_override.set(lane)
+
+
+def _lane(task: str) -> str:
+    return _lane_override.get() or TASK_LANE.get(task, "background")
+
+
+def lane(task: str) -> str:
+    """Lane a call for `task` would run in from this context."""
+    return _lane(task)
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-loop", daemon=True).start()
+    return _loop
+
+
+def _run(coro):
+    """Run a coroutine on the llm loop and block until it finishes."""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
+
+
+def _client() -> anthropic.AsyncAnthropic:
+    """The shared client. Only touched from the llm loop thread."""
+    global _aclient
+    if _aclient is None:
+        slots = sum(LANE_LIMITS.values())
+        _aclient = anthropic.AsyncAnthropic(
+            api_key=os.environ["ANTHROPIC_API_KEY"],
+            max_retries=0,                        # _with_retries owns retrying
+            timeout=httpx.Timeout(TIMEOUT_SECONDS, connect=5.0),
+            connection_pool_limits=httpx.Limits(max_connections=slots, max_keepalive_connections=slots,
+                                                keepalive_expiry=60),
+        )
+    return _aclient
+
+
+def _semaphore(lane: str) -> asyncio.Semaphore:
+    if lane not in _semaphores:
+        _semaphores[lane] = asyncio.Semaphore(max(1, LANE_LIMITS.get(lane, 1)))
+    return _semaphores[lane]
+
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """Full-jitter exponential backoff; never sooner than the server's retry-after."""
+    delay = random.uniform(0, min(RETRY_MAX_SECONDS, RETRY_BASE_SECONDS * 2 ** attempt))
+    response = getattr(error, "response", None)
+    try:
+        delay = max(delay, float(response.headers.get("retry-after")))
+    except (AttributeError, TypeError, ValueError):
+        pass
+    return min(delay, RETRY_MAX_SECONDS)
+
+
+# RateLimitError is 429; InternalServerError covers every 5xx including 529
+# (overloaded); APIConnectionError includes timeouts
+_RETRYABLE = (anthropic.RateLimitError, anthropic.InternalServerError, anthropic.APIConnectionError)
+
+
+async def _with_retries(lane: str, call, guarded: bool = False, timed: bool = True):
+    """await call() holding a slot in `lane`, retrying transient failures.
+    The slot is kept through the backoff so a 429 also slows this lane down.
+    guarded: every attempt feeds the circuit breaker (timed: a success slower
+    than BREAKER_SLOW_SECONDS counts against it too), and retrying stops as
+    soon as the breaker opens."""
+    async with _semaphore(lane):
+        for attempt in range(MAX_RETRIES + 1):
+            start = time.monotonic()
+            try:
+                result = await call()
+            except _RETRYABLE as e:
+                if guarded and _breaker_record(False, f"{type(e).__name__}: {e}"):
+                    raise CircuitOpen(f"Claude unavailable ({type(e).__name__}) — circuit open") from e
+                if attempt == MAX_RETRIES:
+                    raise
+                delay = _retry_delay(e, attempt)
+                print(f"[llm] {type(e).__name__} in {lane} lane — retry {attempt + 1}/{MAX_RETRIES} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            except anthropic.APIStatusError:
+                if guarded:
+                    _breaker_record(True)   # a 4xx is still an answer — the API is up
+                raise
+            if guarded:
+                elapsed = time.monotonic() - start
+                _breaker_record(not timed or elapsed <= BREAKER_SLOW_SECONDS, f"slow response ({elapsed:.0f}s)")
+            return result
+
+
+# ── Circuit breaker ───────────────────────────────────────────────────────────
+#
+# BREAKER_FAILURES bad attempts in a row — a 429/5xx/connection error, or a
+# success slower than BREAKER_SLOW_SECONDS — open the breaker: complete() and
+# stream() then raise CircuitOpen without calling. After
+# BREAKER_COOLDOWN_SECONDS one trial call is let through (half-open); success
+# closes the breaker, failure re-opens it. Streams are judged on errors only
+# (their duration is the draft's length). Batches and probe() bypass it.
+
+BREAKER_FAILURES         = int(os.getenv("LLM_BREAKER_FAILURES", "3"))
+BREAKER_SLOW_SECONDS     = float(os.getenv("LLM_BREAKER_SLOW_SECONDS", "20"))
+BREAKER_COOLDOWN_SECONDS = float(os.getenv("LLM_BREAKER_COOLDOWN_SECONDS", "60"))
+
+_breaker = {"state": "closed", "failures": 0, "opened_at": 0.0, "trial": False, "trial_at": 0.0,
+            "last_error": None, "opens": 0}
+_breaker_lock = threading.Lock()
+
+
+class CircuitOpen(Exception):
+    """A call refused because recent Claude calls failed or were too slow."""
+
+
+def _breaker_refuses() -> bool:
+    """Would the breaker refuse a call now? (doesn't claim the half-open trial)"""
+    b = _breaker
+    if b["state"] == "closed":
+        return False
+    if b["state"] == "open" and time.monotonic() - b["opened_at"] < BREAKER_COOLDOWN_SECONDS:
+        return True
+    # half-open: refused while the trial call is in flight (a trial that never
+    # reported back — cancelled stream — is given up on after a cooldown)
+    return b["trial"] and time.monotonic() - b["trial_at"] < BREAKER_COOLDOWN_SECONDS
+
+
+def _breaker_admit(task: str, model: str):
+    """Let a call through, claiming the trial slot when half-open, or raise CircuitOpen."""
+    with _breaker_lock:
+        refused = _breaker_refuses()
+        if not refused and _breaker["state"] != "closed":
+            _breaker.update(state="half_open", trial=True, trial_at=time.monotonic())
+            print(f"[llm] Circuit half-open — trial call ({task})")
+    if not refused:
+        return
+    try:
+        _record_usage(task, model, None, outcome="refused")
+    except Exception as e:
+        print(f"[llm] Usage record failed: {e}")
+    raise CircuitOpen(f"Claude unavailable — circuit open, {task} not sent")
+
+
+def _breaker_record(ok: bool, detail: str = None) -> bool:
+    """Feed one attempt's outcome to the breaker. Returns True if it is now open."""
+    with _breaker_lock:
+        b = _breaker
+        if ok:
+            if b["state"] != "closed":
+                print("[llm] Circuit closed — Claude is answering again")
+            b.update(state="closed", failures=0, trial=False)
+            return False
+        b["failures"] += 1
+        b["last_error"] = detail
+        if b["state"] == "half_open" or (b["state"] == "closed" and b["failures"] >= BREAKER_FAILURES):
+            b.update(state="open", opened_at=time.monotonic(), trial=False, opens=b["opens"] + 1)
+            print(f"[llm] Circuit OPEN after {b['failures']} bad call(s) ({detail}) — "
+                  f"refusing calls for {BREAKER_COOLDOWN_SECONDS:.0f}s")
+        return b["state"] == "open"
+
+
+def breaker_status() -> dict:
+    with _breaker_lock:
+        b = dict(_breaker)
+        refusing = _breaker_refuses()
+    retry_in = (max(0.0, BREAKER_COOLDOWN_SECONDS - (time.monotonic() - b["opened_at"]))
+                if b["state"] == "open" else 0.0)
+    return {"state": b["state"], "refusing": refusing, "consecutive_failures": b["failures"],
+            "retry_in_seconds": round(retry_in, 1), "last_error": b["last_error"], "opens": b["opens"],
+            "failure_threshold": BREAKER_FAILURES, "slow_seconds": BREAKER_SLOW_SECONDS,
+            "cooldown_seconds": BREAKER_COOLDOWN_SECONDS}
+
+
+def reset_breaker():
+    """Close the breaker by hand (Settings → retry now)."""
+    with _breaker_lock:
+        _breaker.update(state="closed", failures=0, trial=False)
+
+
+def close():
+    """Close the shared client's connections (app shutdown)."""
+    global _aclient
+    if _aclient is not None and _loop is not None:
+        try:
+            _run(_aclient.close())
+        except Exception as e:
+            print(f"[llm] Client close failed: {e}")
+        _aclient = None
+
+
+# ── Model routing ─────────────────────────────────────────────────────────────
+
+_model_cache = (0.0, None)
+
+
+def _model_overrides() -> dict:
+    global _model_cache
+    checked_at, overrides = _model_cache
+    if overrides is None or time.monotonic() - checked_at >= MODEL_CHECK_SECONDS:
+        conn = get_conn()
+        rows = conn.execute("SELECT key, value FROM config WHERE key LIKE 'llm_model_%'").fetchall()
+        conn.close()
+        overrides = {r["key"][len("llm_model_"):]: r["value"] for r in rows if r["value"]}
+        _model_cache = (time.monotonic(), overrides)
+    return overrides
+
+
+def model_for(task: str) -> str:
+    """Model for a task: config override → LLM_MODEL_<TASK> env → TASK_MODELS → MODEL."""
+    return (_model_overrides().get(task)
+            or os.getenv(f"LLM_MODEL_{task.upper()}", "").strip()
+            or TASK_MODELS.get(task, MODEL))
+
+
+def task_models() -> dict:
+    return {task: model_for(task) for task in sorted(set(TASK_MODELS) | set(_model_overrides()))}
+
+
+def set_task_models(models: dict):
+    """Store per-task overrides; an empty value reverts that task to its default."""
+    global _model_cache
+    now = _iso(_now())
+    conn = get_conn()
+    for task, model in models.items():
+        if model:
+            conn.execute("INSERT OR REPLACE INTO config (key, value, updated_at) VALUES (?,?,?)",
+                         (f"llm_model_{task}", model.strip(), now))
+        else:
+            conn.execute("DELETE FROM config WHERE key=?", (f"llm_model_{task}",))
+    conn.commit()
+    conn.close()
+    _model_cache = (0.0, None)
+
+
+# ── Accounting + budgets ──────────────────────────────────────────────────────
+
+# USD per million tokens: input, output, cache write, cache read
+PRICES = {
+    "claude-sonnet-4-5": (3.00, 15.00, 3.75, 0.30),
+    "claude-haiku-4-5":  (1.00,  5.00, 1.25, 0.10),
+}
+BATCH_DISCOUNT       = 0.5
+USAGE_RETENTION_DAYS = int(os.getenv("LLM_USAGE_RETENTION_DAYS", "30"))   # raw rows; rollups are kept
+PRUNE_EVERY          = 500
+
+BUDGET_MODEL   = os.getenv("LLM_BUDGET_MODEL", FAST_MODEL)
+BUDGETED_LANES = ("background", "bulk")
+# Over budget: 'downgrade' runs the task on BUDGET_MODEL, 'queue' raises
+# BudgetExceeded (the scan leaves its watermark alone and retries later)
+BUDGET_POLICY = {
+    "tone":                 "downgrade",
+    "confirmation":         "queue",
+    "thread_classify":      "queue",
+    "thread_classify_batch": "queue",
+    "thread_summary":       "queue",
+}
+BUDGET_CHECK_SECONDS = 15
+
+_usage_writes = 0
+_budget_cache = (0.0, None)
+
+
+class BudgetExceeded(Exception):
+    """A background/bulk call refused because the token budget is spent."""
+
+
+# "Not now" refusals — the work is still wanted, so callers queue it for later
+DEFERRED = (BudgetExceeded, CircuitOpen)
+
+
+def _cost(model: str, tokens: dict, batch: bool = False) -> float:
+    price = PRICES.get(model)
+    if not price:
+        return 0.0
+    usd = (tokens["input"] * price[0] + tokens["output"] * price[1]
+           + tokens["cache_write"] * price[2] + tokens["cache_read"] * price[3]) / 1_000_000
+    return round(usd * (BATCH_DISCOUNT if batch else 1), 6)
+
+
+def _config_int(conn, key: str, env: str) -> int:
+    row = conn.execute("SELECT value FROM config WHERE key=?", (key,)).fetchone()
+    raw = row["value"] if row and row["value"] not in (None, "") else os.getenv(env, "0")
+    try:
+        return max(0, int(raw))
+    except ValueError:
+        return 0
+
+
+def budget_status() -> dict:
+    """Token spend vs. the daily / monthly budget (0 = unlimited). Tokens = input + output + cache reads/writes."""
+    global _budget_cache
+    checked_at, status = _budget_cache
+    if status is not None and time.monotonic() - checked_at < BUDGET_CHECK_SECONDS:
+        return status
+
+    today = _now().date()
+    conn = get_conn()
+    try:
+        limits = {"daily":   _config_int(conn, "llm_budget_daily_tokens", "LLM_BUDGET_DAILY_TOKENS"),
+                  "monthly": _config_int(conn, "llm_budget_monthly_tokens", "LLM_BUDGET_MONTHLY_TOKENS")}
+        used = {}
+        for period, since in (("daily", today), ("monthly", today.replace(day=1))):
+            used[period] = conn.execute("""
+                SELECT COALESCE(SUM(input_tokens + output_tokens + cache_read_tokens + cache_write_tokens), 0)
+                FROM llm_usage_daily WHERE day >= ?
+            """, (since.isoformat(),)).fetchone()[0]
+    finally:
+        conn.close()
+
+    status = {p: {"limit": limits[p], "used": used[p], "exceeded": bool(limits[p]) and used[p] >= limits[p]}
+              for p in limits}
+    status["exceeded"] = status["daily"]["exceeded"] or status["monthly"]["exceeded"]
+    _budget_cache = (time.monotonic(), status)
+    return status
+
+
+def set_budget(daily: int = None, monthly: int = None):
+    """Store budgets in the config table (0 = unlimited; None leaves a budget unchanged)."""
+    global _budget_cache
+    now = _iso(_now())
+    conn = get_conn()
+    for key, value in (("llm_budget_daily_tokens", daily), ("llm_budget_monthly_tokens", monthly)):
+        if value is not None:
+            conn.execute("INSERT OR REPLACE INTO config (key, value, updated_at) VALUES (?,?,?)",
+                         (key, str(max(0, int(value))), now))
+    conn.commit()
+    conn.close()
+    _budget_cache = (0.0, None)
+
+
+def queue_reason(task: str) -> Optional[str]:
+    """Why a call for this task would be refused right now — "circuit open",
+    "budget exceeded" — or None if it would go through (lets a scan skip early)."""
+    if _breaker_refuses():
+        return "circuit open"
+    if (_lane(task) in BUDGETED_LANES and BUDGET_POLICY.get(task, "queue") == "queue"
+            and budget_status()["exceeded"]):
+        return "budget exceeded"
+    return None
+
+
+def _admit(task: str, model: str) -> str:
+    """Model to call for this task under the budget, or BudgetExceeded."""
+    if _lane(task) not in BUDGETED_LANES or not budget_status()["exceeded"]:
+        return model
+    if BUDGET_POLICY.get(task, "queue") == "downgrade":
+        return BUDGET_MODEL
+    try:
+        _record_usage(task, model, None, outcome="queued")
+    except Exception as e:
+        print(f"[llm] Usage record failed: {e}")
+    raise BudgetExceeded(f"LLM token budget exceeded — {task} deferred")
+
+
+# ── Cache ─────────────────────────────────────────────────────────────────────
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.utcnow()
+
+
+def _iso(dt: datetime.datetime) -> str:
+    return dt.isoformat() + "Z"
+
+
+def prefix(*parts: str) -> list[dict]:
+    """
+    System prefix blocks in stable order (most static first). The last block
+    carries the cache breakpoint, which caches everything before it too.
+    Empty parts are dropped so an empty listing context doesn't shift the key.
+    """
+    blocks = [{"type": "text", "text": p} for p in parts if p and p.strip()]
+    if blocks:
+        blocks[-1]["cache_control"] = {"type": "ephemeral"}
+    return blocks
+
+
+def cache_key(model: str, prompt: str, **params) -> str:
+    payload = json.dumps({"model": model, "prompt": prompt, "params": params},
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _bump_stat(conn, task: str, column: str, tokens_saved: int = 0):
+    conn.execute(f"""
+        INSERT INTO llm_cache_stats (task, {column}, tokens_saved) VALUES (?, 1, ?)
+        ON CONFLICT(task) DO UPDATE SET {column} = {column} + 1,
+                                        tokens_saved = tokens_saved + excluded.tokens_saved
+    """, (task, tokens_saved))
+
+
+def _lookup(conn, key: str):
+    row = conn.execute(
+        "SELECT response, input_tokens, output_tokens FROM llm_cache WHERE key=? AND expires_at > ?",
+        (key, _iso(_now())),
+    ).fetchone()
+    if row:
+        conn.execute("UPDATE llm_cache SET hits = hits + 1, last_used_at=? WHERE key=?",
+                     (_iso(_now()), key))
+    return row
+
+
+def _store(conn, key: str, task: str, model: str, text: str,
+           input_tokens: int, output_tokens: int):
+    global _writes
+    now = _now()
+    ttl = TASK_TTL_HOURS.get(task, DEFAULT_TTL_HOURS)
+    conn.execute("""
+        INSERT OR REPLACE INTO llm_cache
+            (key, task, model, response, input_tokens, output_tokens, size_bytes,
+             created_at, expires_at, last_used_at, hits)
+        VALUES (?,?,?,?,?,?,?,?,?,?,0)
+    """, (key, task, model, text, input_tokens, output_tokens, len(text.encode("utf-8")),
+          _iso(now), _iso(now + datetime.timedelta(hours=ttl)), _iso(now)))
+    with _writes_lock:
+        _writes += 1
+        sweep = _writes % EVICT_EVERY == 0
+    if sweep:
+        evict(conn)
+
+
+def evict(conn, max_entries: int = None) -> int:
+    """Drop expired rows, then least-recently-used rows beyond max_entries."""
+    max_entries = MAX_ENTRIES if max_entries is None else max_entries
+    expired = conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (_iso(_now()),)).rowcount
+    lru = conn.execute("""
+        DELETE FROM llm_cache WHERE key IN (
+            SELECT key FROM llm_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+        )
+    """, (max_entries,)).rowcount
+    if expired or lru:
+        print(f"[llm] Cache evicted {expired} expired + {lru} LRU entr{'y' if expired + lru == 1 else 'ies'}")
+    return expired + lru
+
+
+# ── Completion ────────────────────────────────────────────────────────────────
+
+def _record_usage(task: str, model: str, usage, latency_ms: int = None, outcome: str = "ok",
+                  batch: bool = False):
+    """One llm_usage row + the matching llm_usage_daily rollup, in one transaction."""
+    global _usage_writes
+    tokens = {
+        "input":       getattr(usage, "input_tokens", 0) or 0,
+        "output":      getattr(usage, "output_tokens", 0) or 0,
+        "cache_read":  getattr(usage, "cache_read_input_tokens", 0) or 0,
+        "cache_write": getattr(usage, "cache_creation_input_tokens", 0) or 0,
+    }
+    cost = _cost(model, tokens, batch)
+    now  = _now()
+    conn = get_conn()
+    try:
+        conn.execute("""
+            INSERT INTO llm_usage
+                (task, model, input_tokens, output_tokens, cache_read_tokens, cache_write_tokens,
+                 latency_ms, outcome, cost_usd, created_at)
+            VALUES (?,?,?,?,?,?,?,?,?,?)
+        """, (task, model, tokens["input"], tokens["output"], tokens["cache_read"], tokens["cache_write"],
+              latency_ms, outcome, cost, _iso(now)))
+        is_call = outcome not in ("queued", "refused")   # refused: circuit breaker
+        conn.execute("""
+            INSERT INTO llm_usage_daily
+                (day, task, model, calls, errors, queued, input_tokens, output_tokens,
+                 cache_read_tokens, cache_write_tokens, latency_ms, cost_usd)
+            VALUES (?,?,?,?,?,?,?,?,?,?,?,?)
+            ON CONFLICT(day, task, model) DO UPDATE SET
+                calls              = calls + excluded.calls,
+                errors             = errors + excluded.errors,
+                queued             = queued + excluded.queued,
+                input_tokens       = input_tokens + excluded.input_tokens,
+                output_tokens      = output_tokens + excluded.output_tokens,
+                cache_read_tokens  = cache_read_tokens + excluded.cache_read_tokens,
+                cache_write_tokens = cache_write_tokens + excluded.cache_write_tokens,
+                latency_ms         = latency_ms + excluded.latency_ms,
+                cost_usd           = cost_usd + excluded.cost_usd
+        """, (now.date().isoformat(), task, model, int(is_call), int(outcome.startswith("error")),
+              int(not is_call), tokens["input"], tokens["output"], tokens["cache_read"],
+              tokens["cache_write"], latency_ms or 0, cost))
+        with _writes_lock:
+            _usage_writes += 1
+            prune = _usage_writes % PRUNE_EVERY == 0
+        if prune:
+            cutoff = _iso(now - datetime.timedelta(days=USAGE_RETENTION_DAYS))
+            conn.execute("DELETE FROM llm_usage WHERE created_at < ?", (cutoff,))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+async def _create(model: str, max_tokens: int, prompt: str, system: list[dict] = None):
+    messages = [{"role": "user", "content": prompt}]
+    if system:
+        # anthropic 0.40 exposes cache_control on the prompt-caching beta surface
+        return await _client().beta.prompt_caching.messages.create(
+            model=model, max_tokens=max_tokens, system=system, messages=messages,
+        )
+    return await _client().messages.create(model=model, max_tokens=max_tokens, messages=messages)
+
+
+def _key(model: str, prompt: str, max_tokens: int, system: list[dict] = None) -> str:
+    return cache_key(model, prompt, max_tokens=max_tokens,
+                     system=[b["text"] for b in system or []])
+
+
+def cached(task: str, prompt: str, max_tokens: int, system: list[dict] = None,
+           model: str = None):
+    """Cached response text for this exact request, or None. Counts a hit/miss."""
+    if not CACHE_ENABLED:
+        return None
+    model = model or model_for(task)
+    conn = get_conn()
+    try:
+        row = _lookup(conn, _key(model, prompt, max_tokens, system))
+        _bump_stat(conn, task, "hits" if row else "misses",
+                   (row["input_tokens"] + row["output_tokens"]) if row else 0)
+        conn.commit()
+    finally:
+        conn.close()
+    return row["response"] if row else None
+
+
+def _remember(task: str, prompt: str, max_tokens: int, system: list[dict], model: str,
+              text: str, usage, bypass: bool = False, latency_ms: int = None,
+              outcome: str = "ok", batch: bool = False):
+    """Record API usage and store the response in the cache."""
+    try:
+        _record_usage(task, model, usage, latency_ms, outcome, batch)
+    except Exception as e:
+        print(f"[llm] Usage record failed: {e}")
+    if RECORD_PATH:
+        _record_call(task, prompt, max_tokens, system, model, text, latency_ms)
+    if not CACHE_ENABLED:
+        return
+    conn = get_conn()
+    try:
+        if bypass:
+            _bump_stat(conn, task, "bypasses")
+        _store(conn, _key(model, prompt, max_tokens, system), task, model, text,
+               getattr(usage, "input_tokens", 0) or 0, getattr(usage, "output_tokens", 0) or 0)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _record_call(task: str, prompt: str, max_tokens: int, system: list[dict], model: str,
+                 text: str, latency_ms: int = None):
+    line = json.dumps({"task": task, "model": model, "system": [b["text"] for b in system or []],
+                       "prompt": prompt, "max_tokens": max_tokens, "response": text,
+                       "latency_ms": latency_ms, "created_at": _iso(_now())}, ensure_ascii=False)
+    try:
+        with _writes_lock, open(RECORD_PATH, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    except OSError as e:
+        print(f"[llm] Call record failed: {e}")
+
+
+def probe(model: str, prompt: str, max_tokens: int, system: list[dict] = None) -> dict:
+    """
+    One uncached, unaccounted call for scripts/eval_models.py.
+    Returns {"text", "latency_ms", "input_tokens", "output_tokens", "cost_usd"}.
+    """
+    start = time.monotonic()
+    response = _run(_with_retries("bulk", lambda: _create(model, max_tokens, prompt, system)))
+    usage = getattr(response, "usage", None)
+    tokens = {"input":       getattr(usage, "input_tokens", 0) or 0,
+              "output":      getattr(usage, "output_tokens", 0) or 0,
+              "cache_read":  getattr(usage, "cache_read_input_tokens", 0) or 0,
+              "cache_write": getattr(usage, "cache_creation_input_tokens", 0) or 0}
+    return {"text": response.content[0].text.strip(), "latency_ms": _elapsed_ms(start),
+            "input_tokens": tokens["input"] + tokens["cache_read"] + tokens["cache_write"],
+            "output_tokens": tokens["output"], "cost_usd": _cost(model, tokens)}
+
+
+def _elapsed_ms(start: float) -> int:
+    return int((time.monotonic() - start) * 1000)
+
+
+def _record_failure(task: str, model: str, start: float, error: Exception):
+    try:
+        _record_usage(task, model, None, _elapsed_ms(start), f"error:{type(error).__name__}")
+    except Exception as e:
+        print(f"[llm] Usage record failed: {e}")
+
+
+def complete(task: str, prompt: str, max_tokens: int, system: list[dict] = None,
+             bypass: bool = False, model: str = None) -> str:
+    """
+    Run one single-turn prompt and return the stripped response text.
+    system: prefix() blocks — stable context, prompt-cached by the API.
+    model: defaults to the task's routed model (model_for).
+    Cached locally by (model, system, prompt, max_tokens); bypass=True forces a fresh call.
+    """
+    model = model or model_for(task)
+    if not bypass:
+        hit = cached(task, prompt, max_tokens, system, model)
+        if hit is not None:
+            return hit
+
+    call_model = _admit(task, model)
+    _breaker_admit(task, call_model)
+    start = time.monotonic()
+    try:
+        response = _run(_with_retries(_lane(task), lambda: _create(call_model, max_tokens, prompt, system),
+                                      guarded=True))
+    except Exception as e:
+        _record_failure(task, call_model, start, e)
+        raise
+    text = response.content[0].text.strip()
+    _remember(task, prompt, max_tokens, system, call_model, text,
+              getattr(response, "usage", None), bypass=bypass, latency_ms=_elapsed_ms(start),
+              outcome="downgraded" if call_model != model else "ok")
+    return text
+
+
+def stream(task: str, prompt: str, max_tokens: int, system: list[dict] = None,
+           bypass: bool = False, model: str = None):
+    """
+    Like complete(), but yields text deltas as Claude generates them.
+    A cache hit yields the whole response at once. Usage and the cache entry
+    are written only when the stream finishes — an abandoned stream leaves
+    nothing behind.
+    """
+    model = model or model_for(task)
+    if not bypass:
+        hit = cached(task, prompt, max_tokens, system, model)
+        if hit is not None:
+            yield hit
+            return
+
+    # The stream runs on the llm loop; deltas come back through a queue
+    lane   = _lane(task)   # read in the caller's context, not the loop's
+    call_model = _admit(task, model)
+    _breaker_admit(task, call_model)
+    start  = time.monotonic()
+    deltas = queue.Queue()
+
+    async def _produce():
+        started = False
+
+        async def _open():
+            nonlocal started
+            messages = [{"role": "user", "content": prompt}]
+            api = _client().beta.prompt_caching.messages if system else _client().messages
+            kwargs = {"system": system} if system else {}
+            try:
+                async with api.stream(model=call_model, max_tokens=max_tokens, messages=messages, **kwargs) as s:
+                    async for text in s.text_stream:
+                        started = True
+                        deltas.put(("text", text))
+                    return await s.get_final_message()
+            except _RETRYABLE as e:
+                if started:   # half-delivered — can't retry transparently
+                    raise anthropic.AnthropicError(f"stream interrupted: {e}") from e
+                raise
+
+        try:
+            deltas.put(("final", await _with_retries(lane, _open, guarded=True, timed=False)))
+        except Exception as e:
+            deltas.put(("error", e))
+
+    future = asyncio.run_coroutine_threadsafe(_produce(), _get_loop())
+    try:
+        while True:
+            kind, value = deltas.get()
+            if kind == "text":
+                yield value
+            elif kind == "error":
+                _record_failure(task, call_model, start, value)
+                raise value
+            else:
+                final = value
+                break
+    finally:
+        future.cancel()   # consumer went away (client disconnected) → stop generating
+    text = "".join(b.text for b in final.content if b.type == "text").strip()
+    _remember(task, prompt, max_tokens, system, call_model, text,
+              getattr(final, "usage", None), bypass=bypass, latency_ms=_elapsed_ms(start),
+              outcome="downgraded" if call_model != model else "ok")
+
+
+# ── Message Batches ───────────────────────────────────────────────────────────
+#
+# Overnight bulk work: half the price, results within 24h. Each request is
+# {"custom_id", "prompt", "max_tokens", "system"} plus an optional "task"
+# (overrides batch_results' task for caching). ANTHROPIC_BASE_URL points
+# the client at scripts/api_stub.py for local runs.
+
+_BATCH_BETAS = ["prompt-caching-2024-07-31"]
+
+
+def submit_batch(requests: list[dict], model: str = None) -> str:
+    """Submit requests as one Message Batch (each on its task's model unless
+    `model` is given). Returns the batch id."""
+    batch = _run(_with_retries("batch", lambda: _client().beta.messages.batches.create(
+        requests=[{
+            "custom_id": r["custom_id"],
+            "params": {
+                "model":      model or model_for(r.get("task", "")),
+                "max_tokens": r["max_tokens"],
+                "messages":   [{"role": "user", "content": r["prompt"]}],
+                **({"system": r["system"]} if r.get("system") else {}),
+            },
+        } for r in requests],
+        betas=_BATCH_BETAS,
+    )))
+    print(f"[llm] Submitted batch {batch.id} ({len(requests)} request(s))")
+    return batch.id
+
+
+def batch_status(batch_id: str) -> dict:
+    batch = _run(_with_retries("batch", lambda: _client().beta.messages.batches.retrieve(batch_id)))
+    counts = batch.request_counts
+    return {
+        "id":         batch.id,
+        "status":     batch.processing_status,   # in_progress | canceling | ended
+        "processing": counts.processing,
+        "succeeded":  counts.succeeded,
+        "errored":    counts.errored + counts.canceled + counts.expired,
+    }
+
+
+def batch_results(task: str, batch_id: str, requests: list[dict], model: str = None) -> dict:
+    """
+    Fetch an ended batch. Returns {custom_id: text | None}; None marks a failed
+    request. Successful responses go into the response cache like complete().
+    """
+    async def _fetch():
+        return [item async for item in await _client().beta.messages.batches.results(batch_id)]
+
+    by_id = {r["custom_id"]: r for r in requests}
+    out = {cid: None for cid in by_id}
+    for item in _run(_with_retries("batch", _fetch)):
+        req = by_id.get(item.custom_id)
+        if req is None:
+            continue
+        req_task  = req.get("task", task)
+        req_model = model or model_for(req_task)
+        if item.result.type != "succeeded":
+            print(f"[llm] Batch {batch_id} request {item.custom_id} {item.result.type}")
+            try:
+                _record_usage(req_task, req_model, None, outcome=f"error:batch_{item.result.type}",
+                              batch=True)
+            except Exception as e:
+                print(f"[llm] Usage record failed: {e}")
+            continue
+        message = item.result.message
+        text = message.content[0].text.strip()
+        out[item.custom_id] = text
+        _remember(req_task, req["prompt"], req["max_tokens"], req.get("system"), req_model,
+                  text, getattr(message, "usage", None), batch=True)
+    return out
+
+
+# ── Metrics ───────────────────────────────────────────────────────────────────
+
+def cache_stats() -> dict:
+    conn = get_conn()
+    counters = {r["task"]: dict(r) for r in conn.execute("SELECT * FROM llm_cache_stats").fetchall()}
+    entries = {r["task"]: dict(r) for r in conn.execute("""
+        SELECT task, COUNT(*) AS entries, COALESCE(SUM(size_bytes), 0) AS bytes
+        FROM llm_cache GROUP BY task
+    """).fetchall()}
+    conn.close()
+
+    tasks = {}
+    for task in sorted(set(counters) | set(entries)):
+        c = counters.get(task, {})
+        hits, misses = c.get("hits", 0), c.get("misses", 0)
+        tasks[task] = {
+            "hits":         hits,
+            "misses":       misses,
+            "bypasses":     c.get("bypasses", 0),
+            "hit_rate":     round(hits / (hits + misses), 3) if hits + misses else None,
+            "tokens_saved": c.get("tokens_saved", 0),
+            "entries":      entries.get(task, {}).get("entries", 0),
+            "bytes":        entries.get(task, {}).get("bytes", 0),
+        }
+    hits   = sum(t["hits"] for t in tasks.values())
+    misses = sum(t["misses"] for t in tasks.values())
+    return {
+        "enabled":      CACHE_ENABLED,
+        "max_entries":  MAX_ENTRIES,
+        "entries":      sum(t["entries"] for t in tasks.values()),
+        "hit_rate":     round(hits / (hits + misses), 3) if hits + misses else None,
+        "tokens_saved": sum(t["tokens_saved"] for t in tasks.values()),
+        "tasks":        tasks,
+    }
+
+
+def usage_stats(days: int = 7) -> dict:
+    """
+    Per-task and per-day API usage over the last `days` (from the daily
+    rollup): tokens incl. prompt-cache reads/writes, errors, budget refusals,
+    mean latency, estimated cost — plus the current budget status.
+    """
+    since = (_now().date() - datetime.timedelta(days=days - 1)).isoformat()
+    sums = """COUNT(*) AS models, SUM(calls) AS calls, SUM(errors) AS errors, SUM(queued) AS queued,
+              SUM(input_tokens) AS input_tokens, SUM(output_tokens) AS output_tokens,
+              SUM(cache_read_tokens) AS cache_read_tokens, SUM(cache_write_tokens) AS cache_write_tokens,
+              SUM(latency_ms) AS latency_ms, ROUND(SUM(cost_usd), 4) AS cost_usd"""
+    conn = get_conn()
+    by_task = conn.execute(f"SELECT task, {sums} FROM llm_usage_daily WHERE day >= ? GROUP BY task ORDER BY task",
+                           (since,)).fetchall()
+    by_day  = conn.execute(f"SELECT day, {sums} FROM llm_usage_daily WHERE day >= ? GROUP BY day ORDER BY day",
+                           (since,)).fetchall()
+    conn.close()
+
+    def _shape(r) -> dict:
+        r = dict(r)
+        for k in ("models", "task", "day"):
+            r.pop(k, None)
+        prompt_total = r["input_tokens"] + r["cache_read_tokens"] + r["cache_write_tokens"]
+        r["prefix_hit_rate"] = round(r["cache_read_tokens"] / prompt_total, 3) if prompt_total else None
+        latency = r.pop("latency_ms")
+        r["avg_latency_ms"]  = round(latency / r["calls"]) if r["calls"] else None
+        return r
+
+    return {
+        "days":   days,
+        "tasks":  {r["task"]: _shape(r) for r in by_task},
+        "daily":  [{"day": r["day"], **_shape(r)} for r in by_day],
+        "budget": budget_status(),
+    }
+
+
+def clear_cache(task: str = None) -> int:
+    conn = get_conn()
+    if task:
+        n = conn.execute("DELETE FROM llm_cache WHERE task=?", (task,)).rowcount
+    else:
+        n = conn.execute("DELETE FROM llm_cache").rowcount
+    conn.commit()
+    conn.close()
+    return n
@@ -6,16 +6,18 @@ import asyncio
 import datetime
 import os
 import pathlib
-import re as _re
 from contextlib import asynccontextmanager
 
 from fastapi import FastAPI, Request
-from fastapi.responses import FileResponse, RedirectResponse
+from fastapi.responses import FileResponse, RedirectResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
 from typing import Optional
 
 from db import init_db, get_conn
+import contacts
+import enrich
+import geo
 import gmail as gm
 import calendar_service as cal
 
@@ -51,22 +53,10 @@ def get_poll_secs() -> int:
 
 # ── Background polling ────────────────────────────────────────────────────────
 
-_DATETIME_PATTERNS = [
-    # "Monday March 10 at 2pm", "Tuesday, March 10th at 10:30am"
-    r'\b(?:monday|tuesday|wednesday|thursday|friday|saturday|sunday)'
-    r'[,\s]+(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\w*'
-    r'\s+\d{1,2}(?:st|nd|rd|th)?(?:\s+at\s+\d{1,2}(?::\d{2})?\s*(?:am|pm))?',
-    # "March 10 at 2pm", "March 10th at 10:30 AM"
-    r'\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)\w*\s+\d{1,2}(?:st|nd|rd|th)?'
-    r'(?:\s+at\s+\d{1,2}(?::\d{2})?\s*(?:am|pm))?',
-    # "3/10 at 2pm", "03/10/2026 at 10am"
-    r'\b\d{1,2}/\d{1,2}(?:/\d{2,4})?(?:\s+at\s+\d{1,2}(?::\d{2})?\s*(?:am|pm))?',
-]
-
 def _body_has_datetime(text: str) -> bool:
-    """Quick regex check: does this text contain a specific date/time reference?"""
-    t = text.lower()
-    return any(_re.search(p, t, _re.IGNORECASE) for p in _DATETIME_PATTERNS)
+    """Does this text name a specific date AND time ("Saturday at 2pm", "3/10 at 10am")?"""
+    import timeparse
+    return any(c["datetime"] and c["confidence"] == "high" for c in timeparse.parse(text))
 
 
 async def _maybe_create_outgoing_calendar_event(draft: dict, creds, now: str):
@@ -147,29 +137,54 @@ async def _maybe_create_outgoing_calendar_event(draft: dict, creds, now: str):
     print(f"[appt] Outgoing draft confirmed appointment inserted for thread {thread_id}")
 
 
+def _ingest_new_mail() -> int:
+    """One ingest pass: fixture replay in `mode: fixture`, Gmail otherwise."""
+    import fixtures
+    if fixtures.fixture_mode():
+        return fixtures.replay(incremental=True)
+    return gm.poll_inbox()
+
+
 async def _poll_loop():
+    import predraft
     while True:
         await asyncio.sleep(get_poll_secs())
         try:
-            found = await asyncio.to_thread(gm.poll_inbox)
+            found = await asyncio.to_thread(_ingest_new_mail)
             _save_last_poll_time()
             if found:
                 print(f"[poll] {found} new lead(s) stored.")
             # Scan for confirmations in both inbox leads and sent mail
-            await asyncio.to_thread(_scan_confirmations)
+            await asyncio.to_thread(_scan_confirmations, True)
+            # Speculative drafts last — they only save the agent a wait, so
+            # they get what's left of the background budget (opt-in)
+            await asyncio.to_thread(predraft.predraft_new_leads)
         except Exception as e:
             print(f"[poll] Error: {e}")
 
 
-def _scan_confirmations():
+def _scan_confirmations(batch: bool = False):
     """
     Scan recent inbox leads + sent mail for appointment confirmations AND
     availability inquiries. Inserts into appointments table as appropriate.
+    Leads skipped because Claude can't be called right now (budget spent,
+    circuit breaker open) go to scan_queue and are retried on the next scan,
+    as do leads whose fetch or classification failed (up to
+    SCAN_MAX_ATTEMPTS). A queued lead leaves the queue once it is saved.
+    batch=True (the background poll) classifies short threads several to a
+    call via ai.classify_threads.
     """
-    from ai import detect_confirmation, detect_availability_inquiry
+    import ai
+    import llm
     creds = gm.get_credentials()
     if not creds:
         return
+    reason = llm.queue_reason("thread_classify")
+    if reason:
+        # Budget spent or circuit open — leave last_scan_at alone so these
+        # threads are scanned once Claude can be called again
+        print(f"[appt] Scan deferred — {reason}")
+        return
 
     conn = get_conn()
     now  = datetime.datetime.utcnow().isoformat() + "Z"
@@ -188,17 +203,21 @@ def _scan_confirmations():
     )
     conn.commit()
 
-    since_clause = f"AND first_seen_at > '{scan_since}'" if scan_since else "AND first_seen_at > datetime('now', '-7 days')"
+    since_clause = f"first_seen_at > '{scan_since}'" if scan_since else "first_seen_at > datetime('now', '-7 days')"
 
+    # New since the last scan, plus whatever an earlier scan had to defer
+    queued = {r["lead_id"] for r in conn.execute("SELECT lead_id FROM scan_queue").fetchall()}
     recent_leads = conn.execute(f"""
         SELECT id, subject, body_full, body_excerpt, gmail_thread_id, from_email, name, status
         FROM leads
         WHERE status IN ('new', 'drafted', 'replied')
         AND gmail_thread_id IS NOT NULL
-        {since_clause}
+        AND ({since_clause} OR id IN (SELECT lead_id FROM scan_queue))
         ORDER BY first_seen_at DESC
     """).fetchall()
 
+    # Which leads are worth a Claude call, before making any
+    candidates = []
     for lead in recent_leads:
         lead = dict(lead)
         subject = lead.get("subject", "")
@@ -225,108 +244,66 @@ def _scan_confirmations():
             """, (thread_id,)).fetchone()
 
         if not is_confirmation and not is_inquiry and not thread_has_sent_draft:
+            _unqueue_scan(conn, lead["id"], queued)
             continue
 
         # Treat replies to sent drafts as confirmation candidates
         if thread_has_sent_draft and not is_confirmation:
             is_confirmation = True
 
-        try:
-            messages = gm.get_thread_messages(creds, thread_id)
-
-            # Try confirmation first (higher priority)
-            # detect_confirmation now returns a LIST — supports multi-appointment threads
-            if is_confirmation:
-                detected_list = detect_confirmation(messages)
-                for data in detected_list:
-                    proposed_dt = data.get("proposed_datetime")
-                    # Dedup by (thread_id, proposed_datetime) — same appointment
-                    # on same thread won't be double-inserted across scans
-                    existing = conn.execute("""
-                        SELECT id, status FROM appointments
-                        WHERE thread_id=? AND proposed_datetime=? AND status != 'deleted'
-                        ORDER BY id DESC LIMIT 1
-                    """, (thread_id, proposed_dt)).fetchone()
-
-                    if existing:
-                        if existing["status"] == "pending":
-                            # Update with latest details from new reply
-                            conn.execute("""
-                                UPDATE appointments SET
-                                  meeting_type=COALESCE(?,meeting_type),
-                                  proposed_date_text=COALESCE(?,proposed_date_text),
-                                  proposed_address=COALESCE(?,proposed_address),
-                                  client_name=COALESCE(?,client_name),
-                                  client_email=COALESCE(?,client_email),
-                                  partner_name=COALESCE(?,partner_name),
-                                  context_snippet=?,
-                                  updated_at=?
-                                WHERE id=?
-                            """, (
-                                data.get("meeting_type"),
-                                data.get("proposed_date_text"), data.get("proposed_address"),
-                                data.get("client_name"), data.get("client_email"),
-                                data.get("partner_name"), data.get("context_snippet"),
-                                now, existing["id"]
-                            ))
-                            print(f"[appt] Updated pending appt {existing['id']}: {data.get('context_snippet','')[:60]}")
-                        else:
-                            # Already accepted/rejected — skip this datetime
-                            print(f"[appt] Skipping already-{existing['status']} appt for {proposed_dt}")
-                        continue
-
-                    # New appointment — insert
-                    conn.execute("""
-                        INSERT INTO appointments
-                          (lead_id, thread_id, detected_at, status, meeting_type,
-                           proposed_datetime, proposed_date_text, proposed_address,
-                           client_name, client_email, partner_name, context_snippet, source, created_at, updated_at)
-                        VALUES (?,?,?,?,?,?,?,?,?,?,?,?,'inbox',?,?)
-                    """, (
-                        lead["id"], thread_id, now, "pending",
-                        data.get("meeting_type"), data.get("proposed_datetime"),
-                        data.get("proposed_date_text"), data.get("proposed_address"),
-                        data.get("client_name") or lead.get("name"),
-                        data.get("client_email") or lead.get("from_email"),
-                        data.get("partner_name"), data.get("context_snippet"), now, now,
-                    ))
-                    print(f"[appt] New confirmation — lead {lead['id']}: {data.get('context_snippet','')[:60]}")
+        # Dedup: an inquiry already recorded for this thread needs no second one —
+        # and if that's all the thread could be, skip the Claude call entirely
+        existing_inquiry = is_inquiry and conn.execute("""
+            SELECT id FROM appointments
+            WHERE thread_id=? AND meeting_type='availability_inquiry' AND status != 'deleted'
+            LIMIT 1
+        """, (thread_id,)).fetchone()
+        if existing_inquiry and not is_confirmation:
+            _unqueue_scan(conn, lead["id"], queued)
+            continue
 
-                if detected_list:
-                    conn.commit()
-                    continue  # don't double-insert as inquiry
+        candidates.append({"lead": lead, "thread_id": thread_id, "is_confirmation": is_confirmation,
+                           "is_inquiry": is_inquiry, "existing_inquiry": existing_inquiry})
 
-            # Availability inquiry (client asking about times/slots)
-            if is_inquiry:
-                # Dedup: skip if any non-deleted availability_inquiry already exists for this thread
-                existing_inquiry = conn.execute("""
-                    SELECT id FROM appointments
-                    WHERE thread_id=? AND meeting_type='availability_inquiry' AND status != 'deleted'
-                    LIMIT 1
-                """, (thread_id,)).fetchone()
-                if existing_inquiry:
-                    continue
-
-                data = detect_availability_inquiry(messages)
-                if data:
-                    conn.execute("""
-                        INSERT INTO appointments
-                          (lead_id, thread_id, detected_at, status, meeting_type,
-                           proposed_address, client_name, client_email, partner_name,
-                           context_snippet, source, created_at, updated_at)
-                        VALUES (?,?,?,?,?,?,?,?,?,?,'inbox',?,?)
-                    """, (
-                        lead["id"], thread_id, now, "pending",
-                        data.get("meeting_type") or "availability_inquiry",
-                        data.get("proposed_address"),
-                        data.get("client_name") or lead.get("name"),
-                        data.get("client_email") or lead.get("from_email"),
-                        data.get("partner_name"), data.get("context_snippet"), now, now,
-                    ))
-                    conn.commit()
-                    print(f"[appt] Availability inquiry detected — lead {lead['id']}: {data.get('context_snippet','')[:60]}")
+    # Background scans pack several short threads into one Claude call
+    # (classify_threads); manual scans keep one call per thread
+    size = ai.SCAN_BATCH_THREADS if batch else 1
+    for position in range(0, len(candidates), size):
+        group = candidates[position:position + size]
+        threads = {}
+        for c in group:
+            try:
+                threads.setdefault(c["thread_id"], gm.get_thread_messages(creds, c["thread_id"]))
+            except Exception as e:
+                print(f"[appt] Detection error for lead {c['lead']['id']}: {e}")
+                _queue_failed_scans(conn, [c["lead"]["id"]], e, now)
+        try:
+            # One Claude call classifies a thread for both appointment kinds
+            if batch:
+                classified = ai.classify_threads(threads)
+            else:
+                classified = {t: ai.classify_thread(m, t) for t, m in threads.items()}
+        except llm.DEFERRED as e:
+            # Budget ran out or Claude went down mid-scan: queue these leads and
+            # the rest so the next scan retries exactly these
+            _queue_scans(conn, [c["lead"]["id"] for c in candidates[position:]], type(e).__name__, now)
+            print(f"[appt] {e} — {len(candidates) - position} lead(s) queued for the next scan")
+            conn.close()
+            return
         except Exception as e:
-            print(f"[appt] Detection error for lead {lead['id']}: {e}")
+            print(f"[appt] Detection error for lead(s) {', '.join(str(c['lead']['id']) for c in group)}: {e}")
+            _queue_failed_scans(conn, [c["lead"]["id"] for c in group if c["thread_id"] in threads], e, now)
+            continue
+
+        for c in group:
+            if c["thread_id"] not in classified:
+                continue  # fetch failed — already queued
+            try:
+                _save_classification(conn, c, classified[c["thread_id"]], now)
+                _unqueue_scan(conn, c["lead"]["id"], queued)
+            except Exception as e:
+                print(f"[appt] Detection error for lead {c['lead']['id']}: {e}")
+                _queue_failed_scans(conn, [c["lead"]["id"]], e, now)
 
     # --- Sent mail ---
     try:
@@ -340,7 +317,7 @@ def _scan_confirmations():
             if existing:
                 continue
             messages = gm.get_thread_messages(creds, thread_id)
-            detected_list = detect_confirmation(messages)
+            detected_list = ai.detect_confirmation(messages, thread_id)
             if not detected_list:
                 continue
             # Try to link to a lead via thread_id
@@ -371,19 +348,163 @@ def _scan_confirmations():
                 ))
                 print(f"[appt] Detected from sent mail thread {thread_id}: {data.get('context_snippet', '')[:60]}")
             conn.commit()
+    except llm.DEFERRED as e:
+        # Sent threads without an appointment come up again on the next scan
+        print(f"[appt] Sent scan deferred — {e}")
     except Exception as e:
         print(f"[appt] Sent scan error: {e}")
 
     conn.close()
 
 
+SCAN_MAX_ATTEMPTS = 5   # failed scans of one lead before it leaves scan_queue for good
+
+
+def _queue_scans(conn, lead_ids: list[int], reason: str, now: str):
+    conn.executemany("""
+        INSERT INTO scan_queue (lead_id, reason, queued_at) VALUES (?,?,?)
+        ON CONFLICT(lead_id) DO UPDATE SET reason=excluded.reason, attempts=attempts + 1
+    """, [(i, reason, now) for i in lead_ids])
+    conn.commit()
+
+
+def _queue_failed_scans(conn, lead_ids: list[int], error: Exception, now: str):
+    """Retry leads whose fetch / classification failed on the next scan, up to SCAN_MAX_ATTEMPTS."""
+    if not lead_ids:
+        return
+    _queue_scans(conn, lead_ids, type(error).__name__, now)
+    gave_up = conn.execute(f"""
+        DELETE FROM scan_queue WHERE lead_id IN ({','.join('?' * len(lead_ids))}) AND attempts >= ?
+    """, [*lead_ids, SCAN_MAX_ATTEMPTS]).rowcount
+    conn.commit()
+    if gave_up:
+        print(f"[appt] {gave_up} lead(s) failed {SCAN_MAX_ATTEMPTS} scans — dropped from scan_queue")
+
+
+def _unqueue_scan(conn, lead_id: int, queued: set):
+    if lead_id in queued:
+        conn.execute("DELETE FROM scan_queue WHERE lead_id=?", (lead_id,))
+        conn.commit()
+
+
+def _save_classification(conn, c: dict, classified: dict, now: str):
+    """Insert / update appointments for one scanned lead from its thread's classification."""
+    lead, thread_id = c["lead"], c["thread_id"]
+    is_confirmation, is_inquiry, existing_inquiry = c["is_confirmation"], c["is_inquiry"], c["existing_inquiry"]
+
+    # Confirmations first (higher priority) — a LIST, supports multi-appointment threads
+    if is_confirmation:
+        detected_list = classified["appointments"]
+        for data in detected_list:
+            proposed_dt = data.get("proposed_datetime")
+            # Dedup by (thread_id, proposed_datetime) — same appointment
+            # on same thread won't be double-inserted across scans
+            existing = conn.execute("""
+                SELECT id, status FROM appointments
+                WHERE thread_id=? AND proposed_datetime=? AND status != 'deleted'
+                ORDER BY id DESC LIMIT 1
+            """, (thread_id, proposed_dt)).fetchone()
+
+            if existing:
+                if existing["status"] == "pending":
+                    # Update with latest details from new reply
+                    conn.execute("""
+                        UPDATE appointments SET
+                          meeting_type=COALESCE(?,meeting_type),
+                          proposed_date_text=COALESCE(?,proposed_date_text),
+                          proposed_address=COALESCE(?,proposed_address),
+                          client_name=COALESCE(?,client_name),
+                          client_email=COALESCE(?,client_email),
+                          partner_name=COALESCE(?,partner_name),
+                          context_snippet=?,
+                          updated_at=?
+                        WHERE id=?
+                    """, (
+                        data.get("meeting_type"),
+                        data.get("proposed_date_text"), data.get("proposed_address"),
+                        data.get("client_name"), data.get("client_email"),
+                        data.get("partner_name"), data.get("context_snippet"),
+                        now, existing["id"]
+                    ))
+                    print(f"[appt] Updated pending appt {existing['id']}: {data.get('context_snippet','')[:60]}")
+                else:
+                    # Already accepted/rejected — skip this datetime
+                    print(f"[appt] Skipping already-{existing['status']} appt for {proposed_dt}")
+                continue
+
+            # New appointment — insert
+            conn.execute("""
+                INSERT INTO appointments
+                  (lead_id, thread_id, detected_at, status, meeting_type,
+                   proposed_datetime, proposed_date_text, proposed_address,
+                   client_name, client_email, partner_name, context_snippet, source, created_at, updated_at)
+                VALUES (?,?,?,?,?,?,?,?,?,?,?,?,'inbox',?,?)
+            """, (
+                lead["id"], thread_id, now, "pending",
+                data.get("meeting_type"), data.get("proposed_datetime"),
+                data.get("proposed_date_text"), data.get("proposed_address"),
+                data.get("client_name") or lead.get("name"),
+                data.get("client_email") or lead.get("from_email"),
+                data.get("partner_name"), data.get("context_snippet"), now, now,
+            ))
+            print(f"[appt] New confirmation — lead {lead['id']}: {data.get('context_snippet','')[:60]}")
+
+        if detected_list:
+            conn.commit()
+            return  # don't double-insert as inquiry
+
+    # Availability inquiry (client asking about times/slots)
+    if is_inquiry and not existing_inquiry:
+        data = classified["inquiry"]
+        # Another lead on the same thread may have just recorded it
+        if data and not conn.execute("""
+            SELECT 1 FROM appointments
+            WHERE thread_id=? AND meeting_type='availability_inquiry' AND status != 'deleted' LIMIT 1
+        """, (thread_id,)).fetchone():
+            conn.execute("""
+                INSERT INTO appointments
+                  (lead_id, thread_id, detected_at, status, meeting_type,
+                   proposed_address, client_name, client_email, partner_name,
+                   context_snippet, source, created_at, updated_at)
+                VALUES (?,?,?,?,?,?,?,?,?,?,'inbox',?,?)
+            """, (
+                lead["id"], thread_id, now, "pending",
+                data.get("meeting_type") or "availability_inquiry",
+                data.get("proposed_address"),
+                data.get("client_name") or lead.get("name"),
+                data.get("client_email") or lead.get("from_email"),
+                data.get("partner_name"), data.get("context_snippet"), now, now,
+            ))
+            conn.commit()
+            print(f"[appt] Availability inquiry detected — lead {lead['id']}: {data.get('context_snippet','')[:60]}")
+
+
+def _index_existing_leads():
+    """Startup: sign leads that predate the near-duplicate index, re-run stale enrichment."""
+    import dedup, enrich
+    conn = get_conn()
+    try:
+        dedup.index_missing(conn)
+    except Exception as e:
+        print(f"[dedup] Backfill error: {e}")
+    try:
+        enrich.reenrich(conn)
+    except Exception as e:
+        print(f"[enrich] Backfill error: {e}")
+    finally:
+        conn.close()
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     init_db()
+    asyncio.create_task(asyncio.to_thread(_index_existing_leads))
     print(f"[lucilease] Started — http://localhost:8080  (poll every {POLL_SECS}s)")
     task = asyncio.create_task(_poll_loop())
     yield
     task.cancel()
+    import llm
+    llm.close()
 
 
 APP_VERSION = "0.4.18"
@@ -395,11 +516,15 @@ app = FastAPI(title="Lucilease", version=APP_VERSION, lifespan=lifespan)
 
 @app.get("/health")
 async def health():
+    import fixtures
+    import llm
     return {
         "status":        "ok",
         "version":       APP_VERSION,
+        "mode":          "fixture" if fixtures.fixture_mode() else "gmail",
         "authenticated": gm.is_authenticated(),
         "poll_seconds":  get_poll_secs(),
+        "llm_circuit":   llm.breaker_status()["state"],
         "timestamp":     datetime.datetime.utcnow().isoformat() + "Z",
     }
 
@@ -484,21 +609,81 @@ async def stats():
 # ── Leads ─────────────────────────────────────────────────────────────────────
 
 @app.get("/api/leads")
-async def get_leads(status: str = "new"):
-    conn = get_conn()
+async def get_leads(
+    status:         str = "new",
+    bedrooms:       Optional[int] = None,
+    min_budget:     Optional[int] = None,
+    max_budget:     Optional[int] = None,
+    pets:           Optional[str] = None,   # 'dog' | 'cat' | 'none'
+    neighborhood:   Optional[str] = None,   # prefix match, e.g. 'downtown'
+    move_in_before: Optional[str] = None,   # YYYY-MM-DD
+    timeline:       Optional[str] = None,
+):
     # Inbox shows new + drafted leads (drafted = reply in progress)
-    if status == "new":
-        rows = conn.execute(
-            "SELECT * FROM leads WHERE status IN ('new','drafted') ORDER BY first_seen_at DESC"
-        ).fetchall()
-    else:
-        rows = conn.execute(
-            "SELECT * FROM leads WHERE status=? ORDER BY first_seen_at DESC", (status,)
-        ).fetchall()
+    where, params = (["status IN ('new','drafted')"], []) if status == "new" else (["status=?"], [status])
+    # Structured filters run against the indexed enrichment columns (enrich.py)
+    if bedrooms is not None:
+        where.append("bedrooms=?"); params.append(bedrooms)
+    if min_budget is not None:
+        where.append("budget_monthly_usd>=?"); params.append(min_budget)
+    if max_budget is not None:
+        where.append("budget_monthly_usd<=?"); params.append(max_budget)
+    if pets:
+        values = enrich.pets_values(pets)
+        where.append(f"pets IN ({','.join('?' * len(values))})"); params += values
+    if neighborhood and neighborhood.strip():
+        # enrich stores neighborhoods lowercased — a range keeps idx_leads_neighborhood usable
+        prefix = neighborhood.lower().strip()
+        where.append("neighborhood >= ? AND neighborhood < ?"); params += [prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)]
+    if move_in_before:
+        where.append("move_in_date<=?"); params.append(move_in_before)
+    if timeline:
+        where.append("timeline=?"); params.append(timeline)
+    conn = get_conn()
+    rows = conn.execute(
+        f"SELECT * FROM leads WHERE {' AND '.join(where)} ORDER BY first_seen_at DESC", params
+    ).fetchall()
     conn.close()
     return [dict(r) for r in rows]
 
 
+@app.post("/api/leads/re-enrich")
+async def reenrich_leads():
+    """Re-run structured extraction over leads stored under an older extractor version."""
+    def _run():
+        conn = get_conn()
+        try:
+            return enrich.reenrich(conn)
+        finally:
+            conn.close()
+    updated = await asyncio.to_thread(_run)
+    return {"ok": True, "updated": updated, "version": enrich.EXTRACTOR_VERSION}
+
+
+@app.get("/api/leads/{lead_id}/similar")
+async def get_similar_leads(lead_id: int, limit: int = 5):
+    """Near-duplicate candidates for a lead, best match first (score = est. Jaccard)."""
+    import dedup
+    conn = get_conn()
+    matches = dedup.similar_to_lead(conn, lead_id, limit=limit)
+    conn.close()
+    return {"ok": True, "lead_id": lead_id, "threshold": dedup.DUP_THRESHOLD, "similar": matches}
+
+
+@app.get("/api/leads/{lead_id}/suggested-properties")
+async def get_suggested_properties(lead_id: int, k: int = 5):
+    """Active listings that best fit the lead's beds / baths / budget / rent-or-buy, best first."""
+    import matching
+    conn = get_conn()
+    lead = conn.execute("SELECT * FROM leads WHERE id=?", (lead_id,)).fetchone()
+    if not lead:
+        conn.close()
+        return {"ok": False, "error": "Lead not found"}
+    properties = matching.top_k(conn, dict(lead), k=max(1, min(k, 50)))
+    conn.close()
+    return {"ok": True, "lead_id": lead_id, "properties": properties}
+
+
 @app.post("/api/leads/{lead_id}/handle")
 async def handle_lead(lead_id: int):
     conn = get_conn()
@@ -569,54 +754,166 @@ async def add_client_from_lead(lead_id: int):
         conn.close()
         return {"ok": False, "error": "Lead not found"}
     now = datetime.datetime.utcnow().isoformat() + "Z"
+    contact_id = lead["contact_id"] or contacts.upsert_contact(
+        conn, lead["from_email"], lead["name"], lead["phone"]
+    )
+    existing = conn.execute(
+        "SELECT id FROM clients WHERE contact_id=? LIMIT 1", (contact_id,)
+    ).fetchone()
+    if existing:
+        conn.close()
+        return {"ok": True, "client_id": existing["id"]}
     try:
-        conn.execute("""
-            INSERT INTO clients (name, email, phone, status, created_at, updated_at)
-            VALUES (?,?,?,?,?,?)
+        cur = conn.execute("""
+            INSERT INTO clients (name, email, phone, status, created_at, updated_at, contact_id)
+            VALUES (?,?,?,?,?,?,?)
         """, (lead["name"] or lead["from_email"], lead["from_email"],
-              lead["phone"], "active", now, now))
+              lead["phone"], "active", now, now, contact_id))
         conn.commit()
+        client_id = cur.lastrowid
     except Exception:
-        pass
+        client_id = None
     conn.close()
-    return {"ok": True}
+    return {"ok": True, "client_id": client_id}
 
 
 @app.post("/api/leads/{lead_id}/draft")
-async def create_draft(lead_id: int):
-    """Generate a Claude reply draft for a lead and push it to Gmail."""
+async def create_draft(lead_id: int, regenerate: bool = False):
+    """Generate a Claude reply draft for a lead and push it to Gmail.
+    regenerate=true bypasses the response cache for a fresh wording."""
     try:
         from ai import draft_reply
-        result = await asyncio.to_thread(draft_reply, lead_id)
-        # Mark lead as 'drafted' so it moves out of raw inbox view
-        if result.get("draft_db_id"):
-            conn = get_conn()
-            conn.execute(
-                "UPDATE leads SET status='drafted' WHERE id=? AND status='new'", (lead_id,)
-            )
-            conn.commit()
-            conn.close()
+        # draft_reply marks the lead 'drafted' once the draft is saved
+        result = await asyncio.to_thread(draft_reply, lead_id, regenerate)
         return {"ok": True, **result}
     except Exception as e:
         return {"ok": False, "error": str(e)}
 
 
+@app.get("/api/llm/cache-stats")
+async def llm_cache_stats():
+    """Response-cache hit rates, entry counts and tokens saved per task."""
+    import llm
+    return await asyncio.to_thread(llm.cache_stats)
+
+
+@app.get("/api/llm/breaker")
+async def llm_breaker():
+    """Circuit breaker state — 'open' means Claude calls are refused and UI drafts are templates."""
+    import llm
+    return llm.breaker_status()
+
+
+@app.post("/api/llm/breaker/reset")
+async def llm_breaker_reset():
+    """Close the breaker now instead of waiting for the cooldown's trial call."""
+    import llm
+    llm.reset_breaker()
+    return {"ok": True, **llm.breaker_status()}
+
+
+@app.get("/api/llm/usage")
+async def llm_usage(days: int = 7):
+    """API token usage per task, incl. prompt-prefix cache reads/writes."""
+    import llm
+    return await asyncio.to_thread(llm.usage_stats, days)
+
+
+@app.delete("/api/llm/cache")
+async def llm_cache_clear(task: Optional[str] = None):
+    import llm
+    removed = await asyncio.to_thread(llm.clear_cache, task)
+    return {"ok": True, "removed": removed}
+
+
+class BulkDraftRequest(BaseModel):
+    lead_ids: Optional[list[int]] = None   # None → every lead still in 'new'
+    mode:     str                 = "interactive"   # 'interactive' | 'overnight' (Message Batches)
+
+@app.post("/api/leads/draft-bulk")
+async def draft_bulk(req: BulkDraftRequest):
+    """Start one server-side drafting job for many leads; poll GET /api/jobs/{id}."""
+    import jobs
+    if req.mode not in ("interactive", "overnight"):
+        return {"ok": False, "error": f"Unknown mode: {req.mode}"}
+    lead_ids = req.lead_ids
+    if lead_ids is None:
+        conn = get_conn()
+        lead_ids = [r["id"] for r in conn.execute(
+            "SELECT id FROM leads WHERE status='new' ORDER BY first_seen_at DESC"
+        ).fetchall()]
+        conn.close()
+    lead_ids = list(dict.fromkeys(lead_ids))  # dedupe, keep order
+    if not lead_ids:
+        return {"ok": True, "job": None}
+    return {"ok": True, "job": jobs.start_bulk_draft(lead_ids, req.mode)}
+
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    import jobs
+    job = jobs.get_job(job_id)
+    if not job:
+        return {"ok": False, "error": "Job not found"}
+    return {"ok": True, "job": job}
+
+
+@app.get("/api/leads/{lead_id}/draft/stream")
+async def stream_draft(lead_id: int, regenerate: bool = False):
+    """
+    Server-Sent Events variant of POST /api/leads/{id}/draft: emits `token`
+    events as Claude writes, then `done` once the draft is saved and pushed
+    to Gmail (or `flagged` / `error`). GET so the UI can use EventSource.
+    """
+    import json
+    from ai import draft_reply_stream
+
+    def _events():
+        try:
+            for event, data in draft_reply_stream(lead_id, regenerate):
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except Exception as e:
+            print(f"[ai] Streaming draft failed for lead {lead_id}: {e}")
+            yield f"event: error\ndata: {json.dumps({'error': str(e)})}\n\n"
+
+    # Sync generator → Starlette iterates it in a worker thread
+    return StreamingResponse(_events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 @app.post("/api/poll")
 async def manual_poll():
-    found = await asyncio.to_thread(gm.poll_inbox)
+    found = await asyncio.to_thread(_ingest_new_mail)
     # Save last poll timestamp so next poll only fetches genuinely new mail
     _save_last_poll_time()
     await asyncio.to_thread(_scan_confirmations)
     return {"new_leads": found}
 
+class FixtureReplayRequest(BaseModel):
+    rate:        Optional[float] = None   # messages/sec; None → FIXTURE_RATE env
+    concurrency: Optional[int]   = None   # workers; None → FIXTURE_CONCURRENCY env
+    repeat:      int             = 1      # >1 re-sends the corpus under fresh keys
+
+@app.post("/api/fixtures/replay")
+async def replay_fixtures(req: FixtureReplayRequest):
+    """Replay /fixtures through the ingest path (demo data / load generation)."""
+    import fixtures
+    started = datetime.datetime.utcnow()
+    found = await asyncio.to_thread(
+        fixtures.replay, None, req.rate, req.concurrency, max(1, req.repeat)
+    )
+    elapsed = (datetime.datetime.utcnow() - started).total_seconds()
+    return {"ok": True, "new_leads": found, "elapsed_seconds": round(elapsed, 2)}
+
 @app.post("/api/scan-appointments")
 async def manual_scan_appointments():
     """Force re-scan all recent threads for confirmations and inquiries."""
     await asyncio.to_thread(_scan_confirmations)
     conn = get_conn()
     pending = conn.execute("SELECT COUNT(*) FROM appointments WHERE status='pending'").fetchone()[0]
+    queued  = conn.execute("SELECT COUNT(*) FROM scan_queue").fetchone()[0]
     conn.close()
-    return {"ok": True, "pending_appointments": pending}
+    return {"ok": True, "pending_appointments": pending, "queued_scans": queued}
 
 
 # ── Agent profile ─────────────────────────────────────────────────────────────
@@ -650,6 +947,13 @@ class DraftIn(BaseModel):
     body:     str
 
 
+@app.get("/api/drafts/reuse-stats")
+async def draft_reuse_stats(days: int = 30):
+    """How often a past sent reply became the draft (reuse.py), how often Claude was asked anyway, time saved."""
+    import reuse
+    return await asyncio.to_thread(reuse.stats, days)
+
+
 @app.get("/api/drafts/sent")
 async def get_sent_drafts():
     """Return all sent drafts."""
@@ -932,8 +1236,8 @@ async def gmail_account():
     if not creds:
         return {"email": None}
     try:
-        from googleapiclient.discovery import build as gbuild
-        service = gbuild("gmail", "v1", credentials=creds, cache_discovery=False)
+        import google_client
+        service = google_client.gmail(creds)
         profile = service.users().getProfile(userId="me").execute()
         return {"email": profile.get("emailAddress")}
     except Exception as e:
@@ -973,11 +1277,12 @@ async def create_client(client: ClientIn):
     now = datetime.datetime.utcnow().isoformat() + "Z"
     conn = get_conn()
     try:
+        contact_id = contacts.upsert_contact(conn, client.email, client.name, client.phone) if client.email else None
         cur = conn.execute("""
-            INSERT INTO clients (name, email, phone, address, notes, status, created_at, updated_at)
-            VALUES (?,?,?,?,?,?,?,?)
+            INSERT INTO clients (name, email, phone, address, notes, status, created_at, updated_at, contact_id)
+            VALUES (?,?,?,?,?,?,?,?,?)
         """, (client.name, client.email, client.phone, client.address,
-              client.notes, client.status, now, now))
+              client.notes, client.status, now, now, contact_id))
         conn.commit()
         new_id = cur.lastrowid
     except Exception as e:
@@ -1010,18 +1315,98 @@ async def delete_client(client_id: int):
     return {"ok": True}
 
 
+# ── Contacts ──────────────────────────────────────────────────────────────────
+
+@app.get("/api/contacts/{contact_id}")
+async def get_contact(contact_id: int):
+    conn = get_conn()
+    row = conn.execute("SELECT * FROM contacts WHERE id=?", (contact_id,)).fetchone()
+    if not row:
+        conn.close()
+        return {"ok": False, "error": "Contact not found"}
+    client = conn.execute(
+        "SELECT id, status FROM clients WHERE contact_id=? LIMIT 1", (contact_id,)
+    ).fetchone()
+    conn.close()
+    return {"ok": True, **dict(row), "client": dict(client) if client else None}
+
+
+@app.get("/api/contacts/{contact_id}/messages")
+async def get_contact_messages(contact_id: int):
+    """Everything exchanged with one person: inbound leads + outbound drafts, oldest first."""
+    conn = get_conn()
+    inbound = conn.execute("""
+        SELECT id, subject, body_full, body_excerpt, first_seen_at, gmail_thread_id, status
+        FROM leads WHERE contact_id=? ORDER BY first_seen_at ASC
+    """, (contact_id,)).fetchall()
+    outbound = conn.execute("""
+        SELECT id, lead_id, subject, body, status, created_at, updated_at
+        FROM drafts WHERE contact_id=? ORDER BY created_at ASC
+    """, (contact_id,)).fetchall()
+    conn.close()
+    messages = [
+        {"direction": "in", "lead_id": r["id"], "subject": r["subject"],
+         "body": r["body_full"] or r["body_excerpt"] or "", "date": r["first_seen_at"],
+         "thread_id": r["gmail_thread_id"], "status": r["status"]}
+        for r in inbound
+    ] + [
+        {"direction": "out", "draft_id": r["id"], "lead_id": r["lead_id"], "subject": r["subject"],
+         "body": r["body"] or "", "date": r["updated_at"] or r["created_at"], "status": r["status"]}
+        for r in outbound
+    ]
+    messages.sort(key=lambda m: m["date"] or "")
+    return {"ok": True, "contact_id": contact_id, "messages": messages}
+
+
 # ── Properties ────────────────────────────────────────────────────────────────
 
 @app.get("/api/properties")
-async def get_properties():
+async def get_properties(near: Optional[str] = None, lat: Optional[float] = None, lon: Optional[float] = None,
+                         radius_km: Optional[float] = None, bbox: Optional[str] = None):
+    """
+    All properties, newest first. Location filters (geo.py, offline):
+    near=<place> [&radius_km=] or lat=&lon=&radius_km= — nearest first, with
+    distance_km; bbox=min_lat,min_lon,max_lat,max_lon — inside the box.
+    """
     conn = get_conn()
-    rows = conn.execute(
-        "SELECT * FROM properties ORDER BY created_at DESC"
-    ).fetchall()
+    if near or (lat is not None and lon is not None):
+        if near:
+            place = geo.resolve(near)
+            if not place:
+                conn.close()
+                return {"ok": False, "error": f"Unknown place: {near}"}
+            lat, lon = place["lat"], place["lon"]
+            radius_km = radius_km or place["radius_km"]
+        hits = geo.within_radius(conn, lat, lon, radius_km or 2.0)
+        by_id = {r["id"]: dict(r) for r in conn.execute(
+            f"SELECT * FROM properties WHERE id IN ({','.join('?' * len(hits))})", [h[0] for h in hits]
+        ).fetchall()} if hits else {}
+        conn.close()
+        return [{**by_id[pid], "distance_km": round(km, 2)} for pid, km in hits if pid in by_id]
+    if bbox:
+        try:
+            box = tuple(float(v) for v in bbox.split(","))
+            assert len(box) == 4
+        except (ValueError, AssertionError):
+            conn.close()
+            return {"ok": False, "error": "bbox must be min_lat,min_lon,max_lat,max_lon"}
+        rows = conn.execute(f"SELECT * FROM properties WHERE id IN ({geo.IN_BOX_SQL}) ORDER BY created_at DESC",
+                            geo.box_params(box)).fetchall()
+    else:
+        rows = conn.execute(
+            "SELECT * FROM properties ORDER BY created_at DESC"
+        ).fetchall()
     conn.close()
     return [dict(r) for r in rows]
 
 
+@app.get("/api/geo/resolve")
+async def resolve_place(place: str):
+    """What the offline gazetteer makes of an address or place name."""
+    hit = geo.resolve(place)
+    return {"ok": bool(hit), "place": hit}
+
+
 class PropertyIn(BaseModel):
     address:       str
     type:          str = "rental"
@@ -1045,6 +1430,7 @@ async def add_property(prop: PropertyIn):
           prop.price_monthly, prop.price_sale, prop.status or "active", prop.notes, now, now))
     conn.commit()
     new_id = cur.lastrowid
+    geo.geocode_properties(conn, new_id)
     conn.close()
     return {"ok": True, "id": new_id}
 
@@ -1061,6 +1447,7 @@ async def update_property(prop_id: int, prop: PropertyIn):
           prop.price_monthly, prop.price_sale, prop.status or "active",
           prop.notes, now, prop_id))
     conn.commit()
+    geo.geocode_properties(conn, prop_id)
     conn.close()
     return {"ok": True}
 
@@ -1194,6 +1581,71 @@ async def set_filter_mode(body: dict):
     conn.close()
     return {"ok": True, "no_filter": enabled == "1"}
 
+@app.get("/api/config/llm-budget")
+async def get_llm_budget():
+    """Daily / monthly Claude token budgets (0 = unlimited) and current spend."""
+    import llm
+    return await asyncio.to_thread(llm.budget_status)
+
+@app.post("/api/config/llm-budget")
+async def set_llm_budget(body: dict):
+    """{"daily_tokens": int, "monthly_tokens": int} — only background scans and
+    bulk jobs are limited; interactive drafting always runs."""
+    import llm
+    await asyncio.to_thread(llm.set_budget, body.get("daily_tokens"), body.get("monthly_tokens"))
+    return {"ok": True, **await asyncio.to_thread(llm.budget_status)}
+
+@app.get("/api/config/predraft")
+async def get_predraft():
+    """Background pre-drafting of new leads (see predraft.py) — off unless enabled."""
+    import predraft
+    conn = get_conn()
+    ready = conn.execute("SELECT COUNT(*) FROM predrafts").fetchone()[0]
+    conn.close()
+    return {"enabled": await asyncio.to_thread(predraft.enabled), "max_per_poll": predraft.MAX_PER_PASS,
+            "ready": ready}
+
+@app.post("/api/config/predraft")
+async def set_predraft(body: dict):
+    """{"enabled": bool} — pre-drafts are never pushed to Gmail until Draft Reply is clicked."""
+    import predraft
+    await asyncio.to_thread(predraft.set_enabled, bool(body.get("enabled")))
+    return {"ok": True, "enabled": await asyncio.to_thread(predraft.enabled)}
+
+@app.get("/api/config/llm-models")
+async def get_llm_models():
+    """Model each Claude task runs on (see llm.TASK_MODELS)."""
+    import llm
+    return await asyncio.to_thread(llm.task_models)
+
+@app.post("/api/config/llm-models")
+async def set_llm_models(body: dict):
+    """{"<task>": "<model>"} overrides; an empty string reverts a task to its default."""
+    import llm
+    await asyncio.to_thread(llm.set_task_models, {k: str(v or "") for k, v in body.items()})
+    return {"ok": True, "models": await asyncio.to_thread(llm.task_models)}
+
+@app.get("/api/config/dedup")
+async def get_dedup_action():
+    conn = get_conn()
+    row  = conn.execute("SELECT value FROM config WHERE key='dedup_action'").fetchone()
+    conn.close()
+    return {"dedup_action": row["value"] if row else "flag"}
+
+@app.post("/api/config/dedup")
+async def set_dedup_action(body: dict):
+    """'flag' (default) marks near-duplicates; 'merge' also hides them from the inbox."""
+    action = "merge" if body.get("dedup_action") == "merge" else "flag"
+    now  = datetime.datetime.utcnow().isoformat() + "Z"
+    conn = get_conn()
+    conn.execute(
+        "INSERT OR REPLACE INTO config (key, value, updated_at) VALUES ('dedup_action',?,?)",
+        (action, now)
+    )
+    conn.commit()
+    conn.close()
+    return {"ok": True, "dedup_action": action}
+
 @app.post("/api/config/poll")
 async def save_poll_interval(body: dict):
     """Save user-defined poll interval (seconds). Minimum 60s."""
@@ -1266,16 +1718,19 @@ def _build_cal_description(appt: dict) -> str:
         parts.append(appt["context_snippet"])
     if appt.get("client_email"):
         parts.append(f"Email: {appt['client_email']}")
-    # Look up phone from leads table
+    # Look up phone from the contact record (falls back to the raw lead phone)
     try:
         conn = get_conn()
-        lead = conn.execute(
-            "SELECT phone FROM leads WHERE id=? OR (gmail_thread_id=? AND phone IS NOT NULL) LIMIT 1",
-            (appt.get("lead_id"), appt.get("thread_id"))
-        ).fetchone()
+        phone = contacts.contact_phone(conn, appt.get("contact_id"))
+        if not phone:
+            lead = conn.execute(
+                "SELECT phone FROM leads WHERE id=? OR (gmail_thread_id=? AND phone IS NOT NULL) LIMIT 1",
+                (appt.get("lead_id"), appt.get("thread_id"))
+            ).fetchone()
+            phone = lead["phone"] if lead else None
         conn.close()
-        if lead and lead["phone"]:
-            parts.append(f"Phone: {lead['phone']}")
+        if phone:
+            parts.append(f"Phone: {phone}")
     except Exception:
         pass
     if appt.get("partner_name"):
@@ -1459,7 +1914,7 @@ async def send_confirmation_email(appt_id: int, body: dict = None):
 
 
 @app.post("/api/appointments/{appt_id}/suggest-times")
-async def suggest_times_appointment(appt_id: int):
+async def suggest_times_appointment(appt_id: int, regenerate: bool = False):
     """
     For availability inquiries: Claude drafts a reply offering 2-3 open slots.
     Marks appointment as rejected (times suggested) so it leaves the pending dashboard.
@@ -1473,14 +1928,14 @@ async def suggest_times_appointment(appt_id: int):
     conn.commit()
     conn.close()
     try:
-        result = await asyncio.to_thread(draft_availability_options, appt_id)
+        result = await asyncio.to_thread(draft_availability_options, appt_id, regenerate)
         return {"ok": True, **result}
     except Exception as e:
         return {"ok": False, "error": str(e)}
 
 
 @app.post("/api/appointments/{appt_id}/reject")
-async def reject_appointment(appt_id: int):
+async def reject_appointment(appt_id: int, regenerate: bool = False):
     """Reject + auto-reply: Claude drafts alternative times and saves as draft."""
     from ai import draft_alternative_times
     now = datetime.datetime.utcnow().isoformat() + "Z"
@@ -1491,7 +1946,7 @@ async def reject_appointment(appt_id: int):
     conn.commit()
     conn.close()
     try:
-        result = await asyncio.to_thread(draft_alternative_times, appt_id)
+        result = await asyncio.to_thread(draft_alternative_times, appt_id, regenerate)
         return {"ok": True, **result}
     except Exception as e:
         return {"ok": False, "error": str(e)}
@@ -1555,15 +2010,16 @@ async def get_calendar_events():
     ).fetchall()
     conn.close()
 
-    # Build lead_id → phone lookup in one query
+    # Build lead_id → phone lookup in one query (normalized contact phone first)
     lead_ids = [r["lead_id"] for r in rows if r["lead_id"]]
     phone_map = {}
     if lead_ids:
         conn2 = get_conn()
-        for row in conn2.execute(
-            f"SELECT id, phone FROM leads WHERE id IN ({','.join('?'*len(lead_ids))})",
-            lead_ids
-        ).fetchall():
+        for row in conn2.execute(f"""
+            SELECT l.id, COALESCE(c.phone_e164, l.phone) AS phone
+            FROM leads l LEFT JOIN contacts c ON c.id = l.contact_id
+            WHERE l.id IN ({','.join('?'*len(lead_ids))})
+        """, lead_ids).fetchall():
             if row["phone"]:
                 phone_map[row["id"]] = row["phone"]
         conn2.close()
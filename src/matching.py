@@ -0,0 +1,136 @@
+"""
+matching.py — Top-k listings for a lead, read straight off the properties indexes.
+
+A lead's extracted facts (enrich.py: bedrooms, bathrooms, rent-or-buy;
+textguard: monthly budget) pick the listings worth showing it:
+
+  type       the lead's rent / buy intent (a monthly budget means rental);
+             unknown → every listed type
+  bedrooms   exact first, then one more, then one fewer (BEDROOM_STEPS)
+  price      nearest the budget, under preferred to over
+             (OVER_BUDGET_WEIGHT), nothing more than MAX_OVER_BUDGET above
+  bathrooms  at least what the lead asked for (listings without a count pass)
+  area       listings inside the lead's "near <place>" (geo.area) come first
+
+Rank is (bedroom step, in area, price distance, newest). Each (type,
+bedrooms) bucket is read with two ordered index range scans — the k nearest
+prices at or above the budget and the k nearest below — so a lookup costs
+O(log n + k) per bucket however many listings there are. Without a budget
+a bucket contributes its k newest listings. With an area, each bucket is
+read twice: once restricted to the property_geo R-Tree box, once not.
+
+Draft prompts (ai.prepare_draft, once the agent has more listings than fit
+in the shared prompt prefix) and GET /api/leads/{id}/suggested-properties
+both use top_k(). scripts/bench_matching.py checks it against a full scan.
+"""
+
+from typing import Optional
+
+import geo
+import listing_context
+
+PRICE = "COALESCE(price_monthly, price_sale)"   # must match the db.py index expression
+
+BEDROOM_STEPS      = (0, 1, -1)
+MAX_OVER_BUDGET    = 0.15
+OVER_BUDGET_WEIGHT = 2.0      # $100 over budget ranks like $200 under
+DRAFT_K            = 5
+
+
+def lead_type(lead: dict) -> Optional[str]:
+    if lead.get("property_type"):
+        return lead["property_type"]
+    return "rental" if lead.get("budget_monthly_usd") else None
+
+
+def price_distance(price: Optional[int], budget: Optional[int]) -> float:
+    if not budget or price is None:
+        return 0.0
+    return (price - budget) * OVER_BUDGET_WEIGHT if price > budget else budget - price
+
+
+def _bucket(conn, ptype: str, bedrooms: Optional[int], baths: Optional[float],
+            budget: Optional[int], k: int, box: Optional[tuple] = None) -> list[dict]:
+    where, params = "status='active' AND type=?", [ptype]
+    if bedrooms is not None:
+        where += " AND bedrooms=?"
+        params.append(bedrooms)
+    if baths:
+        where += " AND (bathrooms IS NULL OR bathrooms >= ?)"
+        params.append(baths)
+    if box:
+        where += f" AND id IN ({geo.IN_BOX_SQL})"
+        params += geo.box_params(box)
+
+    if not budget:
+        return [dict(r) for r in conn.execute(
+            f"SELECT * FROM properties WHERE {where} ORDER BY created_at DESC, id DESC LIMIT ?", params + [k])]
+    above = conn.execute(f"""
+        SELECT * FROM properties WHERE {where} AND {PRICE} >= ? AND {PRICE} <= ?
+        ORDER BY {PRICE} ASC, created_at DESC, id DESC LIMIT ?
+    """, params + [budget, int(budget * (1 + MAX_OVER_BUDGET)), k]).fetchall()
+    below = conn.execute(f"""
+        SELECT * FROM properties WHERE {where} AND {PRICE} < ?
+        ORDER BY {PRICE} DESC, created_at DESC, id DESC LIMIT ?
+    """, params + [budget, k]).fetchall()
+    return [dict(r) for r in above] + [dict(r) for r in below]
+
+
+def _price(prop: dict) -> Optional[int]:
+    return prop.get("price_monthly") or prop.get("price_sale")
+
+
+def rank(candidates: list[tuple]) -> list[tuple]:
+    """
+    Sort (bedroom step, budget, property, in area) candidates best first:
+    bedroom step, then in the lead's area, then price distance, then newest.
+    Shared with the benchmark's full scan so both sides rank identically.
+    """
+    newest = sorted(candidates, key=lambda c: (c[2].get("created_at") or "", c[2]["id"]), reverse=True)
+    return sorted(newest, key=lambda c: (BEDROOM_STEPS.index(c[0]), not c[3], price_distance(_price(c[2]), c[1])))
+
+
+def top_k(conn, lead: dict, k: int = DRAFT_K) -> list[dict]:
+    """
+    The k active listings that best fit this lead, best first. Each carries
+    "match": {"bedroom_step", "price_delta", "in_area"} — price minus budget
+    or None; in_area is None when the lead names no known place.
+    """
+    budget   = lead.get("budget_monthly_usd")
+    bedrooms = lead.get("bedrooms")
+    ptype    = lead_type(lead)
+    types    = [ptype] if ptype else listing_context.property_types(conn)
+    box      = geo.area(lead.get("neighborhood") or "")
+    # A monthly budget says nothing about a sale price
+    budget_for = {t: (budget if t == "rental" else None) for t in types}
+
+    steps = [0] if bedrooms is None else [s for s in BEDROOM_STEPS if bedrooms + s >= 0]
+    candidates = []
+    for t in types:
+        for step in steps:
+            args = (conn, t, None if bedrooms is None else bedrooms + step, lead.get("bathrooms"), budget_for[t], k)
+            # An in-area listing in the unrestricted top k is also in the area's
+            # top k, so flagging by the area scan's ids is exact
+            near = {p["id"]: p for p in _bucket(*args, box=box)} if box else {}
+            candidates += [(step, budget_for[t], p, True) for p in near.values()]
+            candidates += [(step, budget_for[t], p, False) for p in _bucket(*args) if p["id"] not in near]
+
+    out = []
+    for step, type_budget, p, in_area in rank(candidates)[:k]:
+        delta = _price(p) - type_budget if type_budget and _price(p) is not None else None
+        out.append({**p, "match": {"bedroom_step": step, "price_delta": delta,
+                                   "in_area": in_area if box else None}})
+    return out
+
+
+def lead_listings(conn, lead: dict) -> str:
+    """
+    Per-lead listing block for the draft prompt — empty while every active
+    listing already fits in the shared prefix (listing_context.listing()).
+    """
+    if listing_context.catalog(conn)["active"] <= listing_context.PROPERTY_LIMIT:
+        return ""
+    picks = top_k(conn, lead, DRAFT_K)
+    if not picks:
+        return "None of your listings closely fit what this client asked for."
+    return "Your listings that best fit this client:\n" + listing_context.render_properties(conn, picks)
@@ -0,0 +1,161 @@
+"""
+predraft.py — Speculative background drafting for newly ingested leads.
+
+Opt-in (config key predraft_enabled, default from PREDRAFT_ENABLED; toggled
+at /api/config/predraft). After each poll, new leads are drafted ahead of
+the agent's click, on the background lane — so the token budget applies and
+an exhausted budget (or an open circuit breaker) just ends the pass.
+Highest priority first: known clients, then urgent move timelines, then
+leads with a budget, then newest. Leads that reuse.py can answer with a past
+sent reply are skipped.
+
+Only Claude's raw answer is kept, in predrafts, keyed by a hash of the exact
+request prepare_draft builds (task, model, system prefix, prompt,
+max_tokens). A new message in the thread, an edited listing or a profile
+change alters that request, so take() refuses the stale text and the draft
+is generated as before. Nothing is saved to drafts or pushed to Gmail until
+Draft Reply is clicked — resolve_draft does that, same as for a fresh draft.
+"""
+
+import datetime
+import os
+
+from db import get_conn
+import llm
+import reuse
+
+DEFAULT_ENABLED = os.getenv("PREDRAFT_ENABLED", "0").strip().lower() in ("1", "true", "on", "yes")
+MAX_PER_PASS    = int(os.getenv("PREDRAFT_MAX_PER_POLL", "10"))
+SCAN_WINDOW     = 5      # candidates looked at per draft actually made (most are already current)
+
+# Lead priority: known client → urgent timeline → stated budget → newest
+_CANDIDATES_SQL = """
+    SELECT l.id FROM leads l
+    WHERE l.status = 'new' AND l.duplicate_of IS NULL
+    ORDER BY
+        EXISTS (SELECT 1 FROM clients c WHERE c.contact_id = l.contact_id) DESC,
+        CASE l.timeline WHEN 'asap' THEN 0 WHEN 'this_week' THEN 1 WHEN 'next_week' THEN 2
+                        WHEN 'this_month' THEN 3 WHEN 'next_month' THEN 4 ELSE 5 END,
+        l.budget_monthly_usd IS NOT NULL DESC,
+        l.first_seen_at DESC
+    LIMIT ?
+"""
+
+
+def enabled() -> bool:
+    conn = get_conn()
+    row  = conn.execute("SELECT value FROM config WHERE key='predraft_enabled'").fetchone()
+    conn.close()
+    return (row["value"] == "true") if row else DEFAULT_ENABLED
+
+
+def set_enabled(on: bool):
+    now  = datetime.datetime.utcnow().isoformat() + "Z"
+    conn = get_conn()
+    conn.execute("INSERT OR REPLACE INTO config (key, value, updated_at) VALUES ('predraft_enabled',?,?)",
+                 ("true" if on else "false", now))
+    conn.commit()
+    conn.close()
+
+
+def input_hash(prepared: dict) -> str:
+    """Identity of a draft request — changes whenever anything the draft depends on does."""
+    return llm.cache_key(llm.model_for(prepared["task"]), prepared["prompt"], task=prepared["task"],
+                         max_tokens=prepared["max_tokens"],
+                         system=[b["text"] for b in prepared["system"] or []])
+
+
+def take(prepared: dict):
+    """
+    The pre-drafted answer for this request, or None. The row is consumed
+    either way: a match is about to become a real draft, a mismatch is stale.
+    """
+    lead_id = prepared["lead"]["id"]
+    conn = get_conn()
+    row  = conn.execute("SELECT input_hash, text FROM predrafts WHERE lead_id=?", (lead_id,)).fetchone()
+    if row:
+        conn.execute("DELETE FROM predrafts WHERE lead_id=?", (lead_id,))
+        conn.commit()
+    conn.close()
+    if not row:
+        return None
+    if row["input_hash"] != input_hash(prepared):
+        print(f"[predraft] Lead {lead_id}: inputs changed since pre-draft — discarded")
+        return None
+    print(f"[predraft] Lead {lead_id}: using pre-draft")
+    return row["text"]
+
+
+def _prune(conn):
+    """Drop pre-drafts for leads that are no longer waiting on a first reply."""
+    conn.execute("""
+        DELETE FROM predrafts WHERE lead_id NOT IN
+            (SELECT id FROM leads WHERE status = 'new' AND duplicate_of IS NULL)
+    """)
+    conn.commit()
+
+
+def predraft_new_leads(limit: int = None) -> dict:
+    """
+    One background pass: draft up to `limit` new leads whose pre-draft is
+    missing or stale, highest priority first. Returns counts.
+    """
+    from ai import prepare_draft
+    limit = MAX_PER_PASS if limit is None else limit
+    counts = {"drafted": 0, "current": 0, "reusable": 0, "failed": 0, "deferred": 0}
+    if limit <= 0 or not enabled():
+        return counts
+
+    conn = get_conn()
+    _prune(conn)
+    ids = [r["id"] for r in conn.execute(_CANDIDATES_SQL, (limit * SCAN_WINDOW,)).fetchall()]
+    have = {r["lead_id"]: r["input_hash"] for r in conn.execute("SELECT lead_id, input_hash FROM predrafts")}
+    conn.close()
+
+    llm.use_lane("background")   # this thread's context only — clicks stay interactive
+    for lead_id in ids:
+        if counts["drafted"] >= limit:
+            break
+        try:
+            prepared = prepare_draft(lead_id)
+            h = input_hash(prepared)
+            if have.get(lead_id) == h:
+                counts["current"] += 1
+                continue
+            # Draft Reply will reuse a past sent reply for free — don't pay Claude ahead of it
+            conn = get_conn()
+            reusable = reuse.candidate(conn, prepared["lead"])
+            conn.close()
+            if reusable:
+                counts["reusable"] += 1
+                continue
+            reason = llm.queue_reason(prepared["task"])
+            if reason:
+                counts["deferred"] += 1
+                break
+            text = llm.complete(prepared["task"], prepared["prompt"], max_tokens=prepared["max_tokens"],
+                                system=prepared["system"])
+        except llm.DEFERRED as e:
+            reason = "circuit open" if isinstance(e, llm.CircuitOpen) else "budget exceeded"
+            counts["deferred"] += 1
+            break
+        except Exception as e:
+            counts["failed"] += 1
+            print(f"[predraft] Lead {lead_id} failed: {e}")
+            continue
+
+        now  = datetime.datetime.utcnow().isoformat() + "Z"
+        conn = get_conn()
+        conn.execute("""
+            INSERT INTO predrafts (lead_id, input_hash, task, text, created_at) VALUES (?,?,?,?,?)
+            ON CONFLICT(lead_id) DO UPDATE SET input_hash=excluded.input_hash, task=excluded.task,
+                                               text=excluded.text, created_at=excluded.created_at
+        """, (lead_id, h, prepared["task"], text, now))
+        conn.commit()
+        conn.close()
+        counts["drafted"] += 1
+
+    if counts["drafted"] or counts["deferred"] or counts["failed"]:
+        print(f"[predraft] {counts['drafted']} drafted, {counts['current']} current, "
+              f"{counts['failed']} failed" + (f" — {reason}, rest deferred" if counts["deferred"] else ""))
+    return counts
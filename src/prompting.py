@@ -0,0 +1,102 @@
+"""
+prompting.py — Token-budgeted thread and message text for Claude prompts.
+
+Every reply carries the full quoted history of the ones before it, plus a
+signature and often a mobile footer or disclaimer. Cutting a thread at a
+character count therefore spent most of the cap on text the prompt already
+had, and could cut off the newest message itself. Here each message is
+reduced to its own new text (textguard.strip_quoted / strip_signature) and
+sized in estimated tokens, and every variable section of a prompt gets its
+own token budget:
+
+  instructions   static, in the cached system prefix (llm.prefix) — not trimmed
+  context        listing text: the shared prefix, or MATCHES_TOKENS per lead
+  thread         newest message first, older ones while the section's budget lasts
+
+The very first message of a thread keeps its quoted text: when the
+conversation started elsewhere (a forward, a reply to a portal email) it
+may be the only copy of that history.
+
+estimate_tokens() is a characters-per-token heuristic, deliberately on the
+high side for English mail, so no tokenizer is needed on the hot path.
+"""
+
+import math
+from typing import Optional
+
+import textguard
+
+CHARS_PER_TOKEN = 3.5
+
+# Per-section budgets, in estimated tokens
+INQUIRY_TOKENS      = 400    # the lead's own message in a draft prompt
+MATCHES_TOKENS      = 350    # the lead's best-fit listings (matching.lead_listings)
+TRIAGE_TOKENS       = 400    # quoted history the draft call's tone check sees
+TONE_TOKENS         = 400    # standalone assess_thread_tone
+SCAN_TOKENS         = 900    # classify / confirmation scans
+BATCH_THREAD_TOKENS = 500    # a scanned thread this small can share a call (ai.classify_threads)
+
+MIN_MESSAGE_TOKENS = 40      # an older message that can't get this much is left out
+PREAMBLE_TOKENS    = 12      # own text this short above a quote/forward is just its preamble
+SEPARATOR = "\n\n---\n\n"
+ELLIPSIS  = " […]"
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    return math.ceil(len(text or "") / CHARS_PER_TOKEN)
+
+
+def fit(text: Optional[str], max_tokens: int) -> str:
+    """text, or its head cut at a word boundary to about max_tokens, marked with […]."""
+    text = (text or "").strip()
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    cut = text[:max(0, int(max_tokens * CHARS_PER_TOKEN) - len(ELLIPSIS))]
+    head = cut.rsplit(None, 1)[0] if " " in cut or "\n" in cut else cut
+    return head.rstrip() + ELLIPSIS
+
+
+def clean_message(body: Optional[str], keep_quoted: bool = False) -> str:
+    """A message's own text: quoted history (unless keep_quoted) and signature block removed."""
+    text = textguard.prepare(body) if keep_quoted else textguard.strip_quoted(body)
+    return textguard.strip_signature(text)
+
+
+def inquiry_parts(body: Optional[str]) -> tuple[str, str]:
+    """
+    (the client's message, the history it quotes) for a draft prompt. When
+    the client's own part is only a preamble — "FYI, see below:" above a
+    forward, a portal's intro line — the forwarded text is the inquiry, so
+    the whole body is the message and nothing is left as quoted history.
+    """
+    own, quoted = textguard.split_quoted(body)
+    own = textguard.strip_signature(own)
+    if quoted and (estimate_tokens(own) < PREAMBLE_TOKENS or own.endswith(":")):
+        return textguard.prepare(body), ""
+    return own, quoted
+
+
+def message_text(m: dict, max_tokens: int, keep_quoted: bool = False) -> str:
+    """One thread message as 'From / Date / body', body fitted so the whole is about max_tokens."""
+    header = f"From: {m.get('from')}\nDate: {m.get('date')}\n\n"
+    body = fit(clean_message(m.get("body"), keep_quoted), max(0, max_tokens - estimate_tokens(header)))
+    return header + (body or "(no text)")
+
+
+def thread_text(messages: list[dict], max_tokens: int, max_messages: Optional[int] = None) -> str:
+    """
+    The thread oldest → newest within max_tokens. Packed newest first, so the
+    newest message is always there (cut to the budget if it has to be) and
+    older ones fill what is left. max_messages limits how far back it goes.
+    """
+    window = messages[-max_messages:] if max_messages else messages
+    offset = len(messages) - len(window)
+    sep    = estimate_tokens(SEPARATOR)
+    parts, left = [], max_tokens
+    for i in range(len(window) - 1, -1, -1):
+        if parts and left < MIN_MESSAGE_TOKENS:
+            break
+        text = message_text(window[i], left, keep_quoted=offset + i == 0)
+        parts.append(text)
+        left -= estimate_tokens(text) + sep
+    return SEPARATOR.join(reversed(parts))
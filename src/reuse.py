@@ -0,0 +1,222 @@
+"""
+reuse.py — Past sent replies as instant drafts for near-identical inquiries.
+
+Many inquiries are the same question with a different name on it: "is 742
+Anacapa still available, can I see it this week?". dedup.py already keeps a
+MinHash signature and LSH buckets for every lead. A new lead's bucket
+neighbours that got a reply which was actually sent are candidates for that
+reply. One qualifies only if:
+
+  score     ≥ REUSE_THRESHOLD estimated Jaccard between the two inquiries
+  listing   both name the same listings (by street number + name), at least
+            one, and each is still active and unedited since that send —
+            generic "2 bedroom near downtown" inquiries never qualify
+  facts     the enriched facts a reply answers to (FACT_FIELDS, and the
+            monthly budget within BUDGET_TOLERANCE) are the same for both leads
+  age       it was sent within REUSE_MAX_AGE_DAYS — "this Saturday" goes stale
+
+The closest qualifying reply (newest on a tie) is adapted — the old
+client's name swapped for the new one, the old signature dropped
+(finalize_draft appends the current one) — and saved as the draft. Nothing
+else in the text is rewritten: a partner's name or a detail the facts
+check doesn't cover would carry over, which is why the bar for reuse
+is the same listing and the same facts. A tone check isn't needed: the same wording got a normal reply
+before. Regenerate still asks Claude. Every lookup is logged in
+draft_reuse, so GET /api/drafts/reuse-stats can report the reuse rate, the
+regenerate rate and the Claude latency saved.
+"""
+
+import datetime
+import os
+import re
+import threading
+import time
+from typing import Optional
+
+import dedup
+from db import get_conn
+import listing_context
+
+REUSE_THRESHOLD    = float(os.getenv("REUSE_THRESHOLD", "0.65"))
+REUSE_MAX_AGE_DAYS = int(os.getenv("REUSE_MAX_AGE_DAYS", "7"))
+CANDIDATES         = 10
+FACT_FIELDS        = ("bedrooms", "bathrooms", "property_type", "pets", "move_in_date")
+BUDGET_TOLERANCE   = 0.10     # budgets within 10% of each other count as the same
+
+_address_memo: dict = {}
+_address_lock = threading.Lock()
+
+
+def _words(text: str) -> str:
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", (text or "").lower()).split())
+
+
+def _address_keys(conn) -> dict[str, list[int]]:
+    """'742 anacapa' → property ids, rebuilt when listing_context's version moves."""
+    current = listing_context.version(conn)
+    with _address_lock:
+        if _address_memo.get("version") == current:
+            return _address_memo["keys"]
+    keys: dict[str, list[int]] = {}
+    for r in conn.execute("SELECT id, address FROM properties"):
+        words = _words(r["address"]).split()
+        if len(words) >= 2 and words[0].isdigit():
+            keys.setdefault(f"{words[0]} {words[1]}", []).append(r["id"])
+    with _address_lock:
+        _address_memo.update(version=current, keys=keys)
+    return keys
+
+
+def mentioned_listings(conn, text: str) -> frozenset:
+    """Property ids whose street number + name appear in the text."""
+    keys = _address_keys(conn)
+    words = _words(text).split()
+    found = set()
+    for a, b in zip(words, words[1:]):
+        if a.isdigit():
+            found.update(keys.get(f"{a} {b}", ()))
+    return frozenset(found)
+
+
+def _first_name(name: Optional[str]) -> Optional[str]:
+    parts = (name or "").split()
+    return parts[0] if parts and parts[0][:1].isalpha() else None
+
+
+def same_facts(a: dict, b: dict) -> bool:
+    """Both leads asked for the same thing: FACT_FIELDS equal, budgets within BUDGET_TOLERANCE."""
+    if any(a.get(f) != b.get(f) for f in FACT_FIELDS):
+        return False
+    x, y = a.get("budget_monthly_usd"), b.get("budget_monthly_usd")
+    if not x or not y:
+        return not x and not y
+    return abs(x - y) <= BUDGET_TOLERANCE * max(x, y)
+
+
+def adapt(body: str, old_name: Optional[str], new_name: Optional[str], signature: str = "") -> str:
+    """
+    The old reply addressed to the new client, minus the signature
+    finalize_draft re-adds. Only the client's name is swapped (full name,
+    then first name) — see the module docstring for what isn't.
+    """
+    body = body.rstrip()
+    if signature and body.endswith(signature.strip()):
+        body = body[:-len(signature.strip())].rstrip()
+    old_full = " ".join((old_name or "").split())
+    if len(old_full.split()) > 1:
+        body = body.replace(old_full, " ".join((new_name or "").split()) or "there")
+    old = _first_name(old_name)
+    if old:
+        body = re.sub(rf"\b{re.escape(old)}\b", _first_name(new_name) or "there", body)
+    return body
+
+
+def candidate(conn, lead: dict, signature: str = "") -> Optional[dict]:
+    """
+    The best past sent reply for this lead, adapted, or None:
+    {"body", "draft_id", "lead_id", "score"}.
+    """
+    # Only a reply about a named listing is specific enough to hand to someone else
+    wanted = mentioned_listings(conn, dedup.lead_text(lead.get("subject"), lead.get("body_full") or lead.get("body_excerpt")))
+    if not wanted:
+        return None
+
+    # No signature (too short to compare, see dedup.MIN_SHINGLES) → no neighbours
+    similar = [s for s in dedup.similar_to_lead(conn, lead["id"], limit=CANDIDATES) if s["score"] >= REUSE_THRESHOLD]
+    if not similar:
+        return None
+
+    scores = {s["lead_id"]: s["score"] for s in similar}
+    cutoff = (datetime.datetime.utcnow() - datetime.timedelta(days=REUSE_MAX_AGE_DAYS)).isoformat() + "Z"
+    sent = conn.execute(f"""
+        SELECT d.id, d.lead_id, d.body, d.updated_at, l.name, l.subject, l.body_full, l.body_excerpt,
+               l.budget_monthly_usd, {', '.join('l.' + f for f in FACT_FIELDS)}
+        FROM drafts d JOIN leads l ON l.id = d.lead_id
+        WHERE d.lead_id IN ({','.join('?' * len(scores))}) AND d.status = 'sent' AND d.updated_at >= ?
+        ORDER BY d.updated_at DESC
+    """, [*scores, cutoff]).fetchall()
+    if not sent:
+        return None
+
+    for d in sorted(sent, key=lambda d: -scores[d["lead_id"]]):
+        if not same_facts(lead, dict(d)):
+            continue
+        if mentioned_listings(conn, dedup.lead_text(d["subject"], d["body_full"] or d["body_excerpt"])) != wanted:
+            continue
+        unchanged = conn.execute(f"""
+            SELECT COUNT(*) n FROM properties WHERE id IN ({','.join('?' * len(wanted))})
+            AND status = 'active' AND COALESCE(updated_at, created_at) <= ?
+        """, [*wanted, d["updated_at"]]).fetchone()["n"]
+        if unchanged != len(wanted):
+            continue
+        return {"body": adapt(d["body"], d["name"], lead.get("name"), signature),
+                "draft_id": d["id"], "lead_id": d["lead_id"], "score": scores[d["lead_id"]]}
+    return None
+
+
+def find(prepared: dict) -> Optional[dict]:
+    """candidate() for a prepare_draft() result, logged with its lookup time (draft_id filled by record())."""
+    start = time.perf_counter()
+    conn = get_conn()
+    try:
+        hit = candidate(conn, prepared["lead"], prepared.get("signature") or "")
+        ms = int((time.perf_counter() - start) * 1000)
+        cur = conn.execute("""
+            INSERT INTO draft_reuse (lead_id, source_draft_id, score, lookup_ms, created_at) VALUES (?,?,?,?,?)
+        """, (prepared["lead"]["id"], hit and hit["draft_id"], hit and hit["score"], ms,
+              datetime.datetime.utcnow().isoformat() + "Z"))
+        conn.commit()
+    finally:
+        conn.close()
+    if hit:
+        hit["log_id"] = cur.lastrowid
+        print(f"[reuse] Lead {prepared['lead']['id']}: reusing sent draft {hit['draft_id']} "
+              f"(score {hit['score']:.2f}, {ms}ms)")
+    return hit
+
+
+def record(hit: dict, draft_id: int):
+    conn = get_conn()
+    conn.execute("UPDATE draft_reuse SET draft_id=? WHERE id=?", (draft_id, hit["log_id"]))
+    conn.commit()
+    conn.close()
+
+
+def mark_regenerated(lead_id: int):
+    """The agent asked Claude instead — counts against the reuse."""
+    conn = get_conn()
+    conn.execute("UPDATE draft_reuse SET regenerated=1 WHERE lead_id=? AND draft_id IS NOT NULL", (lead_id,))
+    conn.commit()
+    conn.close()
+
+
+def stats(days: int = 30) -> dict:
+    """Reuse rate and the Claude time it saved over the last `days` days."""
+    since = (datetime.datetime.utcnow() - datetime.timedelta(days=days)).isoformat() + "Z"
+    conn = get_conn()
+    r = conn.execute("""
+        SELECT COUNT(*) lookups, COUNT(draft_id) reused, COALESCE(SUM(regenerated), 0) regenerated,
+               COALESCE(AVG(lookup_ms), 0) lookup_ms, COALESCE(SUM(lookup_ms), 0) lookup_total_ms
+        FROM draft_reuse WHERE created_at >= ?
+    """, (since,)).fetchone()
+    claude = conn.execute("""
+        SELECT COALESCE(SUM(calls), 0) calls, COALESCE(SUM(latency_ms), 0) latency_ms,
+               COALESCE(SUM(input_tokens + output_tokens), 0) tokens
+        FROM llm_usage_daily WHERE task IN ('draft_reply', 'draft_triage') AND day >= ?
+    """, (since[:10],)).fetchone()
+    conn.close()
+
+    per_call_ms = claude["latency_ms"] / claude["calls"] if claude["calls"] else 0
+    kept = r["reused"] - r["regenerated"]
+    return {
+        "days":            days,
+        "lookups":         r["lookups"],
+        "reused":          r["reused"],
+        "regenerated":     r["regenerated"],
+        "reuse_rate":      round(r["reused"] / r["lookups"], 3) if r["lookups"] else 0.0,
+        "lookup_ms_avg":   round(r["lookup_ms"], 1),
+        "claude_ms_avg":   round(per_call_ms),
+        # Kept reuses skipped a Claude call; every lookup, hit or miss, cost its lookup time
+        "saved_ms":        round(kept * per_call_ms - r["lookup_total_ms"]),
+        "saved_tokens":    round(kept * claude["tokens"] / claude["calls"]) if claude["calls"] else 0,
+    }
@@ -0,0 +1,125 @@
+"""
+summaries.py — Rolling per-thread summaries for bounded-size scan prompts.
+
+Thread scans (classify_thread, detect_confirmation) used to resend the last
+N raw messages, cut at a character cap, so long threads both cost more and
+lost their early context. Now a prompt gets:
+
+    summary of everything before the newest KEEP_RECENT messages
+    + those KEEP_RECENT messages, each fitted to RECENT_MSG_TOKENS
+
+The summary lives in thread_summaries and is folded forward incrementally:
+when messages age out of the recent window, only those are summarized into
+the stored text (one small "thread_summary" call, at most FOLD_BATCH
+messages each). A thread that hasn't grown costs nothing extra, and prompt
+size stays flat however long the thread gets. Agreed appointments are kept
+in the summary with absolute dates so an early "Saturday works" survives.
+Messages go in without their quoted history and signatures (prompting.py)
+— the summary already holds what they quote.
+"""
+
+import datetime
+
+from db import get_conn
+import llm
+import prompting
+
+KEEP_RECENT       = 3       # newest messages always sent verbatim
+RECENT_MSG_TOKENS = 300     # per-message budget for those (estimated tokens)
+FOLD_BATCH        = 4       # aged-out messages folded per summary call
+FOLD_MSG_TOKENS   = 375
+SUMMARY_MAX_TOKENS = 350
+
+SUMMARY_INSTRUCTIONS = """You maintain a running summary of a real estate email thread between an agent and a client.
+You are given the summary so far (may be empty) and the next messages in order. Return the updated summary only.
+
+Keep, with ABSOLUTE dates (resolve "Saturday" etc. from each message's Date header):
+- who the client is (name, partner), contact details given
+- properties / addresses discussed
+- every time proposed, by whom, and whether the client agreed, declined or countered
+- appointments agreed or cancelled
+- open questions and what the client is waiting on
+
+Plain text, at most 12 short lines. Drop pleasantries. Never invent details."""
+
+
+def _now() -> str:
+    return datetime.datetime.utcnow().isoformat() + "Z"
+
+
+def _fold(summary: str, messages: list[dict], opens_thread: bool = False) -> str:
+    prompt = f"""Summary so far:
+{summary or '(none)'}
+
+Next messages:
+""" + prompting.SEPARATOR.join(prompting.message_text(m, FOLD_MSG_TOKENS, keep_quoted=opens_thread and i == 0)
+                                for i, m in enumerate(messages))
+    return llm.complete("thread_summary", prompt, max_tokens=SUMMARY_MAX_TOKENS,
+                        system=llm.prefix(SUMMARY_INSTRUCTIONS))
+
+
+def rolling_summary(thread_id: str, older: list[dict]) -> str:
+    """
+    Summary of `older` (oldest-first), reusing the stored one and folding in
+    only messages it hasn't seen. Rebuilt from scratch if the stored cut-off
+    message is no longer in the thread.
+    """
+    if not older:
+        return ""
+    conn = get_conn()
+    row = conn.execute("SELECT summary, through_msg_id FROM thread_summaries WHERE thread_id=?",
+                       (thread_id,)).fetchone()
+    conn.close()
+
+    ids = [m.get("msg_id") for m in older]
+    summary, start = "", 0
+    if row and row["through_msg_id"] in ids:
+        summary, start = row["summary"], ids.index(row["through_msg_id"]) + 1
+    if start >= len(older):
+        return summary
+
+    for i in range(start, len(older), FOLD_BATCH):
+        summary = _fold(summary, older[i:i + FOLD_BATCH], opens_thread=i == 0)
+
+    conn = get_conn()
+    conn.execute("""
+        INSERT INTO thread_summaries (thread_id, summary, through_msg_id, msg_count, updated_at)
+        VALUES (?,?,?,?,?)
+        ON CONFLICT(thread_id) DO UPDATE SET summary=excluded.summary, through_msg_id=excluded.through_msg_id,
+                                             msg_count=excluded.msg_count, updated_at=excluded.updated_at
+    """, (thread_id, summary, ids[-1], len(older), _now()))
+    conn.commit()
+    conn.close()
+    print(f"[summary] Thread {thread_id}: folded {len(older) - start} message(s), {len(older)} summarized")
+    return summary
+
+
+def thread_prompt(thread_messages: list[dict], thread_id: str, keep_recent: int = KEEP_RECENT) -> str:
+    """
+    Thread text for a scan prompt: rolling summary of the older messages +
+    the newest `keep_recent` verbatim. If the summary can't be built (message
+    ids missing, call failed) only the recent messages are sent.
+    """
+    recent = thread_messages[-keep_recent:]
+    older  = thread_messages[:-keep_recent]
+    summary = ""
+    if older and all(m.get("msg_id") for m in older):
+        try:
+            summary = rolling_summary(thread_id, older)
+        except llm.DEFERRED:
+            raise
+        except Exception as e:
+            print(f"[summary] Thread {thread_id} summary failed: {e}")
+
+    # Without a summary the oldest recent message's quoted text is the only earlier context
+    recent_text = prompting.SEPARATOR.join(
+        prompting.message_text(m, RECENT_MSG_TOKENS, keep_quoted=not summary and i == 0)
+        for i, m in enumerate(recent))
+    if not summary:
+        return recent_text
+    return f"""Earlier in this thread ({len(older)} message(s), summarized):
+{summary}
+
+Latest messages:
+{recent_text}"""
+
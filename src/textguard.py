@@ -0,0 +1,186 @@
+"""
+textguard.py — Bounded-time text analysis for untrusted email bodies.
+
+Every regex that scans inbound mail lives here or goes through prepare()
+first. The guarantees:
+
+- prepare() truncates and normalizes input once: capped at MAX_CHARS,
+  control and zero-width characters dropped, runs of spaces collapsed,
+  3+ blank lines squeezed to one. Nothing downstream ever sees a 40 MB body
+  or a megabyte of whitespace.
+- Patterns are backtracking-safe: a repetition that can follow another
+  repetition over the same characters is bounded ({0,N}), and tag matchers
+  exclude '<' so an unterminated '<' can't rescan the rest of the document.
+- Budget measures per-message CPU time (time.thread_time, so waiting on
+  SQLite or other threads doesn't count). Optional stages are skipped once
+  a message has spent its budget, and slow messages are logged.
+
+scripts/fuzz_textguard.py throws pathological inputs at all of this and
+asserts worst-case timings.
+"""
+
+import os
+import re
+import time
+from typing import Optional
+
+MAX_CHARS         = int(os.getenv("TEXTGUARD_MAX_CHARS", "50000"))
+MAX_SUBJECT_CHARS = 1000
+MAX_HTML_CHARS    = MAX_CHARS * 4         # markup is mostly tags; strip first, then cap
+BUDGET_MS         = float(os.getenv("TEXTGUARD_BUDGET_MS", "250"))
+SLOW_MS           = float(os.getenv("TEXTGUARD_SLOW_MS", "100"))
+
+
+# ── Normalization ─────────────────────────────────────────────────────────────
+
+# C0/C1 controls (except \t \n), zero-width and bidi marks, BOM
+_DROP_CHARS = {c: None for c in [*range(0x00, 0x09), 0x0B, 0x0C, *range(0x0E, 0x20), 0x7F,
+                                 *range(0x80, 0xA0), 0x200B, 0x200C, 0x200D, 0x200E, 0x200F,
+                                 0x2060, 0xFEFF, *range(0x202A, 0x202F)]}
+_DROP_CHARS[0xA0] = " "   # nbsp
+
+_HSPACE_RE     = re.compile(r"[ \t]+")
+_TRAIL_SPACE_RE = re.compile(r" ?\n ?")
+_BLANK_RUN_RE  = re.compile(r"\n{3,}")
+
+
+def prepare(text: Optional[str], limit: int = MAX_CHARS) -> str:
+    """Truncate + normalize untrusted text. Linear time; safe to call twice."""
+    if not text:
+        return ""
+    text = text[:limit * 2]  # normalization only shrinks; don't translate megabytes we'll drop
+    text = text.replace("\r\n", "\n").replace("\r", "\n").translate(_DROP_CHARS)
+    text = _HSPACE_RE.sub(" ", text)
+    text = _TRAIL_SPACE_RE.sub("\n", text)
+    text = _BLANK_RUN_RE.sub("\n\n", text)
+    return text[:limit].strip()
+
+
+def prepare_subject(subject: Optional[str]) -> str:
+    return " ".join(prepare(subject, MAX_SUBJECT_CHARS).split())
+
+
+# Where a reply's own text ends: "On Mon, Mar 2, 2026 at 9:14 AM Jane <j@x.com> wrote:",
+# Outlook's "-----Original Message-----" or a "From: ..." line followed by
+# Sent: / Date: / To: / Subject: — a lone "From: Jane Doe" in a portal lead isn't a quote
+_QUOTE_HEADER_RE = re.compile(
+    r"^(?:on\s[^\n]{0,300}(?:\n[^\n]{0,200})?wrote:|-{2,10}\s{0,3}original message\s{0,3}-{2,10}"
+    r"|from:\s[^\n]{0,300}\n(?:sent|date|to|subject):[^\n]{0,300})$",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def split_quoted(text: Optional[str]) -> tuple[str, str]:
+    """(new text of a reply, the history it quotes) — split at the quote header and on '>' lines."""
+    text = prepare(text)
+    m = _QUOTE_HEADER_RE.search(text)
+    head, tail = (text[:m.start()], text[m.start():]) if m and m.start() > 0 else (text, "")
+    lines = head.split("\n")
+    own    = "\n".join(l for l in lines if not l.startswith(">")).strip()
+    quoted = "\n".join([l for l in lines if l.startswith(">")] + [tail]).strip()
+    return own, quoted
+
+
+def strip_quoted(text: Optional[str]) -> str:
+    """The new text of a reply: cut at the quote header, drop '>' lines."""
+    return split_quoted(text)[0]
+
+
+# Where a message's sign-off block starts: the "-- " delimiter, a mobile
+# footer (only within the last few lines — "Sent via Zillow" can head a
+# portal lead), or a legal disclaimer
+_SIGNATURE_RE = re.compile(
+    r"^(?:-- ?|—|_{2,40}|(?:sent from my|get outlook for|sent via) [^\n]{0,60}(?=(?:\n[^\n]{0,80}){0,3}\Z)"
+    r"|(?:confidentiality|privacy) notice\b[^\n]{0,300}|this (?:e-?mail|message) (?:and any attachments )?"
+    r"(?:is|may be) (?:confidential|privileged)[^\n]{0,300})$",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+
+def strip_signature(text: Optional[str]) -> str:
+    """Text above the signature delimiter / mobile footer / disclaimer (all of it if that's all there is)."""
+    text = prepare(text)
+    m = _SIGNATURE_RE.search(text)
+    return text[:m.start()].rstrip() if m and m.start() > 0 else text
+
+
+# ── HTML ──────────────────────────────────────────────────────────────────────
+
+_BR_RE        = re.compile(r"<br\s{0,8}/?>", re.IGNORECASE)
+_BLOCK_TAG_RE = re.compile(r"</?(?:p|div|li|tr)[^<>]*>", re.IGNORECASE)
+_TAG_RE       = re.compile(r"<[^<>]*>")
+_ENTITIES     = [("&amp;", "&"), ("&lt;", "<"), ("&gt;", ">"),
+                 ("&nbsp;", " "), ("&#39;", "'"), ("&quot;", '"')]
+
+
+def strip_tags(html: str) -> str:
+    """HTML → plain text. Capped at MAX_HTML_CHARS of input."""
+    text = _BR_RE.sub("\n", html[:MAX_HTML_CHARS])
+    text = _BLOCK_TAG_RE.sub("\n", text)
+    text = _TAG_RE.sub("", text)
+    for entity, char in _ENTITIES:
+        text = text.replace(entity, char)
+    return _BLANK_RUN_RE.sub("\n\n", text).strip()
+
+
+# ── Patterns ──────────────────────────────────────────────────────────────────
+
+_WEEKDAYS = r"monday|tuesday|wednesday|thursday|friday|saturday|sunday"
+
+# "$3,800/month", "3800 per month", "$2,500/mo". The lookbehind stops a
+# match from starting mid-number ("4000/month" used to read as 000).
+BUDGET_RE = re.compile(
+    r"\$?\s{0,3}(?<![\d,])([0-9]{1,3}(?:,[0-9]{3}){1,3}|[0-9]{1,6})"
+    r"(?:\s{0,3}/\s{0,3}month|\s{0,3}per\s{1,3}month|/mo\b|/month\b)",
+    re.IGNORECASE,
+)
+
+# Any time-of-day or day/month name — used to scrub AI prose of stray times
+TIME_RE = re.compile(rf"\b(\d{{1,2}}(:\d{{2}})?\s{{0,2}}(am|pm)|({_WEEKDAYS}|january|february|march|april|"
+                     rf"may|june|july|august|september|october|november|december))\b", re.IGNORECASE)
+
+
+def find_budget(text: str) -> Optional[int]:
+    m = BUDGET_RE.search(text or "")
+    return int(m.group(1).replace(",", "")) if m else None
+
+
+# ── CPU budget ────────────────────────────────────────────────────────────────
+
+class Budget:
+    """
+    Per-message CPU budget. Wrap one message's analysis:
+
+        with Budget(msg_id) as b:
+            ...required stages...
+            if not b.exceeded():
+                ...optional stages...
+    """
+
+    def __init__(self, label: str, limit_ms: float = None):
+        self.label    = label
+        self.limit_ms = BUDGET_MS if limit_ms is None else limit_ms
+        self.start    = None
+        self.skipped  = []
+
+    def __enter__(self):
+        self.start = time.thread_time()
+        return self
+
+    @property
+    def elapsed_ms(self) -> float:
+        return (time.thread_time() - self.start) * 1000
+
+    def exceeded(self, stage: str = None) -> bool:
+        """True once the budget is spent. Pass the stage name to record a skip."""
+        over = self.elapsed_ms > self.limit_ms
+        if over and stage:
+            self.skipped.append(stage)
+        return over
+
+    def __exit__(self, *exc):
+        ms = self.elapsed_ms
+        if ms > SLOW_MS or self.skipped:
+            skipped = f", skipped {', '.join(self.skipped)}" if self.skipped else ""
+            print(f"[textguard] Slow message {self.label!r}: {ms:.0f} ms CPU{skipped}")
+        return False
@@ -0,0 +1,271 @@
+"""
+timeparse.py — Deterministic date/time resolution for email text.
+
+Turns "March 10 at 2pm", "3/10 at 10am", "this Saturday at 2:30",
+"tomorrow at noon" into concrete naive datetimes in the agent's timezone
+(the same convention as appointments.proposed_datetime), resolved against a
+reference time — normally the Date header of the message the text came
+from, so "Saturday" in an email sent last Thursday means that week's
+Saturday, not the one after today.
+
+Each candidate carries a confidence:
+
+  high    explicit date, or weekday/today/tomorrow, with a time that has
+          am/pm or minutes, or a bare "at 3" in unambiguous business hours
+  medium  "next Saturday", a weekday that disagrees with the date next to
+          it, a bare weekday that falls on the reference day itself (read
+          as a week later), a yearless date that already passed (rolled to
+          next year), or a bare 7 or 8 o'clock
+
+ai.py uses high-confidence candidates to settle short "Saturday at 2 works"
+replies without calling Claude, and passes the rest to Claude as hints.
+Input goes through textguard.prepare and every pattern is bounded, like the
+rest of the inbound text pipeline.
+"""
+
+import datetime
+import email.utils
+import re
+from typing import Optional
+
+import textguard
+
+MAX_PARSE_CHARS = 4000     # dates live in the first lines of a reply
+MAX_CANDIDATES  = 12
+
+_DOW    = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+_MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+
+_WD   = "|".join(_DOW)
+_MON  = (r"jan(?:uary)?|feb(?:ruary)?|mar(?:ch)?|apr(?:il)?|may|june?|july?|aug(?:ust)?|"
+         r"sep(?:t(?:ember)?)?|oct(?:ober)?|nov(?:ember)?|dec(?:ember)?")
+_WD_PREFIX = rf"(?:(?:this\s{{1,3}}|next\s{{1,3}})?(?P<wd>{_WD})[,\s]{{1,3}})?"
+
+# Date anchors. Each may carry a weekday in front ("Tuesday, March 10") —
+# it is checked against the date, not used to compute it.
+_MONTH_DAY_RE = re.compile(
+    rf"\b{_WD_PREFIX}(?:the\s{{1,3}})?(?P<mon>{_MON})\b\.?\s{{1,3}}(?P<day>\d{{1,2}})(?:st|nd|rd|th)?\b"
+    rf"(?:,?\s{{1,3}}(?P<year>20\d\d)\b)?",
+    re.IGNORECASE,
+)
+_NUMERIC_RE = re.compile(
+    rf"\b{_WD_PREFIX}(?P<m>\d{{1,2}})/(?P<d>\d{{1,2}})(?:/(?P<y>\d{{4}}|\d{{2}}))?(?![\d/])",
+    re.IGNORECASE,
+)
+_WEEKDAY_RE = re.compile(
+    rf"\b(?:(?P<mod>this\s{{1,3}}coming|this|next|coming)\s{{1,3}})?(?P<wd>{_WD})\b",
+    re.IGNORECASE,
+)
+_RELATIVE_RE = re.compile(r"\b(?P<rel>today|tonight|tomorrow|tmrw)\b", re.IGNORECASE)
+
+# A time right after a date ("March 10 at 2pm", "Saturday, 2:30") or right
+# before one ("2pm on Saturday"). A bare number only counts after at/@.
+_TIME_BODY = (r"(?:(?P<h>\d{1,2})(?::(?P<mi>[0-5]\d))?\s{0,2}(?P<ap>[ap]\.?m\b\.?)?"
+              r"|(?P<noon>noon|midday))")
+_TIME_AFTER_RE  = re.compile(rf"[,\s]{{0,3}}(?:(?P<at>at|@|around|by)\s{{0,3}})?{_TIME_BODY}", re.IGNORECASE)
+_TIME_BEFORE_RE = re.compile(rf"{_TIME_BODY}\s{{0,3}}(?:on\s{{1,3}})?$", re.IGNORECASE)
+# Times with no date at all ("2pm works") — ai.py matches them to a proposal
+_TIME_ONLY_RE   = re.compile(rf"(?:\b(?P<at>at|@)\s{{0,3}})?\b{_TIME_BODY}", re.IGNORECASE)
+
+
+# ── Reference time ────────────────────────────────────────────────────────────
+
+def _zone(tz_name: Optional[str]):
+    try:
+        from zoneinfo import ZoneInfo
+        return ZoneInfo(tz_name) if tz_name else None
+    except Exception:
+        print(f"[timeparse] Unknown timezone {tz_name!r} — using server local time")
+        return None
+
+
+def now(tz_name: Optional[str] = None) -> datetime.datetime:
+    """Current wall-clock time in the agent's timezone (naive)."""
+    zone = _zone(tz_name)
+    return datetime.datetime.now(zone).replace(tzinfo=None) if zone else datetime.datetime.now()
+
+
+def reference(date_header: Optional[str], tz_name: Optional[str] = None) -> datetime.datetime:
+    """A message's Date header as naive agent-local time; now() if missing or unparseable."""
+    try:
+        sent = email.utils.parsedate_to_datetime(date_header) if date_header else None
+    except (TypeError, ValueError, IndexError):
+        sent = None
+    if sent is None:
+        return now(tz_name)
+    zone = _zone(tz_name)
+    if sent.tzinfo is None or zone is None:
+        return sent.replace(tzinfo=None)
+    return sent.astimezone(zone).replace(tzinfo=None)
+
+
+# ── Parsing ───────────────────────────────────────────────────────────────────
+
+def _time_of(m: re.Match, bare_ok: bool, tonight: bool = False) -> Optional[tuple[int, int, bool]]:
+    """(hour, minute, certain) from a _TIME_BODY match, or None if it isn't a time."""
+    if m.group("noon"):
+        return 12, 0, True
+    h, mi, ap = int(m.group("h")), int(m.group("mi") or 0), (m.group("ap") or "").lower()
+    if ap:
+        if not 1 <= h <= 12:
+            return None
+        if ap.startswith("p") and h != 12:
+            h += 12
+        elif ap.startswith("a") and h == 12:
+            h = 0
+        return h, mi, True
+    if h > 23 or not (m.group("mi") or bare_ok):
+        return None                          # "March 10 2 bedrooms" — not a time
+    if h >= 12 or h == 0:
+        return h, mi, True                   # noon / 24-hour clock
+    # No am/pm: showings happen in business hours
+    if tonight or h <= 7:
+        return h + 12, mi, tonight or h != 7
+    return h, mi, h != 8
+
+
+def _time_near(text: str, start: int, end: int, tonight: bool) -> tuple[Optional[tuple], int, int]:
+    """Time adjacent to the date at text[start:end]. Returns (time, span start, span end)."""
+    after = _TIME_AFTER_RE.match(text, end)
+    if after and (after.group("h") or after.group("noon")):
+        t = _time_of(after, bare_ok=bool(after.group("at")), tonight=tonight)
+        if t:
+            return t, start, after.end()
+    window = max(0, start - 16)
+    before = _TIME_BEFORE_RE.search(text[window:start])
+    if before and (before.group("ap") or before.group("mi") or before.group("noon")):
+        t = _time_of(before, bare_ok=False, tonight=tonight)
+        if t:
+            return t, window + before.start(), end
+    return None, start, end
+
+
+def _weekday_date(ref: datetime.date, dow: int, mod: str) -> tuple[datetime.date, bool]:
+    """(date, certain) for a weekday name relative to ref."""
+    ahead = (dow - ref.weekday()) % 7
+    mod = " ".join(mod.lower().split())
+    if mod in ("this", "this coming", "coming"):
+        return ref + datetime.timedelta(days=ahead), True
+    if ahead == 0:
+        return ref + datetime.timedelta(days=7), False   # "Saturday" said on a Saturday
+    return ref + datetime.timedelta(days=ahead), mod != "next"
+
+
+def _date_of(m: re.Match, kind: str, ref: datetime.date) -> Optional[tuple[datetime.date, bool]]:
+    if kind == "relative":
+        rel = m.group("rel").lower()
+        return ref + datetime.timedelta(days=0 if rel in ("today", "tonight") else 1), True
+    if kind == "weekday":
+        return _weekday_date(ref, _DOW.index(m.group("wd").lower()), m.group("mod") or "")
+
+    if kind == "month_day":
+        if m.group("mon") == "may":
+            return None                      # "we may 2 ..." — the verb, not the month
+        month, day, year = _MONTHS.index(m.group("mon").lower()[:3]) + 1, int(m.group("day")), m.group("year")
+    else:
+        month, day, year = int(m.group("m")), int(m.group("d")), m.group("y")
+    certain = True
+    try:
+        if year:
+            year = int(year) + (2000 if len(year) == 2 else 0)
+            date = datetime.date(year, month, day)
+        else:
+            date = datetime.date(ref.year, month, day)
+            if date < ref - datetime.timedelta(days=1):
+                date, certain = datetime.date(ref.year + 1, month, day), False
+    except ValueError:
+        return None                          # 2/30, 13/4, "Sep 31"
+    if m.group("wd") and _DOW.index(m.group("wd").lower()) != date.weekday():
+        certain = False                      # "Saturday, March 10" but March 10 is a Tuesday
+    return date, certain
+
+
+def format_text(date: datetime.date, time: Optional[tuple] = None) -> str:
+    """"Saturday, March 7 at 2:00 PM" — same wording as _resolve_day_reference."""
+    if time is None:
+        return date.strftime("%A, %B %-d")
+    dt = datetime.datetime(date.year, date.month, date.day, time[0], time[1])
+    return f"{dt.strftime('%A, %B %-d')} at {dt.strftime('%-I:%M %p')}"
+
+
+def parse(text: str, ref: Optional[datetime.datetime] = None) -> list[dict]:
+    """
+    Every date reference in text, in order of appearance:
+
+        {"span": "this Saturday at 2:30", "date": date, "time": (14, 30) | None,
+         "datetime": "2026-03-07T14:30:00" | None,   # only when both are known
+         "date_text": "Saturday, March 7 at 2:30 PM",
+         "confidence": "high" | "medium"}
+    """
+    text = textguard.prepare(text, MAX_PARSE_CHARS).replace("’", "'")
+    if not text:
+        return []
+    ref_date = (ref or datetime.datetime.now()).date()
+
+    found = []   # (start, end, kind, match)
+    for kind, rx in (("month_day", _MONTH_DAY_RE), ("numeric", _NUMERIC_RE),
+                     ("weekday", _WEEKDAY_RE), ("relative", _RELATIVE_RE)):
+        found += [(m.start(), m.end(), kind, m) for m in rx.finditer(text)]
+    # Longest match wins where anchors overlap ("Tuesday, March 10" beats "Tuesday")
+    found.sort(key=lambda f: (f[0], f[0] - f[1]))
+
+    out, taken_to = [], -1
+    for start, end, kind, m in found:
+        if start < taken_to:
+            continue
+        resolved = _date_of(m, kind, ref_date)
+        if not resolved:
+            continue
+        date, certain = resolved
+        tonight = kind == "relative" and m.group("rel").lower() == "tonight"
+        t, start, end = _time_near(text, start, end, tonight)
+        taken_to = end
+        if t:
+            certain = certain and t[2]
+        iso = (datetime.datetime(date.year, date.month, date.day, t[0], t[1]).isoformat() if t else None)
+        out.append({
+            "span": text[start:end].strip(" ,."), "date": date, "time": t[:2] if t else None,
+            "datetime": iso, "date_text": format_text(date, t),
+            "confidence": "high" if certain else "medium",
+        })
+        if len(out) >= MAX_CANDIDATES:
+            break
+    return out
+
+
+def times(text: str) -> list[tuple[int, int]]:
+    """Clock times with no date attached ("2pm works", "at 10:30")."""
+    text = textguard.prepare(text, MAX_PARSE_CHARS)
+    out = []
+    for m in _TIME_ONLY_RE.finditer(text):
+        if not (m.group("h") or m.group("noon")):
+            continue
+        t = _time_of(m, bare_ok=bool(m.group("at")))
+        if t:
+            out.append(t[:2])
+        if len(out) >= MAX_CANDIDATES:
+            break
+    return out
+
+
+# ── Replies ───────────────────────────────────────────────────────────────────
+
+_AFFIRM_RE = re.compile(
+    r"\b(?:works?|sounds\s{1,3}(?:good|great|perfect)|see\s{1,3}you|confirm(?:ed)?|perfect|"
+    r"(?:i|we)'?ll\s{1,3}be\s{1,3}there|yes|yep|yeah|sure|that'?s\s{1,3}fine|fine\s{1,3}by|"
+    r"count\s{1,3}(?:me|us)\s{1,3}in|looking\s{1,3}forward)\b",
+    re.IGNORECASE,
+)
+# Anything that turns agreement into a counter, condition or question
+_HEDGE_RE = re.compile(
+    r"\?|n'?t\b|\b(?:not|no|cannot|unable|instead|unfortunately|reschedul\w*|cancel\w*|postpone\w*|"
+    r"how\s{1,3}about|what\s{1,3}about|rather|either|or|if|maybe|might|later|earlier|except|"
+    r"but|though|although|however|only|prefer\w*|unless|besides|away|busy)\b",
+    re.IGNORECASE,
+)
+
+
+def is_plain_yes(text: str) -> bool:
+    """Short text that agrees to something and doesn't hedge, counter or ask."""
+    text = textguard.prepare(text, MAX_PARSE_CHARS).replace("’", "'")
+    return bool(_AFFIRM_RE.search(text)) and not _HEDGE_RE.search(text)